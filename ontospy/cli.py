@@ -111,8 +111,17 @@ Ontospy is a command line inspector for RDF/OWL models. Use --help option with o
     '-e',
     is_flag=True,
     help='Use to specify that the source url passed is a sparql endpoint')
+@click.option(
+    '--nocache',
+    is_flag=True,
+    help='With sparql endpoints, ignore the query results saved in the local cache and fetch them again')
+@click.option(
+    '--budget',
+    type=float,
+    default=None,
+    help='Max number of seconds spent querying the source: once over, a partial model is printed out')
 @click.pass_context
-def scan(ctx, sources=None, endpoint=False):
+def scan(ctx, sources=None, endpoint=False, nocache=False, budget=None):
     """Search an RDF source for ontology entities and print out a report.
     """
     verbose = ctx.obj['VERBOSE']
@@ -121,7 +130,7 @@ def scan(ctx, sources=None, endpoint=False):
         'labels': verbose,
     }
     if sources or (sources and endpoint):
-        action_analyze(sources, endpoint)
+        action_analyze(sources, endpoint, print_opts, verbose, cache=not nocache, budget=budget)
         eTime = time.time()
         tTime = eTime - sTime
         printDebug("\n-----------\n" + "Time:	   %0.2fs" % tTime, "comment")
@@ -148,6 +157,24 @@ def scan(ctx, sources=None, endpoint=False):
     help=
     'CACHE: force reset the cache folder for the local library (used to clean up old files and speed up loading of ontologies).'
 )
+@click.option(
+    '--cache-stats',
+    is_flag=True,
+    help=
+    'CACHE-STATS: print out a report about the cache folder (size, budget, least recently used models and stale items that can be removed).'
+)
+@click.option(
+    '--cache-gc',
+    is_flag=True,
+    help=
+    'CACHE-GC: clean up the cache folder: remove the folders of other ontospy versions, orphaned items and stale lock files, then the least recently used models till the cache fits its budget.'
+)
+@click.option(
+    '--cache-budget',
+    is_flag=True,
+    help=
+    'CACHE-BUDGET: set the max size in bytes of the cache folder. A valid number must be passed as argument. Least recently used models are removed when the cache grows over it.'
+)
 @click.option(
     '--reveal',
     '-r',
@@ -175,6 +202,9 @@ def library(ctx,
             filepath=None,
             bootstrap=False,
             cache=False,
+            cache_stats=False,
+            cache_gc=False,
+            cache_budget=False,
             reveal=False,
             save=False,
             directory=False):
@@ -196,6 +226,22 @@ def library(ctx,
     elif cache:
         action_cache_reset()
 
+    elif cache_stats:
+        action_cache_stats()
+
+    elif cache_gc:
+        action_cache_gc()
+
+    elif cache_budget:
+        output = action_update_cache_budget(filepath[0]) if filepath else None
+        if output is not None:
+            printDebug("----------\n" + "New cache budget: %s" % sizeof_fmt(output),
+                       "important")
+        else:
+            printDebug("Please specify the max size of the cache folder in bytes.",
+                       'important')
+            printDebug("E.g. 'ontospy library --cache-budget 1000000000'", 'tip')
+
     elif directory:
         if not filepath:
             printDebug("Please specify a new directory for the local library.",
@@ -57,9 +57,17 @@ _dirname, _filename = os.path.split(os.path.abspath(__file__))
 ONTOSPY_LOCAL = os.path.join(os.path.expanduser('~'), '.ontospy')
 ONTOSPY_LOCAL_CACHE = ONTOSPY_LOCAL + "/.cache/" + VERSION
 ONTOSPY_LOCAL_CACHE_TOP = ONTOSPY_LOCAL + "/.cache/"
+# results of sparql endpoints queries (see sparqlHelper.QueryCache): within the
+# version folder, as cache_gc removes the others
+ONTOSPY_SPARQL_CACHE = ONTOSPY_LOCAL_CACHE + "/sparql"
 
 ONTOSPY_LIBRARY_DEFAULT = ONTOSPY_LOCAL + "/models/"
 
+# max size in bytes of the cache folder (can be changed in config.ini, section 'cache')
+ONTOSPY_CACHE_MAX_SIZE_DEFAULT = 500 * 1024 * 1024
+# max size in bytes of the models kept in memory (config.ini, section 'cache', option 'memory_max_size')
+ONTOSPY_MEMORY_CACHE_MAX_SIZE_DEFAULT = 256 * 1024 * 1024
+
 BOOTSTRAP_ONTOLOGIES = [
     "http://xmlns.com/foaf/spec/",
     "http://purl.org/dc/terms/",
@@ -48,6 +48,7 @@ except NameError:
 
 from . import *
 from .ontospy import Ontospy
+from .sparqlHelper import QueryCache
 from .utils import *
 from .manager import *
 
@@ -62,25 +63,45 @@ from .manager import *
 # ===========
 
 
-def action_analyze(sources, endpoint=None):
+def action_analyze(sources, endpoint=None, print_opts=False, verbose=False, cache=True, budget=None):
     """
     Load up a model into ontospy and analyze it
+
+    With endpoints, query results are cached in the local cache folder
+    unless <cache> is False (results are then always fetched again).
+    <budget>: max seconds spent querying; the model printed out may then be partial
     """
     for x in sources:
         click.secho("Parsing %s..." % str(x), fg='white')
 
     if endpoint:
-        g = Ontospy(sparql_endpoint=sources[0], verbose=verbose)
+        query_cache = QueryCache(ONTOSPY_SPARQL_CACHE)
+        g = Ontospy(sparql_endpoint=sources[0], verbose=verbose, query_cache=query_cache,
+                    budget_seconds=budget)
+        g.sparqlHelper.bypass_cache = not cache
         printDebug("Extracting classes info")
         g.build_classes()
         printDebug("..done")
         printDebug("Extracting properties info")
         g.build_properties()
         printDebug("..done")
+        if verbose:
+            printDebug("Query cache: %(hits)d hits, %(misses)d misses" % query_cache.stats(), "comment")
     else:
-        g = Ontospy(uri_or_path=sources, verbose=verbose)
+        g = Ontospy(uri_or_path=sources, verbose=verbose, budget_seconds=budget)
 
     shellPrintOverview(g, print_opts)
+    if not g.is_complete():
+        printDebug("\nTime budget of %ss used up: the model is partial" % budget, "important")
+        for phase, report in sorted(g.completeness.items()):
+            if report['complete']:
+                continue
+            msg = "%s: %d found" % (phase, report['found'])
+            if not report['listed']:
+                msg += ", more not listed"
+            if report['skipped']:
+                msg += ", %d not described" % len(report['skipped'])
+            printDebug(msg, "comment")
 
 
 def action_reveal_library():
@@ -183,6 +204,7 @@ def _print_table_ontologies():
     list all local files
     2015-10-18: removed 'cached' from report
     2016-06-17: made a subroutine of action_listlocal()
+    2026-10-19: added models statistics, saved when models get cached (no graph is loaded)
     """
     ontologies = get_localontologies()
     ONTOSPY_LOCAL_MODELS = get_home_location()
@@ -191,9 +213,10 @@ def _print_table_ontologies():
         print("")
         temp = []
         from collections import namedtuple
-        Row = namedtuple('Row',['N','Added', 'File'])
+        Row = namedtuple('Row',['N','Added', 'Classes', 'Props', 'Concepts', 'Shapes', 'Triples', 'Parse', 'Size', 'File'])
         # Row = namedtuple('Row',['N','Added','Cached', 'File'])
         counter = 0
+        index = get_library_index()
         for file in ontologies:
             counter += 1
             _counter = str(counter)
@@ -203,10 +226,20 @@ def _print_table_ontologies():
                 mtime = os.path.getmtime(ONTOSPY_LOCAL_MODELS + "/" + file)
             except OSError:
                 mtime = 0
-            last_modified_date = str(datetime.datetime.fromtimestamp(mtime))
+            last_modified_date = str(datetime.datetime.fromtimestamp(int(mtime)))
 
             # cached = str(os.path.exists(ONTOSPY_LOCAL_CACHE + "/" + file + ".pickle"))
-            temp += [Row(_counter,last_modified_date, name)]
+            stats = get_ontology_stats(file, index=index)
+            if stats:
+                parse_time = "%0.2fs" % stats['parse_time'] if stats.get('parse_time') is not None else "-"
+                triples = str(stats['triples']) if stats.get('triples') is not None else "n/a"
+                temp += [Row(_counter, last_modified_date, str(stats['classes']), str(stats['properties']),
+                             str(stats['concepts']), str(stats['shapes']), triples,
+                             parse_time, sizeof_fmt(stats['size']), name)]
+            else:
+                # not cached yet
+                temp += [Row(_counter, last_modified_date, "-", "-", "-", "-", "-", "-", "-", name)]
+        flush_library_index(index)  # files hashed for the first time
         pprinttable(temp)
         print("")
     return
@@ -218,6 +251,9 @@ def _print_table_ontologies():
 def action_import(location, verbose=True):
     """
     Import files into the local repo
+    2026-10-19: the library is content-addressed (see add_to_library): re-importing
+        unchanged contents is a no-op, and contents already saved under another
+        name share its cached model instead of being parsed and cached again
     """
 
     location = str(location) # prevent errors from unicode being passed
@@ -239,28 +275,36 @@ def action_import(location, verbose=True):
             filename = location.replace("http://", "").replace("/", "_")
             if not filename.lower().endswith(('.rdf', '.owl', '.rdfs', '.ttl', '.n3')):
                 filename = filename + ".rdf"
-            fullpath = ONTOSPY_LOCAL_MODELS + "/" + filename # 2016-04-08
-            # fullpath = ONTOSPY_LOCAL_MODELS + filename
-
-            # print("==DEBUG", final_location, "**", filename,"**", fullpath)
-
-            file_ = open(fullpath, 'w')
-            file_.write(res.read())
-            file_.close()
+            data = res.read()
         else:
             if os.path.isfile(location):
                 filename = location.split("/")[-1] or location.split("/")[-2]
-                fullpath = ONTOSPY_LOCAL_MODELS + "/" + filename
-                shutil.copy(location, fullpath)
+                with open(location, 'rb') as f:
+                    data = f.read()
             else:
                 raise ValueError('The location specified is not a file.')
+
+        # print("==DEBUG", final_location, "**", filename,"**", fullpath)
+        status, sha = add_to_library(filename, data)
+        if status == 'new':
+            fullpath = ONTOSPY_LOCAL_MODELS + "/" + filename # 2016-04-08
         # print("Saved local copy")
     except:
         printDebug("Error retrieving file. Please make sure <%s> is a valid location." % location, "important")
-        if os.path.exists(fullpath):
-            os.remove(fullpath)
         return None
 
+    if status != 'new':
+        if status == 'unchanged':
+            printDebug("<%s> is already in the local library and has not changed." % filename, "comment")
+        else:
+            aliases = [x for x in get_library_aliases(sha) if x != filename]
+            printDebug("Same contents as <%s>: using its cached model." % ", ".join(aliases), "comment")
+        g = get_pickled_ontology(filename)
+        if not g:
+            g = do_pickle_ontology(filename)
+        printDebug("----------\n...completed!", "important")
+        return g
+
     try:
         g = Ontospy(fullpath, verbose=verbose)
         # printDebug("----------")
@@ -548,6 +592,87 @@ def action_cache_reset():
 
 
 
+def action_cache_stats():
+    """
+    Print out a report about the cache folder: size, budget, items and
+    what could be reclaimed (orphaned items and folders from other ontospy versions)
+    """
+    stats = get_cache_stats()
+    printDebug("Cache location: '%s'" % stats['location'], "comment")
+    printDebug("----------")
+    printDebug("Size..............: %s (budget: %s)" % (sizeof_fmt(stats['size']), sizeof_fmt(stats['budget'])))
+    printDebug("Cached models.....: %d" % stats['items'])
+    printDebug("Orphaned items....: %d (%s)" % (stats['orphans'], sizeof_fmt(stats['orphans_size'])))
+    printDebug("Other versions....: %d (%s)" % (stats['versions'], sizeof_fmt(stats['versions_size'])))
+    if stats['orphans'] or stats['versions']:
+        printDebug("Tip: run 'ontospy library --cache-gc' to remove them", "tip")
+
+    if stats['entries']:
+        print("")
+        from collections import namedtuple
+        Row = namedtuple('Row', ['N', 'Last_used', 'Size', 'File'])
+        temp = []
+        counter = 0
+        # items are cached by content: show the names of the related files
+        names = {}
+        index = get_library_index()
+        for name in get_localontologies():
+            names.setdefault(get_content_hash(name, index=index), []).append(name)
+        flush_library_index(index)
+        # most recently used first
+        for entry in reversed(stats['entries']):
+            counter += 1
+            last_used = str(datetime.datetime.fromtimestamp(int(entry['atime'])))
+            files = ", ".join(names.get(entry['name'], [])) or entry['name'][:12] + ".. (orphan)"
+            temp += [Row(str(counter), last_used, sizeof_fmt(entry['size']), files)]
+        pprinttable(temp)
+        print("")
+    return stats
+
+
+def action_update_cache_budget(_max_size):
+    """
+    Sets the max size in bytes of the cache folder, then evicts the least
+    recently used items if needed
+    """
+    try:
+        _max_size = int(_max_size)
+    except (TypeError, ValueError):
+        return None
+    if _max_size < 0:
+        return None
+
+    config = SafeConfigParser()
+    config_filename = ONTOSPY_LOCAL + '/config.ini'
+    config.read(config_filename)
+    if not config.has_section('cache'):
+        config.add_section('cache')
+    config.set('cache', 'max_size', str(_max_size))
+    with open(config_filename, 'w') as f:
+        config.write(f)
+
+    enforce_cache_budget(max_size=_max_size)
+    return _max_size
+
+
+def action_cache_gc():
+    """
+    Clean up the cache folder: remove the folders of other ontospy versions,
+    the items of models not in the local library anymore, stale lock files,
+    then the least recently used items till the cache fits its budget
+    """
+    report = cache_gc()
+    printDebug("Other versions....: %d" % len(report['versions']))
+    printDebug("Orphaned items....: %d" % len(report['orphans']))
+    printDebug("Evicted items.....: %d" % len(report['evicted']))
+    printDebug("Stale locks.......: %d" % report['locks'])
+    printDebug("----------\n" + "Freed: %s" % sizeof_fmt(report['freed']), "important")
+    return report
+
+
+
+
+
 def actions_delete():
     """
     DEPRECATED (v 1.9.4)
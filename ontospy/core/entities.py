@@ -14,6 +14,54 @@ from . import *
 from .utils import *
 
 
+# predicates holding the names of an entity, see RDF_Entity.labels
+LABEL_PREDICATES = [
+    rdflib.RDFS.label,
+    rdflib.namespace.SKOS.prefLabel,
+    rdflib.namespace.SKOS.altLabel,
+    rdflib.namespace.Namespace("http://www.geneontology.org/formats/oboInOwl#").hasSynonym,
+    rdflib.namespace.Namespace("http://id.nlm.nih.gov/mesh/vocab#").casn1_label,
+]
+
+# predicates holding a description, in order of preference, see RDF_Entity.bestDescription
+DESCRIPTION_PREDICATES = [
+    rdflib.RDFS.comment,
+    rdflib.namespace.DCTERMS.description,
+    rdflib.namespace.DC.description,
+    rdflib.namespace.SKOS.definition,
+    rdflib.namespace.Namespace("http://purl.obolibrary.org/obo/").IAO_0000115,
+]
+
+
+def _textValue(term):
+    """ the python value of a label (literals) or its string """
+    if isinstance(term, rdflib.Literal) and term.value is not None:
+        return term.value
+    return "%s" % term
+
+
+class IndexedEntities(object):
+    """
+    An attribute holding a list of entities, eg OntoProperty.domains. Once Ontospy has
+    indexed these links as a TermRelation (see terms.py), the list is dropped, and the
+    entities are read from the relation kept in the attribute <relation>, as a tuple.
+    <inverse>: read the inverse relation, eg OntoClass.domain_of
+    """
+
+    def __init__(self, relation, inverse=False):
+        self.relation = relation
+        self.inverse = inverse
+
+    def __get__(self, entity, owner=None):
+        if entity is None:
+            return self
+        index = entity.__dict__.get(self.relation)
+        if index is None:
+            return []
+        ids = index.subjects(entity.term_id) if self.inverse else index.objects(entity.term_id)
+        return tuple(index.resolve(ids))
+
+
 class RDF_Entity(object):
     """
     Pythonic representation of an RDF resource - normally not instantiated but used for
@@ -55,6 +103,10 @@ class RDF_Entity(object):
         self.rdflib_graph = rdflib.Graph()
         self.namespaces = namespaces
         self.all_shapes = []
+        self.term_id = None  # id in Ontospy.terms
+        self._hierarchy = None  # TermRelation of parents, which replaces the lists below once built
+        self._texts = None  # labels and descriptions, see _textTable
+        self.expression = None  # blank nodes: the ClassExpression parsed from them, if any
 
         self.qname = self._build_qname()
         self.rdftype_qname = self._build_qname(rdftype)
@@ -102,6 +154,28 @@ class RDF_Entity(object):
         if self.triples:
             for terzetto in self.triples:
                 self.rdflib_graph.add(terzetto)
+        self._texts = self._buildTextTable()
+
+    def _buildTextTable(self):
+        """
+        labels and descriptions, read once from the entity graph:
+        predicate => (values, dict language tag => values), values in the order
+        getValuesForProperty returns them
+        """
+        table = {}
+        for pred in LABEL_PREDICATES + DESCRIPTION_PREDICATES:
+            values = list(self.rdflib_graph.objects(None, pred))
+            if values:
+                by_language = {}
+                for value in values:
+                    by_language.setdefault(getattr(value, "language", None), []).append(value)
+                table[pred] = (values, by_language)
+        return table
+
+    def _textTable(self):
+        if getattr(self, "_texts", None) is None:  # also models pickled by older versions
+            self._texts = self._buildTextTable()
+        return self._texts
 
     # methods added to RDF_Entity even though they apply only to some subs
 
@@ -109,6 +183,9 @@ class RDF_Entity(object):
         """ returns all ancestors in the taxonomy """
         if not cl:
             cl = self
+        hierarchy = cl._indexedHierarchy()
+        if noduplicates and hierarchy is not None:
+            return hierarchy.resolve(hierarchy.closure(cl.term_id))
         if cl.parents():
             bag = []
             for x in cl.parents():
@@ -129,6 +206,9 @@ class RDF_Entity(object):
         """ returns all descendants in the taxonomy """
         if not cl:
             cl = self
+        hierarchy = cl._indexedHierarchy()
+        if noduplicates and hierarchy is not None:
+            return hierarchy.resolve(hierarchy.closure(cl.term_id, inverse=True))
         if cl.children():
             bag = []
             for x in cl.children():
@@ -145,12 +225,24 @@ class RDF_Entity(object):
             return []
 
 
+    def _indexedHierarchy(self):
+        """ the TermRelation holding the parents and children, once Ontospy has built it """
+        if self._parents is None:
+            return self._hierarchy
+        return None
+
     def parents(self):
-        """wrapper around property"""
+        """wrapper around property (a tuple, once the hierarchy is indexed)"""
+        hierarchy = self._indexedHierarchy()
+        if hierarchy is not None:
+            return tuple(hierarchy.resolve(hierarchy.objects(self.term_id)))
         return self._parents
 
     def children(self):
-        """wrapper around property"""
+        """wrapper around property (a tuple, once the hierarchy is indexed)"""
+        hierarchy = self._indexedHierarchy()
+        if hierarchy is not None:
+            return tuple(hierarchy.resolve(hierarchy.subjects(self.term_id)))
         return self._children
 
     def getValuesForProperty(self, aPropURIRef):
@@ -167,37 +259,28 @@ class RDF_Entity(object):
     
     def labels(self):
         """
-            all labels, including: 
+            all labels (as strings, each once), including: 
             rdflib.RDFS.label,
             rdflib.namespace.SKOS.prefLabel,
             rdflib.namespace.SKOS.altLabel,
             rdflib.namespace.Namespace("http://www.geneontology.org/formats/oboInOwl#").hasSynonym,
             rdflib.namespace.Namespace("http://id.nlm.nih.gov/mesh/vocab#").casn1_label,
         """
-        preds = [
-            rdflib.RDFS.label,
-            rdflib.namespace.SKOS.prefLabel,
-            rdflib.namespace.SKOS.altLabel,
-            rdflib.namespace.Namespace("http://www.geneontology.org/formats/oboInOwl#").hasSynonym,
-            rdflib.namespace.Namespace("http://id.nlm.nih.gov/mesh/vocab#").casn1_label,
-        ]
-
-        nmes = set()
-        for pred in preds:
-            recs = self.getValuesForProperty(rdflib.RDFS.label)
-            for rec in recs:
-                nmes.add(rec.value)
-        
-        return list(nmes)
+        table = self._textTable()
+        nmes = []
+        for pred in LABEL_PREDICATES:
+            for rec in table.get(pred, ([], {}))[0]:
+                name = _textValue(rec)
+                if name not in nmes:
+                    nmes.append(name)
+        return nmes
     
     def altLabels(self):
         """
         all names without bestLabel()
         """
-        n = self.bestLabel()
-        nmes = self.labels()
-        nmes.remove(n.value)
-        return nmes
+        n = _textValue(self.bestLabel(qname_allowed=False))
+        return [x for x in self.labels() if x != n]
     
     def prefLabels(self):
         n = self.bestLabel()
@@ -219,20 +302,23 @@ class RDF_Entity(object):
         facility for extrating the best available label for an entity
 
         ..This checks RFDS.label, SKOS.prefLabel and finally the qname local component
+        (same as firstStringInList on their values, without scanning them)
         """
 
-        test = self.getValuesForProperty(rdflib.RDFS.label)
+        table = self._textTable()
         out = ""
 
-        if test:
-            out = firstEnglishStringInList(test)
+        for pred in [rdflib.RDFS.label, rdflib.namespace.SKOS.prefLabel]:
+            if pred in table:
+                values, by_language = table[pred]
+                if len(values) == 1 or prefLanguage not in by_language:
+                    out = values[0]
+                else:
+                    out = by_language[prefLanguage][-1]
+                break
         else:
-            test = self.getValuesForProperty(rdflib.namespace.SKOS.prefLabel)
-            if test:
-                out = firstEnglishStringInList(test)
-            else:
-                if qname_allowed:
-                    out = self.locale
+            if qname_allowed:
+                out = self.locale
 
         if quotes and out:
             return addQuotes(out)
@@ -242,21 +328,22 @@ class RDF_Entity(object):
     def bestDescription(self, prefLanguage="en",quotes=False):
         """
         facility for extracting a human readable description for an entity
+        (same as joinStringsInList on the values of the first predicate having some)
         """
 
-        test_preds = [rdflib.RDFS.comment, rdflib.namespace.DCTERMS.description, rdflib.namespace.DC.description, rdflib.namespace.SKOS.definition, 
-            rdflib.namespace.Namespace("http://purl.obolibrary.org/obo/").IAO_0000115 ]
+        table = self._textTable()
 
-        for pred in test_preds:
-            test = self.getValuesForProperty(pred)
-            # printDebug(str(test), "red")
-            if test:
+        for pred in DESCRIPTION_PREDICATES:
+            if pred in table:
+                values, by_language = table[pred]
+                if len(values) == 1:
+                    out = values[0]
+                else:
+                    out = " - ".join([x for x in by_language.get(prefLanguage, values)])
                 if quotes:
-                    # return addQuotes(firstEnglishStringInList(test))
-                    return addQuotes(joinStringsInList(test, prefLanguage="en"))
+                    return addQuotes(out)
                 else:
-                    # return firstEnglishStringInList(test)
-                    return joinStringsInList(test, prefLanguage="en")
+                    return out
         return ""
 
 
@@ -321,8 +408,14 @@ class OntoClass(RDF_Entity):
         {<Class *http://www.w3.org/2003/01/geo/wgs84_pos#SpatialThing*>:
             [<Property *http://xmlns.com/foaf/0.1/based_near*>, etc...]},
             ]
+
+    domain_of, range_of: the properties having the class in their domain / range (lists
+    while the model is built, then tuples read from Ontospy.property_domains / property_ranges)
     """
 
+    domain_of = IndexedEntities("_domainIndex", inverse=True)
+    range_of = IndexedEntities("_rangeIndex", inverse=True)
+
     def __init__(self, uri, rdftype=None, namespaces=None, ext_model=False):
         """
         ...
@@ -336,6 +429,7 @@ class OntoClass(RDF_Entity):
         self.range_of_inferred = []
         self.ontology = None
         self._instances = False  # calc on demand at runtime 
+        self._instance_count = None  # see Ontospy.instance_counts
         self.sparqlHelper = None	 # the original graph the class derives from
         self.shapedProperties = [] #properties of this class that belong to a shape
 
@@ -345,24 +439,74 @@ class OntoClass(RDF_Entity):
     @property
     def instances(self):  # = all instances
         if self._instances == False:
-            # calculate and set
-            self._instances = []
-            if self.sparqlHelper:
-                qres = self.sparqlHelper.getClassInstances(self.uri)
-                for uri in [x[0] for x in qres]:
-                    instance = RDF_Entity(uri, self.uri, self.namespaces)
-                    instance.triples = self.sparqlHelper.entityTriples(instance.uri)
-                    instance._buildGraph() # force construction of mini graph
-                    self._instances += [instance]
-
-            return self._instances
-        else:
-            # it's been calc already, hence return
-            return self._instances
+            # calculate and set (sorted, as local graphs yield them in no particular order)
+            self._instances = sorted(self.iter_instances(with_triples=True), key=lambda x: x.uri)
+        return self._instances
+
+    def iter_instances(self, page_size=None, with_triples=False):
+        """
+        Yields the instances of this class one at a time, without keeping them in memory.
 
+        <with_triples>: if False the instances URIs are returned, else RDF_Entity
+            objects with their triples, which are fetched a page at a time
+        <page_size>: number of instances fetched per request (defaults to the page
+            size of the sparqlHelper)
+        """
+        if not self.sparqlHelper:
+            return
+        helper = self.sparqlHelper
+        uris = helper.iterClassInstances(self.uri, page_size)
+        if not with_triples:
+            for uri in uris:
+                yield uri
+            return
+        size = page_size or helper.page_size or helper.batch_size or 100
+        page = []
+        for uri in uris:
+            page += [uri]
+            if len(page) == size:
+                for instance in self._buildInstances(page):
+                    yield instance
+                page = []
+        for instance in self._buildInstances(page):
+            yield instance
+
+    def _buildInstances(self, uris):
+        """ RDF_Entity objects for a page of instances """
+        if not uris:
+            return []
+        helper = self.sparqlHelper
+        # with sparql endpoints, triples are fetched in batches, concurrently
+        if helper.batch_size:
+            size = helper.batch_size
+            batches = [uris[i:i + size] for i in range(0, len(uris), size)]
+            triples = {}
+            for res in helper.imap(helper.entityTriplesBatch, batches):
+                triples.update(res)
+            triples = [triples[uri] for uri in uris]
+        else:
+            triples = helper.imap(helper.entityTriples, uris)
+        out = []
+        for uri, instance_triples in zip(uris, triples):
+            instance = RDF_Entity(uri, self.uri, self.namespaces)
+            instance.triples = instance_triples
+            instance._buildGraph() # force construction of mini graph
+            out += [instance]
+        return out
 
     def count(self):
-        return len(self.instances)
+        """
+        Number of instances. Calculated without building them: with one query, or
+        taken from the counts of all classes set by Ontospy.instance_counts().
+        """
+        if self._instances != False:
+            return len(self._instances)
+        if getattr(self, "_instance_count", None) is None:
+            if self.sparqlHelper:
+                self._instance_count = self.sparqlHelper.getClassInstancesCount(self.uri)
+            else:
+                return 0
+        return self._instance_count
 
 
     def printStats(self):
@@ -401,8 +545,13 @@ class OntoProperty(RDF_Entity):
     rdflib.term.URIRef(u'http://www.w3.org/2002/07/owl#AnnotationProperty')
     rdflib.term.URIRef(u'http://www.w3.org/1999/02/22-rdf-syntax-ns#Property')
 
+    domains, ranges: lists while the model is built, then tuples read from
+    Ontospy.property_domains / property_ranges
     """
 
+    domains = IndexedEntities("_domainIndex")
+    ranges = IndexedEntities("_rangeIndex")
+
     def __init__(self, uri, rdftype=None, namespaces=None, ext_model=False):
         """
         ...
@@ -0,0 +1,297 @@
+# !/usr/bin/env python
+#  -*- coding: UTF-8 -*-
+
+"""
+OWL class expressions (restrictions, unionOf, intersectionOf etc..) of an Ontospy model
+
+ClassExpressionIndex reads the blank nodes describing class expressions in one pass over
+the graph, and parses them into ClassExpression objects, each one once. It then indexes
+the restrictions by the property they are about, and by the named classes using them
+in their definitions (rdfs:subClassOf, owl:equivalentClass), so that eg the classes
+restricting a property are found without walking the graph again.
+
+##################
+#
+#  USAGE
+
+o = Ontospy("pizza.ttl")
+index = o.class_expressions
+index.restrictions_on(P)  # => the restrictions on property P
+index.classes_restricting(P)  # => the classes having a restriction on P
+index.restrictions_of(C)  # => the restrictions in the definition of class C
+print(index.get(bnode))  # => eg "pizza:hasTopping some pizza:CheeseTopping"
+
+##################
+
+"""
+
+from __future__ import print_function
+
+import rdflib
+
+from .utils import isBlankNode, uri2niceString
+
+OWL = rdflib.Namespace("http://www.w3.org/2002/07/owl#")
+
+# expression kinds
+NAMED, RESTRICTION, UNION, INTERSECTION, COMPLEMENT, ONE_OF, UNKNOWN = (
+    "class", "restriction", "unionOf", "intersectionOf", "complementOf", "oneOf", "unknown")
+
+# restriction predicate => word used by to_string (Manchester syntax)
+RESTRICTION_CONSTRAINTS = [
+    (OWL.someValuesFrom, "some"),
+    (OWL.allValuesFrom, "only"),
+    (OWL.hasValue, "value"),
+    (OWL.hasSelf, "Self"),
+    (OWL.cardinality, "exactly"),
+    (OWL.minCardinality, "min"),
+    (OWL.maxCardinality, "max"),
+    (OWL.qualifiedCardinality, "exactly"),
+    (OWL.minQualifiedCardinality, "min"),
+    (OWL.maxQualifiedCardinality, "max"),
+]
+
+# operator predicate => kind; all but owl:complementOf point to an rdf:List
+OPERATORS = [
+    (OWL.unionOf, UNION),
+    (OWL.intersectionOf, INTERSECTION),
+    (OWL.complementOf, COMPLEMENT),
+    (OWL.oneOf, ONE_OF),
+]
+
+# predicates linking a named class to the expressions defining it
+DEFINING_PREDICATES = [rdflib.RDFS.subClassOf, OWL.equivalentClass]
+
+_CONSTRAINTS = dict(RESTRICTION_CONSTRAINTS)
+_OPERATORS = dict(OPERATORS)
+_READ = set([rdflib.RDF.type, OWL.onProperty, OWL.onClass, OWL.onDataRange,
+             rdflib.RDF.first, rdflib.RDF.rest] + list(_CONSTRAINTS) + list(_OPERATORS))
+
+
+class ClassExpression(object):
+    """
+    A parsed class expression. <node> is the URI or blank node it was parsed from, and
+    <kind> tells how to read the other attributes:
+
+    class: a named class (<node>)
+    restriction: <on_property>, with <constraint> (eg owl:someValuesFrom) and <value>,
+        a ClassExpression or a literal (eg cardinalities, hasValue); <on_class> is the
+        ClassExpression of qualified cardinalities
+    unionOf, intersectionOf, complementOf: <operands>, a list of ClassExpressions
+    oneOf: <operands>, a list of individuals (rdflib terms)
+    unknown: a blank node which isn't a class expression
+    """
+
+    def __init__(self, node, kind=UNKNOWN, namespaces=None):
+        self.node = node
+        self.kind = kind
+        self.namespaces = namespaces
+        self.on_property = None
+        self.constraint = None
+        self.value = None
+        self.on_class = None
+        self.operands = []
+
+    def __repr__(self):
+        return "<Ontospy: ClassExpression *%s*>" % self.to_string()
+
+    def __str__(self):
+        return self.to_string()
+
+    def to_string(self, namespaces=None):
+        """ the expression in Manchester syntax, eg "hasTopping some (A or B)" """
+        return self._string(namespaces or self.namespaces, set())
+
+    def _string(self, namespaces, seen):
+        if self.kind == NAMED:
+            return uri2niceString(self.node, namespaces)
+        if self.node in seen:  # a cyclic expression
+            return "..."
+        seen = seen | set([self.node])
+
+        def term(x):
+            if isinstance(x, ClassExpression):
+                s = x._string(namespaces, seen)
+                return s if x.kind in (NAMED, ONE_OF) else "(%s)" % s
+            return uri2niceString(x, namespaces)
+
+        if self.kind == RESTRICTION:
+            prop = uri2niceString(self.on_property, namespaces) if self.on_property else "?"
+            word = _CONSTRAINTS.get(self.constraint, "?")
+            if self.constraint == OWL.hasSelf:
+                return "%s Self" % prop
+            if self.on_class is not None:
+                return "%s %s %s %s" % (prop, word, self.value, term(self.on_class))
+            if self.value is None:
+                return "%s %s" % (prop, word)
+            if isinstance(self.value, ClassExpression) or self.constraint == OWL.hasValue:
+                return "%s %s %s" % (prop, word, term(self.value))
+            return "%s %s %s" % (prop, word, self.value)
+        if self.kind == UNION:
+            return " or ".join([term(x) for x in self.operands])
+        if self.kind == INTERSECTION:
+            return " and ".join([term(x) for x in self.operands])
+        if self.kind == COMPLEMENT:
+            return "not %s" % " ".join([term(x) for x in self.operands])
+        if self.kind == ONE_OF:
+            return "{%s}" % ", ".join([term(x) for x in self.operands])
+        return uri2niceString(self.node, namespaces)
+
+    def restrictions(self):
+        """ this expression (if a restriction) and the ones nested in it, each once """
+        out = []
+        seen = set()
+        stack = [self]
+        while stack:
+            x = stack.pop()
+            if not isinstance(x, ClassExpression) or x.kind == NAMED or x.node in seen:
+                continue
+            seen.add(x.node)
+            if x.kind == RESTRICTION:
+                out.append(x)
+            nested = [x.on_class, x.value] + ([] if x.kind == ONE_OF else x.operands)
+            stack.extend(reversed(nested))
+        return out
+
+
+class ClassExpressionIndex(object):
+    """
+    The class expressions (blank nodes) of a graph, parsed once, and indexes:
+
+    <expressions>: node => ClassExpression
+    <by_property>: property URI => list of the restrictions on it
+    <definitions>: class URI => list of (predicate, ClassExpression), for the blank
+        nodes it is a subClassOf / equivalentClass of
+    <by_class>: class URI => list of the restrictions in its definitions, nested ones too
+    <classes_by_property>: property URI => list of the classes with restrictions on it
+
+    <namespaces>: used to print the expressions (eg Ontospy.namespaces)
+    """
+
+    def __init__(self, graph, namespaces=None):
+        self.namespaces = namespaces
+        self.expressions = {}
+        self.by_property = {}
+        self.definitions = {}
+        self.by_class = {}
+        self.classes_by_property = {}
+        self._read(graph)
+
+    def _read(self, graph):
+        # one pass: the triples about blank nodes expressions, grouped by subject
+        described = {}
+        anchors = []
+        for s, p, o in graph.triples((None, None, None)):
+            if isBlankNode(s):
+                if p in _READ:
+                    described.setdefault(s, {}).setdefault(p, []).append(o)
+            elif p in DEFINING_PREDICATES and isBlankNode(o):
+                anchors.append((s, p, o))
+        self._described = described
+        todo = []
+        for s, values in described.items():
+            if rdflib.RDF.first in values:
+                continue  # list cells are read with the lists
+            if OWL.onProperty in values or OWL.Restriction in values.get(rdflib.RDF.type, []) \
+                    or any([x in values for x in _OPERATORS]):
+                self._expression(s, todo)
+        for s, p, o in anchors:
+            self.definitions.setdefault(s, []).append((p, self._expression(o, todo)))
+        # parse the expressions found, and those they point to
+        while todo:
+            self._parse(todo.pop(), todo)
+        del self._described
+        for x in self.expressions.values():
+            if x.kind == RESTRICTION and x.on_property is not None:
+                self.by_property.setdefault(x.on_property, []).append(x)
+        for v in self.by_property.values():
+            v.sort(key=lambda x: str(x.node))
+        for aClass in self.definitions:
+            out, seen = [], set()
+            for _, expression in self.definitions[aClass]:
+                for x in expression.restrictions():
+                    if x.node not in seen:
+                        seen.add(x.node)
+                        out.append(x)
+            self.by_class[aClass] = out
+            for prop in set([x.on_property for x in out if x.on_property is not None]):
+                self.classes_by_property.setdefault(prop, []).append(aClass)
+        for v in self.classes_by_property.values():
+            v.sort()
+
+    def _expression(self, node, todo):
+        """ the ClassExpression for <node>, created (and queued for parsing) if new """
+        x = self.expressions.get(node)
+        if x is None:
+            if isBlankNode(node):
+                x = ClassExpression(node, UNKNOWN, self.namespaces)
+                todo.append(x)
+            else:
+                x = ClassExpression(node, NAMED, self.namespaces)
+            self.expressions[node] = x
+        return x
+
+    def _list(self, node):
+        """ the items of an rdf:List, without recursion and stopping at cycles """
+        out = []
+        seen = set()
+        while node is not None and node != rdflib.RDF.nil and node not in seen:
+            seen.add(node)
+            values = self._described.get(node, {})
+            out += values.get(rdflib.RDF.first, [])[:1]
+            node = (values.get(rdflib.RDF.rest) or [None])[0]
+        return out
+
+    def _parse(self, x, todo):
+        values = self._described.get(x.node, {})
+        if OWL.onProperty in values:
+            x.kind = RESTRICTION
+            x.on_property = values[OWL.onProperty][0]
+            for pred, _ in RESTRICTION_CONSTRAINTS:
+                if pred in values:
+                    x.constraint = pred
+                    value = values[pred][0]
+                    if pred in (OWL.someValuesFrom, OWL.allValuesFrom):
+                        value = self._expression(value, todo)
+                    x.value = value
+                    break
+            on_class = (values.get(OWL.onClass) or values.get(OWL.onDataRange) or [None])[0]
+            if on_class is not None:
+                x.on_class = self._expression(on_class, todo)
+            return
+        for pred, kind in OPERATORS:
+            if pred in values:
+                x.kind = kind
+                if kind == COMPLEMENT:
+                    items = values[pred][:1]
+                else:
+                    items = self._list(values[pred][0])
+                if kind == ONE_OF:
+                    x.operands = items
+                else:
+                    x.operands = [self._expression(y, todo) for y in items]
+                return
+        if OWL.Restriction in values.get(rdflib.RDF.type, []):
+            x.kind = RESTRICTION  # with no owl:onProperty
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def get(self, node, default=None):
+        """ the ClassExpression parsed from <node> (eg a blank node in a class definition) """
+        return self.expressions.get(node, default)
+
+    def restrictions_on(self, prop):
+        """ the restrictions on the property <prop> (a URI) """
+        return list(self.by_property.get(rdflib.URIRef(prop), []))
+
+    def restrictions_of(self, aClass):
+        """
+        the restrictions in the definition of the class <aClass> (a URI), including
+        nested ones, eg both in `C subClassOf (p some (q some D))`
+        """
+        return list(self.by_class.get(rdflib.URIRef(aClass), []))
+
+    def classes_restricting(self, prop):
+        """ the classes (URIs) whose definitions have a restriction on the property <prop> """
+        return list(self.classes_by_property.get(rdflib.URIRef(prop), []))
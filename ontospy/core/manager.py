@@ -3,9 +3,23 @@
 
 from . import *
 import random
+import shutil
+import time
+import threading
+import hashlib
+import tempfile
+import json
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
 
 from colorama import Fore, Style
 
+from .utils import write_atomic as _write_atomic
+
 # ===========
 #
 # Ontospy management utils
@@ -118,32 +132,240 @@ def get_random_ontology(TOP_RANGE=10, pattern=""):
     return ontouri, g
 
 
+# ===========
+#
+# Library index: models are identified by the sha256 of their contents, so
+# that the same model saved under several names (eg imported from different
+# mirrors) is stored and cached once. The index maps each file name to its
+# hash, and is validated against the file size and mtime like a git index.
+#
+# ===========
+
+LIBRARY_INDEX_FILE = ".ontospy-index.json"
+
+
+def _file_sha256(path):
+    """sha256 hex digest of a file, read in chunks"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class LibraryIndex(dict):
+    """
+    The library index as read from disk. <changed> is set when files get hashed
+    with it (see get_content_hash), so that the updates are saved once with
+    flush_library_index, eg after listing the whole library.
+    """
+    changed = False
+
+
+def get_library_index(library_dir=None):
+    """
+    The name => content hash table of the local library, eg
+    {'foaf.rdf': {'sha256': '4f2a..', 'size': 40512, 'mtime': 1539940000.0}, ...}
+    """
+    library_dir = library_dir or get_home_location()
+    try:
+        with open(os.path.join(library_dir, LIBRARY_INDEX_FILE)) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError):
+        return LibraryIndex()
+    return LibraryIndex(index if isinstance(index, dict) else {})
+
+
+def _save_library_index(index, library_dir=None):
+    """
+    note: concurrent updates may lose an entry, which just gets hashed again later
+    """
+    library_dir = library_dir or get_home_location()
+    data = json.dumps(index, indent=2, sort_keys=True)
+    try:
+        _write_atomic(os.path.join(library_dir, LIBRARY_INDEX_FILE), data.encode("utf-8"))
+    except (IOError, OSError):
+        pass
+    index.changed = False
+
+
+def flush_library_index(index, library_dir=None):
+    """
+    save the index if files were hashed with it
+    :return - True if the index has been saved
+    """
+    if getattr(index, "changed", False):
+        _save_library_index(index, library_dir)
+        return True
+    return False
+
+
+def get_content_hash(filename, library_dir=None, index=None):
+    """
+    sha256 of a model in the local library. Only files changed since they were
+    last indexed get read, and the index is updated accordingly.
+    <index>: a LibraryIndex shared by several calls: it is only marked as changed,
+        and saved by the caller once done (see flush_library_index)
+    :return - None if the file does not exist
+    """
+    library_dir = library_dir or get_home_location()
+    try:
+        st = os.stat(os.path.join(library_dir, filename))
+    except OSError:
+        return None
+    shared = isinstance(index, LibraryIndex)
+    if index is None:
+        index = get_library_index(library_dir)
+    entry = index.get(filename)
+    if entry and entry.get('size') == st.st_size and entry.get('mtime') == st.st_mtime:
+        return entry['sha256']
+    sha = _file_sha256(os.path.join(library_dir, filename))
+    index[filename] = {'sha256': sha, 'size': st.st_size, 'mtime': st.st_mtime}
+    if shared:
+        index.changed = True
+    else:
+        _save_library_index(index, library_dir)
+    return sha
+
+
+def get_library_aliases(sha, library_dir=None, index=None):
+    """names of the models in the local library with the given contents"""
+    library_dir = library_dir or get_home_location()
+    if index is None:
+        index = get_library_index(library_dir)
+    return sorted([
+        name for name in list(index.keys())
+        if index[name].get('sha256') == sha and
+        get_content_hash(name, library_dir, index) == sha
+    ])
+
+
+def _cache_key(filename, library_dir=None, index=None):
+    """
+    Models are cached by content. Names which are not in the local library
+    (eg deleted files, or keys already) are used as they are
+    """
+    return get_content_hash(filename, library_dir, index) or filename
+
+
+def add_to_library(filename, data, library_dir=None):
+    """
+    Save the contents of a model in the local library as <filename>.
+    :return - a tuple (status, sha256) where status is
+        'unchanged' if <filename> has these contents already (nothing is written)
+        'alias' if the same contents are in the library under another name: the
+            file shares its cached model, so it's not parsed and cached again
+        'new' otherwise
+    note: each name is a file of its own (not a link), so that it can be edited
+        or removed from the OS without affecting the others
+    """
+    library_dir = library_dir or get_home_location()
+    fullpath = os.path.join(library_dir, filename)
+    sha = hashlib.sha256(data).hexdigest()
+    index = get_library_index(library_dir)
+    if get_content_hash(filename, library_dir, index) == sha:
+        flush_library_index(index, library_dir)
+        return 'unchanged', sha
+
+    status = 'alias' if get_library_aliases(sha, library_dir, index) else 'new'
+    _write_atomic(fullpath, data)
+    get_content_hash(filename, library_dir, index)  # update the index
+    flush_library_index(index, library_dir)
+    return status, sha
+
+
+# ===========
+#
+# Cached models
+#
+# ===========
+
+
+def _pickle_path(key, cache_dir=None):
+    """ location of the cached version of a model (see _cache_key) """
+    return os.path.join(cache_dir or ONTOSPY_LOCAL_CACHE, key + ".pickle")
+
+
+def _stats_path(key, cache_dir=None):
+    """ location of the statistics saved when a model gets cached """
+    return os.path.join(cache_dir or ONTOSPY_LOCAL_CACHE, key + ".stats.json")
+
+
 def get_pickled_ontology(filename):
-    """ try to retrieve a cached ontology """
-    pickledfile = os.path.join(ONTOSPY_LOCAL_CACHE, filename + ".pickle")
-    # pickledfile = ONTOSPY_LOCAL_CACHE + "/" + filename + ".pickle"
+    """
+    try to retrieve a cached ontology
+    note: models already loaded in this process are returned from memory (see MODELS_CACHE)
+    2026-10-19: models are cached by content, so files with the same contents share the cache
+    """
+    key = _cache_key(filename)
+    pickledfile = _pickle_path(key)
     if GLOBAL_DISABLE_CACHE:
         printDebug(
             "WARNING: DEMO MODE cache has been disabled in __init__.py ==============",
             "red")
     if os.path.isfile(pickledfile) and not GLOBAL_DISABLE_CACHE:
+        MODELS_CACHE.wait_prefetch(key)
         try:
-            return cPickle.load(open(pickledfile, "rb"))
+            stamp = os.path.getmtime(pickledfile)
+        except OSError:
+            return None
+        g = MODELS_CACHE.get(key, stamp)
+        if g is not None:
+            _touch_cache_entry(pickledfile)
+            return g
+        try:
+            g = _read_pickle(pickledfile)
+            _touch_cache_entry(pickledfile)
+            MODELS_CACHE.put(key, g, os.path.getsize(pickledfile), stamp)
+            if not os.path.isfile(_stats_path(key)):
+                # cached by an older version
+                save_ontology_stats(filename, g)
+            return g
         except:
             print(Style.DIM +
                   "** WARNING: Cache is out of date ** ...recreating it... " +
                   Style.RESET_ALL)
+            # remove the invalid item, unless it's been replaced in the meantime
+            if _cache_stamp(pickledfile) == stamp:
+                _remove_cache_entry(pickledfile)
             return None
     else:
         return None
 
 
+def prefetch_ontology(filename):
+    """
+    Load a cached ontology into memory using a background thread, so that
+    a later call to get_pickled_ontology returns immediately.
+    Models which have not been cached yet are ignored.
+    """
+    if not filename or GLOBAL_DISABLE_CACHE:
+        return False
+    key = _cache_key(filename)
+    if not os.path.isfile(_pickle_path(key)):
+        return False
+    return MODELS_CACHE.prefetch(key, get_pickled_ontology)
+
+
 def del_pickled_ontology(filename):
     """ 
     Remove a cached ontology based on related filename
+    note: the cached item is kept if other files in the library have the same contents
     """
-    pickledfile = os.path.join(ONTOSPY_LOCAL_CACHE, filename + ".pickle")
-    # pickledfile = ONTOSPY_LOCAL_CACHE + "/" + filename + ".pickle"
+    index = get_library_index()
+    key = _cache_key(filename, index=index)
+    if key == filename and filename in index:  # the file has been deleted already
+        key = index[filename]['sha256']
+    if filename in index:
+        del index[filename]
+        _save_library_index(index)
+    aliases = get_library_aliases(key, index=index)
+    flush_library_index(index)
+    if aliases:
+        return None
+    pickledfile = _pickle_path(key)
+    MODELS_CACHE.discard(key)
+    _remove_cache_entry(_stats_path(key))
     if os.path.isfile(pickledfile) and not GLOBAL_DISABLE_CACHE:
         os.remove(pickledfile)
         return True
@@ -152,13 +374,17 @@ def del_pickled_ontology(filename):
 
 
 def rename_pickled_ontology(filename, newname):
-    """ try to rename a cached ontology """
-    pickledfile = os.path.join(ONTOSPY_LOCAL_CACHE, filename + ".pickle")
-    # pickledfile = ONTOSPY_LOCAL_CACHE + "/" + filename + ".pickle"
-    newpickledfile = os.path.join(ONTOSPY_LOCAL_CACHE, newname + ".pickle")
-    # newpickledfile = ONTOSPY_LOCAL_CACHE + "/" + newname + ".pickle"
-    if os.path.isfile(pickledfile) and not GLOBAL_DISABLE_CACHE:
-        os.rename(pickledfile, newpickledfile)
+    """
+    try to rename a cached ontology
+    note: models are cached by content, so only the library index needs updating
+    """
+    index = get_library_index()
+    if filename in index:
+        index[newname] = index.pop(filename)
+        _save_library_index(index)
+    key = _cache_key(newname, index=index)
+    flush_library_index(index)
+    if os.path.isfile(_pickle_path(key)) and not GLOBAL_DISABLE_CACHE:
         return True
     else:
         return None
@@ -170,37 +396,576 @@ def do_pickle_ontology(filename, g=None):
     note: option to pass a pre-generated graph instance too
     2015-09-17: added code to increase recursion limit if cPickle fails
         see http://stackoverflow.com/questions/2134706/hitting-maximum-recursion-depth-using-pythons-pickle-cpickle
+    2026-10-19: concurrent processes caching the same model wait for each other,
+        so that the model is built only once (see CacheLock)
     """
     ONTOSPY_LOCAL_MODELS = get_home_location()
     get_or_create_home_repo()  # ensure all the right folders are there
-    pickledpath = os.path.join(ONTOSPY_LOCAL_CACHE, filename + ".pickle")
-    # pickledpath = ONTOSPY_LOCAL_CACHE + "/" + filename + ".pickle"
-    if not g:
-        g = Ontospy(os.path.join(ONTOSPY_LOCAL_MODELS, filename))
-        # g = Ontospy(ONTOSPY_LOCAL_MODELS + "/" + filename)
+    key = _cache_key(filename)
+    pickledpath = _pickle_path(key)
+    stamp = _cache_stamp(pickledpath)
 
-    if not GLOBAL_DISABLE_CACHE:
-        try:
-            cPickle.dump(g, open(pickledpath, "wb"))
-            printDebug(".. cached <%s>" % filename, "green")
-        except Exception as e:
-            print(Style.DIM + "\n.. Failed caching <%s>" % filename +
-                  Style.RESET_ALL)
-            print(str(e) + "\n")
-            print(
-                Style.DIM +
-                "... attempting to increase the recursion limit from %d to %d" %
-                (sys.getrecursionlimit(), sys.getrecursionlimit() * 10) +
-                Style.RESET_ALL)
+    with CacheLock(pickledpath):
+        if not g:
+            if stamp != _cache_stamp(pickledpath) and not GLOBAL_DISABLE_CACHE:
+                # cached by another process while we were waiting for the lock
+                g = get_pickled_ontology(filename)
+                if g:
+                    return g
+            g = Ontospy(os.path.join(ONTOSPY_LOCAL_MODELS, filename))
 
+        if not GLOBAL_DISABLE_CACHE:
             try:
-                sys.setrecursionlimit(sys.getrecursionlimit() * 10)
-                cPickle.dump(g, open(pickledpath, "wb"))
+                _write_pickle(pickledpath, g)
                 printDebug(".. cached <%s>" % filename, "green")
             except Exception as e:
-                printDebug(
-                    "\n... Failed caching <%s>... Aborting caching operation..."
-                    % filename, "error")
+                print(Style.DIM + "\n.. Failed caching <%s>" % filename +
+                      Style.RESET_ALL)
                 print(str(e) + "\n")
-            sys.setrecursionlimit(int(sys.getrecursionlimit() / 10))
+                print(
+                    Style.DIM +
+                    "... attempting to increase the recursion limit from %d to %d" %
+                    (sys.getrecursionlimit(), sys.getrecursionlimit() * 10) +
+                    Style.RESET_ALL)
+
+                try:
+                    sys.setrecursionlimit(sys.getrecursionlimit() * 10)
+                    _write_pickle(pickledpath, g)
+                    printDebug(".. cached <%s>" % filename, "green")
+                except Exception as e:
+                    printDebug(
+                        "\n... Failed caching <%s>... Aborting caching operation..."
+                        % filename, "error")
+                    print(str(e) + "\n")
+                sys.setrecursionlimit(int(sys.getrecursionlimit() / 10))
+            if os.path.isfile(pickledpath):
+                MODELS_CACHE.put(key, g, os.path.getsize(pickledpath),
+                                 os.path.getmtime(pickledpath))
+                save_ontology_stats(filename, g)
+
+    if not GLOBAL_DISABLE_CACHE:
+        enforce_cache_budget(keep=[pickledpath])
     return g
+
+
+# ===========
+#
+# Models statistics: saved next to the cached models, so that the library
+# can be summarised without loading any graph
+#
+# ===========
+
+
+def save_ontology_stats(filename, g, cache_dir=None, library_dir=None):
+    """
+    Save the main figures of a model in a small json file in the cache folder.
+    The size is the one of the cached model, which is also what MODELS_CACHE
+    uses as an estimate of its memory footprint.
+    """
+    cache_dir = cache_dir or ONTOSPY_LOCAL_CACHE
+    key = _cache_key(filename, library_dir)
+    try:
+        stats = {
+            'file': filename,
+            'sha256': key,
+            'ontologies': len(g.all_ontologies),
+            'classes': len(g.all_classes),
+            'properties': len(g.all_properties),
+            'concepts': len(g.all_skos_concepts),
+            'shapes': len(g.all_shapes),
+            'triples': g.triplesCount(),
+            'parse_time': getattr(g, 'parse_time', None),
+            'size': os.path.getsize(_pickle_path(key, cache_dir)),
+        }
+        data = json.dumps(stats, indent=2, sort_keys=True)
+        _write_atomic(_stats_path(key, cache_dir), data.encode("utf-8"))
+    except Exception as e:
+        printDebug(".. failed saving stats for <%s>: %s" % (filename, str(e)), "comment")
+        return None
+    return stats
+
+
+def get_ontology_stats(filename, cache_dir=None, library_dir=None, index=None):
+    """
+    Statistics for a model of the local library, as saved when it was cached
+
+    {'file': 'foaf.rdf', 'ontologies': 1, 'classes': 15, 'properties': 67, 'concepts': 0,
+        'shapes': 0, 'triples': 630, 'parse_time': 0.35, 'size': 241520, 'sha256': ..}
+
+    :return - None if the model has not been cached with its current contents
+    """
+    key = _cache_key(filename, library_dir, index)
+    try:
+        with open(_stats_path(key, cache_dir)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+# ===========
+#
+# Cache files: atomic writes, checksums and locks
+#
+# ===========
+
+# first line of a cached model, followed by the sha256 of the pickled data
+CACHE_FILE_MAGIC = b"ONTOSPY-CACHE-1 "
+
+
+class CacheChecksumError(Exception):
+    """A cached file is truncated or corrupted"""
+    pass
+
+
+class CacheLock(object):
+    """
+    Advisory inter-process lock for a cached item, eg
+
+    with CacheLock(pickledpath):
+        ..build the model and write it..
+
+    The lock is held on a separate file in the '.locks' subfolder, so that
+    the cached item itself can be replaced atomically. Lock files which are not
+    held are removed by cache_gc (see remove_stale_locks).
+    Note: on platforms without fcntl (windows) the lock is a no-op.
+    """
+
+    def __init__(self, path):
+        super(CacheLock, self).__init__()
+        folder, name = os.path.split(path)
+        self.lockpath = os.path.join(folder, ".locks", name + ".lock")
+        self._f = None
+
+    def acquire(self):
+        if fcntl is None:
+            return
+        folder = os.path.dirname(self.lockpath)
+        if not os.path.exists(folder):
+            try:
+                os.makedirs(folder)
+            except OSError:  # created by another process in the meantime
+                pass
+        while True:
+            self._f = self._open()
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+            # the file may have been removed by cache_gc while we were waiting
+            try:
+                if os.stat(self.lockpath).st_ino == os.fstat(self._f.fileno()).st_ino:
+                    return
+            except OSError:
+                pass
+            self.release()
+
+    def _open(self):
+        return open(self.lockpath, "a")
+
+    def release(self):
+        if self._f is not None:
+            try:
+                fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._f.close()
+                self._f = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def remove_stale_locks(cache_dir=None):
+    """
+    Remove the lock files (see CacheLock) no process is holding.
+    :return - the number of files removed
+    """
+    folder = os.path.join(cache_dir or ONTOSPY_LOCAL_CACHE, ".locks")
+    if fcntl is None or not os.path.isdir(folder):
+        return 0
+    removed = 0
+    for f in os.listdir(folder):
+        path = os.path.join(folder, f)
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):  # held
+            os.close(fd)
+            continue
+        try:
+            os.remove(path)  # waiting processes see it and lock a new file
+            removed += 1
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return removed
+
+
+def _cache_stamp(path):
+    """mtime of a cached item, or None if it does not exist"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _write_pickle(path, obj):
+    """pickle an object to <path>, prefixed by a checksum of the data"""
+    data = cPickle.dumps(obj, cPickle.HIGHEST_PROTOCOL)
+    checksum = hashlib.sha256(data).hexdigest().encode("ascii")
+    _write_atomic(path, CACHE_FILE_MAGIC + checksum + b"\n" + data)
+
+
+def _read_pickle(path):
+    """load an object pickled with _write_pickle, validating its checksum"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    header, sep, data = raw.partition(b"\n")
+    if not sep or not header.startswith(CACHE_FILE_MAGIC):
+        raise CacheChecksumError("Not a valid cache file: %s" % path)
+    checksum = header[len(CACHE_FILE_MAGIC):]
+    if hashlib.sha256(data).hexdigest().encode("ascii") != checksum:
+        raise CacheChecksumError("Checksum mismatch: %s" % path)
+    return cPickle.loads(data)
+
+
+# ===========
+#
+# Cache management utils
+#
+# ===========
+
+
+def get_cache_budget():
+    """Gets the max size (in bytes) allowed for the cache folder
+    :return - an int e.g. 524288000
+    note: the value is set in config.ini, section 'cache', option 'max_size'
+    """
+    config = SafeConfigParser()
+    config.read(ONTOSPY_LOCAL + '/config.ini')
+    try:
+        return int(config.get('cache', 'max_size'))
+    except:
+        return ONTOSPY_CACHE_MAX_SIZE_DEFAULT
+
+
+def get_memory_cache_budget():
+    """Gets the max size (in bytes) allowed for the models kept in memory
+    note: the value is set in config.ini, section 'cache', option 'memory_max_size'
+    """
+    config = SafeConfigParser()
+    config.read(ONTOSPY_LOCAL + '/config.ini')
+    try:
+        return int(config.get('cache', 'memory_max_size'))
+    except:
+        return ONTOSPY_MEMORY_CACHE_MAX_SIZE_DEFAULT
+
+
+class ModelsCache(object):
+    """
+    In-memory LRU of loaded Ontospy models, shared by the shell and by
+    library level calls like get_pickled_ontology.
+
+    Items are keyed by file name and carry a <stamp> (the mtime of the pickle
+    they were loaded from) so that a model cached again by another process is
+    not served from memory.
+    The size of a model is estimated from the size of its pickle.
+    """
+
+    def __init__(self, max_size=None):
+        super(ModelsCache, self).__init__()
+        self.max_size = max_size  # None = read from config.ini
+        self._items = OrderedDict()  # key => (model, size, stamp)
+        self._lock = threading.RLock()
+        self._loading = {}  # key => (threading.Event, loader thread), for models being prefetched
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def budget(self):
+        if self.max_size is None:
+            return get_memory_cache_budget()
+        return self.max_size
+
+    def size(self):
+        with self._lock:
+            return sum([x[1] for x in self._items.values()])
+
+    def get(self, key, stamp=None):
+        """return a model (and mark it as most recently used) or None"""
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if stamp is not None and item[2] != stamp:
+                del self._items[key]
+                return None
+            # move to the end = most recently used
+            del self._items[key]
+            self._items[key] = item
+            return item[0]
+
+    def put(self, key, model, size, stamp=None):
+        """add a model, then evict least recently used ones till all fit the budget"""
+        budget = self.budget()
+        with self._lock:
+            self._items.pop(key, None)
+            if size > budget:
+                return False
+            self._items[key] = (model, size, stamp)
+            total = sum([x[1] for x in self._items.values()])
+            while total > budget:
+                oldkey, olditem = next(iter(self._items.items()))
+                del self._items[oldkey]
+                total -= olditem[1]
+            return True
+
+    def discard(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def prefetch(self, key, loader):
+        """run <loader(key)> in a background thread, unless the model is already available"""
+        event = threading.Event()
+
+        def _run():
+            try:
+                loader(key)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+                event.set()
+
+        t = threading.Thread(target=_run, name="ontospy-prefetch")
+        t.daemon = True
+        with self._lock:
+            if key in self._items or key in self._loading:
+                return False
+            self._loading[key] = (event, t)
+        t.start()
+        return True
+
+    def wait_prefetch(self, key, timeout=None):
+        """if <key> is being prefetched by another thread, wait till it's done"""
+        item = self._loading.get(key)
+        if item is not None and item[1] is not threading.current_thread():
+            item[0].wait(timeout)
+
+
+MODELS_CACHE = ModelsCache()
+
+
+def _touch_cache_entry(path):
+    """
+    Mark a cached item as just used. The access time is set explicitly as
+    many file systems are mounted with 'noatime'
+    """
+    try:
+        os.utime(path, (time.time(), os.path.getmtime(path)))
+    except OSError:
+        pass
+
+
+def _remove_cache_entry(path):
+    """Delete a cached item - another process may have removed it already"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _folder_size(folder):
+    """Total size in bytes of all the files in a folder (walked recursively)"""
+    size = 0
+    for root, dirs, files in os.walk(folder):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+    return size
+
+
+def get_cache_entries(cache_dir=None):
+    """
+    returns a list of dicts describing the items in the cache folder,
+    sorted by last access time (least recently used first)
+
+    [{'name': '4f2a..', 'path': '/Users/mac/.ontospy/.cache/v1.9.5/4f2a...pickle',
+        'size': 104532, 'atime': 1539940000.0}, ...]
+
+    note: names are cache keys, ie the sha256 of the models contents (see _cache_key)
+    """
+    cache_dir = cache_dir or ONTOSPY_LOCAL_CACHE
+    out = []
+    if os.path.isdir(cache_dir):
+        for f in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, f)
+            if f.endswith(".pickle") and os.path.isfile(path):
+                st = os.stat(path)
+                out += [{
+                    'name': f[:-len(".pickle")],
+                    'path': path,
+                    'size': st.st_size,
+                    'atime': max(st.st_atime, st.st_mtime),
+                }]
+    return sorted(out, key=lambda x: x['atime'])
+
+
+def _library_keys(library, library_dir=None):
+    """the cache keys of a list of models in the local library"""
+    library_dir = library_dir or get_home_location()
+    index = get_library_index(library_dir)
+    keys = set([_cache_key(x, library_dir, index) for x in library])
+    flush_library_index(index, library_dir)
+    return keys
+
+
+def cache_gc(max_size=None, keep=None, cache_dir=None, cache_top=None, library=None, library_dir=None):
+    """
+    Clean up the cache folder (an explicit command: see 'library --cache-gc'):
+    1) remove the cache folders of other ontospy versions
+    2) remove cached items whose model is not in the local library anymore,
+       and lock files no process is holding
+    3) remove the least recently used items till the cache fits <max_size> bytes
+    note: models statistics are kept when a model is evicted (see save_ontology_stats)
+
+    <keep>: list of paths that must not be evicted (eg the item just cached)
+    <library>: list of file names in the local library (defaults to get_localontologies())
+    <library_dir>: location of the local library (defaults to get_home_location())
+
+    :return - a dict summarising what has been removed
+    """
+    cache_dir = cache_dir or ONTOSPY_LOCAL_CACHE
+    cache_top = cache_top or ONTOSPY_LOCAL_CACHE_TOP
+    if max_size is None:
+        max_size = get_cache_budget()
+    if library is None:
+        library = get_localontologies()
+    keys = _library_keys(library, library_dir)
+    keep = keep or []
+    report = {'versions': [], 'orphans': [], 'evicted': [], 'locks': 0, 'freed': 0}
+
+    # 1) old versions
+    if os.path.isdir(cache_top):
+        for d in os.listdir(cache_top):
+            path = os.path.join(cache_top, d)
+            if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(cache_dir):
+                report['freed'] += _folder_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+                report['versions'] += [d]
+
+    # 2) orphans, and temp files left by interrupted writes
+    if os.path.isdir(cache_dir):
+        for f in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, f)
+            if f.startswith(".tmp-") and f.endswith(".part"):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if time.time() - st.st_mtime > 3600:
+                    _remove_cache_entry(path)
+                    report['freed'] += st.st_size
+            elif f.endswith(".stats.json") and f[:-len(".stats.json")] not in keys:
+                try:
+                    report['freed'] += os.path.getsize(path)
+                except OSError:
+                    continue
+                _remove_cache_entry(path)
+    entries = []
+    for entry in get_cache_entries(cache_dir):
+        if entry['name'] not in keys and entry['path'] not in keep:
+            _remove_cache_entry(entry['path'])
+            report['freed'] += entry['size']
+            report['orphans'] += [entry['name']]
+        else:
+            entries += [entry]
+    report['locks'] = remove_stale_locks(cache_dir)
+
+    # 3) LRU eviction
+    evicted = _evict_lru(entries, max_size, keep)
+    report['evicted'] = [x['name'] for x in evicted]
+    report['freed'] += sum([x['size'] for x in evicted])
+
+    return report
+
+
+def _evict_lru(entries, max_size, keep):
+    """
+    remove the least recently used of <entries> (see get_cache_entries) till
+    they fit <max_size> bytes. Returns the removed entries
+    """
+    total = sum([x['size'] for x in entries])
+    out = []
+    for entry in entries:
+        if total <= max_size:
+            break
+        if entry['path'] in keep:
+            continue
+        _remove_cache_entry(entry['path'])
+        total -= entry['size']
+        out += [entry]
+    return out
+
+
+def enforce_cache_budget(max_size=None, keep=None, cache_dir=None):
+    """
+    Remove the least recently used items of the cache folder of this ontospy
+    version till it fits <max_size> bytes (defaults to the cache budget).
+    Run every time a model is cached: the folders of other versions, which
+    may belong to another ontospy install, are left alone (see cache_gc)
+
+    :return - the names of the evicted items
+    """
+    if max_size is None:
+        max_size = get_cache_budget()
+    evicted = _evict_lru(get_cache_entries(cache_dir), max_size, keep or [])
+    return [x['name'] for x in evicted]
+
+
+def get_cache_stats(cache_dir=None, cache_top=None, library=None, library_dir=None):
+    """
+    Info about the cache folder, without changing it.
+    :return - a dict eg
+    {'location': '/Users/mac/.ontospy/.cache/v1.9.5', 'budget': 524288000, 'size': 2210432,
+        'items': 8, 'orphans': 1, 'orphans_size': 10422, 'versions': 2, 'versions_size': 1821200,
+        'entries': [..see get_cache_entries..]}
+    """
+    cache_dir = cache_dir or ONTOSPY_LOCAL_CACHE
+    cache_top = cache_top or ONTOSPY_LOCAL_CACHE_TOP
+    if library is None:
+        library = get_localontologies()
+    entries = get_cache_entries(cache_dir)
+    keys = _library_keys(library, library_dir)
+    orphans = [x for x in entries if x['name'] not in keys]
+    versions = []
+    if os.path.isdir(cache_top):
+        for d in os.listdir(cache_top):
+            path = os.path.join(cache_top, d)
+            if os.path.isdir(path) and os.path.abspath(path) != os.path.abspath(cache_dir):
+                versions += [path]
+    return {
+        'location': cache_dir,
+        'budget': get_cache_budget(),
+        'size': sum([x['size'] for x in entries]),
+        'items': len(entries),
+        'orphans': len(orphans),
+        'orphans_size': sum([x['size'] for x in orphans]),
+        'versions': len(versions),
+        'versions_size': sum([_folder_size(x) for x in versions]),
+        'entries': entries,
+    }
@@ -25,7 +25,20 @@ import rdflib
 from .utils import *
 from .rdf_loader import RDFLoader
 from .entities import *
-from .sparqlHelper import SparqlHelper
+from .sparqlHelper import SparqlHelper, QueryTimeout, QueryMemo, iter_results
+from .terms import TermDictionary, TermRelation
+from .search import SearchIndex
+from .expressions import ClassExpressionIndex
+
+
+# the type kept for a class declared with more than one, best first (then any other)
+CLASS_TYPES_PRECEDENCE = [rdflib.OWL.Class, rdflib.RDFS.Class]
+
+
+def _classTypeRank(aType):
+    if aType in CLASS_TYPES_PRECEDENCE:
+        return CLASS_TYPES_PRECEDENCE.index(aType)
+    return len(CLASS_TYPES_PRECEDENCE)
 
 
 class Ontospy(object):
@@ -54,9 +67,19 @@ class Ontospy(object):
 
     """
 
-    def __init__(self, uri_or_path=None, data=None, file_obj=None, rdf_format="", verbose=False, hide_base_schemas=True, sparql_endpoint=None, credentials=None, build_all=True):
+    def __init__(self, uri_or_path=None, data=None, file_obj=None, rdf_format="", verbose=False, hide_base_schemas=True, sparql_endpoint=None, credentials=None, build_all=True, page_size=None, concurrency=None, rate_limit=None, query_cache=None, budget_seconds=None):
         """
         Load the graph in memory, then setup all necessary attributes.
+
+        <page_size>: with sparql endpoints, max number of results requested at a time
+            when listing entities (see SparqlHelper)
+        <concurrency>: with sparql endpoints, max number of requests sent at the same time
+        <rate_limit>: with sparql endpoints, max number of requests sent per second
+        <query_cache>: with sparql endpoints, a QueryCache where query results are kept
+            across sessions (see SparqlHelper)
+        <budget_seconds>: time allowed to the queries used to build the model. Once it's
+            over, entities are no longer added or described: the model is partial, and
+            `completeness` tells which parts are missing
         """
         super(Ontospy, self).__init__()
 
@@ -65,7 +88,9 @@ class Ontospy(object):
         self.credentials = None  # tuple: auth credentials for endpoint if needed
         self.sources = None
         self.sparqlHelper = None
-        self.namespaces = []
+        self.namespaces = NamespaceIndex()
+        self.parse_time = None  # seconds taken to load and build the model
+        self.completeness = {}  # phase name => what was found and what was skipped, see build_all
         # entities buckets start with 'all_'
         self.all_ontologies = []
         self.all_classes = []
@@ -80,15 +105,30 @@ class Ontospy(object):
         self.toplayer_properties = []
         self.toplayer_skos = []
         self.toplayer_shapes = []
+        # integer ids for the entities URIs, and relations between them (see terms.py)
+        self.terms = TermDictionary()
+        self.class_hierarchy = None
+        self.property_hierarchy = None
+        self.skos_hierarchy = None
+        self.property_domains = None
+        self.property_ranges = None
+        self.class_expressions = None  # ClassExpressionIndex, see build_class_expressions
+        self._search_indexes = {}  # see __search
+        self.query_memo = None  # QueryMemo used by iter_query(memoize=True), created on first use
         self.OWLTHING = OntoClass(rdflib.OWL.Thing, rdflib.OWL.Class, self.namespaces)
 
         # finally:
         if uri_or_path or data or file_obj:
+            sTime = time.time()
             self.load_rdf(uri_or_path, data, file_obj, rdf_format, verbose, hide_base_schemas)
+            self.sparqlHelper.setBudget(budget_seconds)
             if build_all:
                 self.build_all(verbose=verbose, hide_base_schemas=hide_base_schemas)
+            self.parse_time = time.time() - sTime
         elif sparql_endpoint:  # by default entities are not extracted
-            self.load_sparql(sparql_endpoint, verbose, hide_base_schemas, credentials)
+            self.load_sparql(sparql_endpoint, verbose, hide_base_schemas, credentials, page_size,
+                             concurrency, rate_limit, query_cache)
+            self.sparqlHelper.setBudget(budget_seconds)
         else:
             pass
 
@@ -99,9 +139,9 @@ class Ontospy(object):
         note: if it's a sparql backend, limit the info returned to avoid long queries (tip: a statement like `if self.rdflib_graph` on a sparql endpoint is enough to cause a long query!)
 
         """
-        if self.sparql_endpoint and self.rdflib_graph != None:
+        if self.sparql_endpoint and self.rdflib_graph is not None:
             return "<Ontospy Graph (sparql endpoint = <%s>)>" % self.sparql_endpoint
-        elif self.rdflib_graph != None:
+        elif self.rdflib_graph is not None:
             return "<Ontospy Graph (%d triples)>" % (len(self.rdflib_graph))
         else:
             return "<Ontospy object created but not initialized (use the `load_rdf` method to load an rdf schema)>"
@@ -113,9 +153,11 @@ class Ontospy(object):
         self.rdflib_graph = loader.rdflib_graph
         self.sources = loader.sources_valid
         self.sparqlHelper = SparqlHelper(self.rdflib_graph)
-        self.namespaces = sorted(self.rdflib_graph.namespaces())
+        self.namespaces = NamespaceIndex(sorted(self.rdflib_graph.namespaces()))
+        self.query_memo = None
 
-    def load_sparql(self, sparql_endpoint, verbose=False, hide_base_schemas=True, credentials=None):
+    def load_sparql(self, sparql_endpoint, verbose=False, hide_base_schemas=True, credentials=None, page_size=None,
+                    concurrency=None, rate_limit=None, query_cache=None):
         """
         Set up a SPARQLStore backend as a virtual ontospy graph
 
@@ -131,12 +173,15 @@ class Ontospy(object):
                 graph.store.setCredentials(credentials[0], credentials[1])
                 # graph.store.setHTTPAuth('BASIC') # graph.store.setHTTPAuth('DIGEST')
 
-            graph.open(sparql_endpoint)
+            # (query, update) tuple: rdflib 5 fails to open an update store from a single url
+            graph.open((sparql_endpoint, sparql_endpoint))
             self.rdflib_graph = graph
             self.sparql_endpoint = sparql_endpoint
             self.sources = [sparql_endpoint]
-            self.sparqlHelper = SparqlHelper(self.rdflib_graph, self.sparql_endpoint)
-            self.namespaces = sorted(self.rdflib_graph.namespaces())
+            self.sparqlHelper = SparqlHelper(self.rdflib_graph, self.sparql_endpoint, page_size,
+                                             concurrency=concurrency, rate_limit=rate_limit,
+                                             credentials=credentials, query_cache=query_cache)
+            self.namespaces = NamespaceIndex(sorted(self.rdflib_graph.namespaces()))
         except:
             printDebug("Error trying to connect to Endpoint.")
             raise
@@ -150,6 +195,14 @@ class Ontospy(object):
     def build_all(self, verbose=False, hide_base_schemas=True):
         """
         Extract all ontology entities from an RDF graph and construct Python representations of them.
+
+        Each phase (ontologies, classes, properties, skos, shapes) is reported in
+        `completeness`, eg
+
+        {'classes': {'complete': False, 'listed': True, 'found': 120, 'skipped': [uris..]}}
+
+        where 'listed' is False if not all entities were found, and 'skipped' has the
+        entities found but not described, because the time budget was over.
         """
         if verbose:
             printDebug("Scanning entities...", "green")
@@ -159,6 +212,8 @@ class Ontospy(object):
         if verbose:
             printDebug("Ontologies.........: %d" % len(self.all_ontologies), "comment")
 
+        self.build_class_expressions()
+
         self.build_classes(hide_base_schemas)
         if verbose:
             printDebug("Classes............: %d" % len(self.all_classes), "comment")
@@ -188,6 +243,91 @@ class Ontospy(object):
         if verbose:
             printDebug("----------", "comment")
 
+    def __startPhase(self, phase):
+        """ the completeness report for a build phase: see build_all """
+        self.completeness[phase] = {'complete': True, 'listed': True, 'found': 0, 'skipped': []}
+        return self.completeness[phase]
+
+    def __listingStopped(self, report):
+        report['complete'], report['listed'] = False, False
+
+    def __listing(self, results, report):
+        """
+        Yields the query results listing the entities of a phase (<results> is an
+        iterable, or a function returning it) till the time budget is over.
+        """
+        try:
+            if callable(results):
+                results = results()
+            for row in results:
+                yield row
+        except QueryTimeout:
+            self.__listingStopped(report)
+
+    def is_complete(self):
+        """ False if some entities were left out when building the model (see build_all) """
+        return all([x['complete'] for x in self.completeness.values()])
+
+    def __entitiesDetails(self, entities, supers=None, report=None):
+        """
+        Yields (entity, triples, directSupers) for a list of entities, where <supers>
+        is the name of the SparqlHelper method returning the direct supers of an entity.
+
+        With sparql endpoints these are fetched for a batch of entities at a time, so
+        that the number of requests depends on the number of batches rather than
+        entities (see SparqlHelper.batch_size), and several batches are fetched
+        concurrently (see SparqlHelper.concurrency).
+
+        If the time budget is over, the remaining entities are added to the 'skipped'
+        list of <report>.
+        """
+        if report is not None:
+            report['found'] = len(entities)
+        done = 0
+        try:
+            for entity, triples, directSupers in self.__fetchDetails(entities, supers):
+                yield entity, triples, directSupers
+                done += 1
+        except QueryTimeout:
+            if report is None:
+                raise
+            report['complete'] = False
+            report['skipped'] = [x.uri for x in entities[done:]]
+
+    def __fetchDetails(self, entities, supers=None):
+        """ see __entitiesDetails """
+        helper = self.sparqlHelper
+
+        def fetch_one(entity):
+            directSupers = getattr(helper, supers)(entity.uri) if supers else []
+            return helper.entityTriples(entity.uri), directSupers
+
+        def fetch_batch(batch):
+            uris = [x.uri for x in batch if not isBlankNode(x.uri)]
+            triples = helper.entityTriplesBatch(uris) if uris else {}
+            if supers and uris:
+                directSupers = getattr(helper, supers + "Batch")(uris)
+            else:
+                directSupers = {}
+            out = []
+            for entity in batch:
+                if entity.uri in triples:
+                    out += [(triples[entity.uri], directSupers.get(entity.uri, []))]
+                else:  # blank nodes
+                    out += [fetch_one(entity)]
+            return out
+
+        batch_size = helper.batch_size
+        if not batch_size:
+            for entity, details in zip(entities, helper.imap(fetch_one, entities)):
+                yield entity, details[0], details[1]
+            return
+
+        batches = [entities[i:i + batch_size] for i in range(0, len(entities), batch_size)]
+        for batch, details in zip(batches, helper.imap(fetch_batch, batches)):
+            for entity, (triples, directSupers) in zip(batch, details):
+                yield entity, triples, directSupers
+
     def build_ontologies(self, exclude_BNodes=False, return_string=False):
         """
         Extract ontology instances info from the graph, then creates python objects for them.
@@ -201,8 +341,13 @@ class Ontospy(object):
         Hence there is some logic to deal with these edge cases.
         """
         out = []
+        report = self.__startPhase("ontologies")
 
-        qres = self.sparqlHelper.getOntology()
+        try:
+            qres = self.sparqlHelper.getOntology()
+        except QueryTimeout:
+            self.__listingStopped(report)
+            qres = []
 
         if qres:
             # NOTE: SPARQL returns a list of rdflib.query.ResultRow (~ tuples..)
@@ -242,10 +387,21 @@ class Ontospy(object):
 
         # finally... add all annotations/triples
         self.all_ontologies = out
-        for onto in self.all_ontologies:
-            onto.triples = self.sparqlHelper.entityTriples(onto.uri)
+        for onto, triples, _ in self.__entitiesDetails(self.all_ontologies, report=report):
+            onto.triples = triples
             onto._buildGraph()  # force construction of mini graph
 
+    def build_class_expressions(self):
+        """
+        Parse the class expressions (owl:Restriction, owl:unionOf etc..) of the graph,
+        and index them by property and by the classes they define: see
+        ClassExpressionIndex. Only for local graphs, as it reads all the triples once.
+        """
+        if self.sparql_endpoint:
+            self.class_expressions = None
+        else:
+            self.class_expressions = ClassExpressionIndex(self.rdflib_graph, self.namespaces)
+
     #
     #  RDFS:class vs OWL:class cf. http://www.w3.org/TR/owl-ref/ section 3.1
     #
@@ -263,10 +419,14 @@ class Ontospy(object):
         """
 
         self.all_classes = []  # @todo: keep adding?
+        classes_by_uri = {}  # same as get_class(uri=..), without scanning all_classes
+        report = self.__startPhase("classes")
 
-        qres = self.sparqlHelper.getAllClasses(hide_base_schemas=hide_base_schemas)
+        # results are streamed in, a page at a time with sparql endpoints
+        # (the query is sent from __listing, which stops it when the time budget is over)
+        qres = lambda: self.sparqlHelper.iterAllClasses(hide_base_schemas=hide_base_schemas)
 
-        for class_tuple in qres:
+        for class_tuple in self.__listing(qres, report):
 
             _uri = class_tuple[0]
             try:
@@ -274,20 +434,21 @@ class Ontospy(object):
             except:
                 _type = ""
 
-            test_existing_cl = self.get_class(uri=_uri)
+            test_existing_cl = classes_by_uri.get(_uri.lower())
             if not test_existing_cl:
                 # create it
                 ontoclass = OntoClass(_uri, _type, self.namespaces)
                 self.all_classes += [ontoclass]
-            else:
-                # if OWL.Class over RDFS.Class - update it
-                if _type == rdflib.OWL.Class:
-                    test_existing_cl.rdftype = rdflib.OWL.Class
+                classes_by_uri[_uri.lower()] = ontoclass
+            elif _classTypeRank(_type) < _classTypeRank(test_existing_cl.rdftype):
+                # eg OWL.Class over RDFS.Class - update it, whatever the rows order
+                test_existing_cl.rdftype = _type
+                test_existing_cl.rdftype_qname = test_existing_cl._build_qname(_type)
 
         # add more data
-        for aClass in self.all_classes:
+        for aClass, triples, directSupers in self.__entitiesDetails(self.all_classes, "getClassDirectSupers", report):
 
-            aClass.triples = self.sparqlHelper.entityTriples(aClass.uri)
+            aClass.triples = triples
             aClass._buildGraph()  # force construction of mini graph
 
             aClass.sparqlHelper = self.sparqlHelper
@@ -300,10 +461,8 @@ class Ontospy(object):
                     aClass.ontology = onto
 
             # add direct Supers
-            directSupers = self.sparqlHelper.getClassDirectSupers(aClass.uri)
-
             for x in directSupers:
-                superclass = self.get_class(uri=x[0])
+                superclass = classes_by_uri.get(x[0].lower())
                 # note: extra condition to avoid recursive structures
                 if superclass and superclass.uri != aClass.uri:
                     aClass._parents.append(superclass)
@@ -314,6 +473,7 @@ class Ontospy(object):
 
         # sort alphabetically
         self.all_classes = sorted(self.all_classes, key=lambda x: x.qname)
+        self.class_hierarchy = self.__indexHierarchy(self.all_classes)
 
         # compute top layer
         exit = []
@@ -333,25 +493,33 @@ class Ontospy(object):
 
         """
         self.all_properties = []  # @todo: keep adding?
+        for aClass in self.all_classes:  # filled again by __buildDomainRanges
+            aClass.domain_of, aClass.range_of = [], []
         self.all_properties_annotation = []
         self.all_properties_object = []
         self.all_properties_datatype = []
+        props_by_uri = {}  # same as get_property(uri=..), without scanning all_properties
+        report = self.__startPhase("properties")
 
-        qres = self.sparqlHelper.getAllProperties()
+        # results are streamed in, a page at a time with sparql endpoints
+        # (the query is sent from __listing, which stops it when the time budget is over)
+        qres = self.sparqlHelper.iterAllProperties
 
-        for candidate in qres:
+        for candidate in self.__listing(qres, report):
 
-            test_existing_prop = self.get_property(uri=candidate[0])
+            test_existing_prop = props_by_uri.get(candidate[0].lower())
             if not test_existing_prop:
                 # create it
-                self.all_properties += [OntoProperty(candidate[0], candidate[1], self.namespaces)]
+                aProp = OntoProperty(candidate[0], candidate[1], self.namespaces)
+                self.all_properties += [aProp]
+                props_by_uri[candidate[0].lower()] = aProp
             else:
                 # update it
                 if candidate[1] and (test_existing_prop.rdftype == rdflib.RDF.Property):
                     test_existing_prop.rdftype = inferMainPropertyType(candidate[1])
 
         # add more data
-        for aProp in self.all_properties:
+        for aProp, triples, directSupers in self.__entitiesDetails(self.all_properties, "getPropDirectSupers", report):
 
             if aProp.rdftype == rdflib.OWL.DatatypeProperty:
                 self.all_properties_datatype += [aProp]
@@ -362,7 +530,7 @@ class Ontospy(object):
             else:
                 pass
 
-            aProp.triples = self.sparqlHelper.entityTriples(aProp.uri)
+            aProp.triples = triples
             aProp._buildGraph()  # force construction of mini graph
 
             # attach to an ontology [2015-06-15: no property type distinction yet]
@@ -375,10 +543,8 @@ class Ontospy(object):
             self.__buildDomainRanges(aProp)
 
             # add direct Supers
-            directSupers = self.sparqlHelper.getPropDirectSupers(aProp.uri)
-
             for x in directSupers:
-                superprop = self.get_property(uri=x[0])
+                superprop = props_by_uri.get(x[0].lower())
                 # note: extra condition to avoid recursive structures
                 if superprop and superprop.uri != aProp.uri:
                     aProp._parents.append(superprop)
@@ -389,6 +555,8 @@ class Ontospy(object):
 
         # sort alphabetically
         self.all_properties = sorted(self.all_properties, key=lambda x: x.qname)
+        self.property_hierarchy = self.__indexHierarchy(self.all_properties)
+        self.__indexDomainRanges()
 
         # computer top layer for properties
         exit = []
@@ -402,8 +570,9 @@ class Ontospy(object):
         2015-08-19: first draft
         """
         self.all_skos_concepts = []  # @todo: keep adding?
+        report = self.__startPhase("skos")
 
-        qres = self.sparqlHelper.getSKOSInstances()
+        qres = self.__listing(self.sparqlHelper.getSKOSInstances, report)
 
         for candidate in qres:
 
@@ -417,10 +586,10 @@ class Ontospy(object):
         # add more data
         skos = rdflib.Namespace('http://www.w3.org/2004/02/skos/core#')
 
-        for aConcept in self.all_skos_concepts:
+        for aConcept, triples, directSupers in self.__entitiesDetails(self.all_skos_concepts, "getSKOSDirectSupers", report):
 
             aConcept.rdftype = skos['Concept']
-            aConcept.triples = self.sparqlHelper.entityTriples(aConcept.uri)
+            aConcept.triples = triples
             aConcept._buildGraph()  # force construction of mini graph
 
             aConcept.sparqlHelper = self.sparqlHelper
@@ -433,8 +602,6 @@ class Ontospy(object):
                     aConcept.ontology = onto
 
             # add direct Supers
-            directSupers = self.sparqlHelper.getSKOSDirectSupers(aConcept.uri)
-
             for x in directSupers:
                 superclass = self.get_skos(uri=x[0])
                 # note: extra condition to avoid recursive structures
@@ -447,6 +614,7 @@ class Ontospy(object):
 
         # sort alphabetically
         self.all_skos_concepts = sorted(self.all_skos_concepts, key=lambda x: x.qname)
+        self.skos_hierarchy = self.__indexHierarchy(self.all_skos_concepts)
 
         # compute top layer for skos
         exit = []
@@ -464,8 +632,9 @@ class Ontospy(object):
         if available.
         """
         self.all_shapes = []  # @todo: keep adding?
+        report = self.__startPhase("shapes")
 
-        qres = self.sparqlHelper.getShapes()
+        qres = self.__listing(self.sparqlHelper.getShapes, report)
 
         for candidate in qres:
 
@@ -479,10 +648,10 @@ class Ontospy(object):
         # add more data
         shacl = rdflib.Namespace('http://www.w3.org/ns/shacl#')
 
-        for aShape in self.all_shapes:
+        for aShape, triples, _ in self.__entitiesDetails(self.all_shapes, report=report):
 
             aShape.rdftype = shacl['Shape']
-            aShape.triples = self.sparqlHelper.entityTriples(aShape.uri)
+            aShape.triples = triples
             aShape._buildGraph()  # force construction of mini graph
 
             aShape.sparqlHelper = self.sparqlHelper
@@ -558,7 +727,7 @@ class Ontospy(object):
 
         for x in domains:
             if isBlankNode(x):
-                aProp.domains += [RDF_Entity(x, None, self.namespaces, is_Bnode=True)]
+                aProp.domains += [self.__blankNodeEntity(x)]
             else:
                 aClass = self.get_class(uri=str(x))
                 if aClass:
@@ -570,7 +739,7 @@ class Ontospy(object):
 
         for x in ranges:
             if isBlankNode(x):
-                aProp.domains += [RDF_Entity(x, None, self.namespaces, is_Bnode=True)]
+                aProp.ranges += [self.__blankNodeEntity(x)]
             else:
                 aClass = self.get_class(uri=str(x))
                 if aClass:
@@ -582,6 +751,57 @@ class Ontospy(object):
                     # the main index
                     aProp.ranges += [OntoClass(x, None, self.namespaces, ext_model=True)]
 
+    def __blankNodeEntity(self, node):
+        """ an entity for a blank node, eg a union of classes in a range, with its parsed expression """
+        entity = RDF_Entity(node, None, self.namespaces, is_Bnode=True)
+        if self.class_expressions is not None:
+            entity.expression = self.class_expressions.get(node)
+        return entity
+
+    def __indexHierarchy(self, entities):
+        """
+        Give <entities> a term id, and index their parents and children as a
+        TermRelation: it then replaces their lists, and parents(), children(),
+        ancestors() and descendants() all read it
+        """
+        for x in entities:
+            x.term_id = self.terms.id(x.uri)
+        parents = dict([(x.term_id, [y.term_id for y in x.parents()]) for x in entities])
+        children = dict([(x.term_id, [y.term_id for y in x.children()]) for x in entities])
+        hierarchy = TermRelation(len(self.terms), parents, children,
+                                 dict([(x.term_id, x) for x in entities]))
+        for x in entities:
+            x._hierarchy = hierarchy
+            x._parents, x._children = None, None
+        return hierarchy
+
+    def __indexDomainRanges(self):
+        """
+        Index the domains and ranges of the properties as TermRelations, which then
+        replace the lists of OntoProperty.domains / ranges and of OntoClass.domain_of /
+        range_of (see IndexedEntities)
+        """
+        for name, inverse_name, relation_name in [("domains", "domain_of", "_domainIndex"),
+                                                  ("ranges", "range_of", "_rangeIndex")]:
+            rows, inverse_rows, entities = {}, {}, {}
+            for aProp in self.all_properties:
+                ids = []
+                for x in getattr(aProp, name):
+                    if x.term_id is None:  # blank nodes, classes from other models
+                        x.term_id = self.terms.id(x.uri)
+                    entities.setdefault(x.term_id, x)
+                    ids.append(x.term_id)
+                rows[aProp.term_id] = ids
+                entities[aProp.term_id] = aProp
+            for aClass in self.all_classes:
+                inverse_rows[aClass.term_id] = [x.term_id for x in getattr(aClass, inverse_name)]
+            relation = TermRelation(len(self.terms), rows, inverse_rows, entities)
+            for entities_list, attr in [(self.all_properties, name), (self.all_classes, inverse_name)]:
+                for x in entities_list:
+                    x.__dict__.pop(attr, None)
+                    setattr(x, relation_name, relation)
+            setattr(self, "property_" + name, relation)
+
     def __computeTopLayer(self):
         """
         deprecated: now this is calculated when entities get extracted
@@ -642,7 +862,7 @@ class Ontospy(object):
 
             # add properties from Owl:Thing ie the inference layer
 
-            topLevelProps = [p for p in self.all_properties if p.domains == []]
+            topLevelProps = [p for p in self.all_properties if not p.domains]
             if topLevelProps:
                 _list.append({self.OWLTHING: topLevelProps})
 
@@ -654,7 +874,7 @@ class Ontospy(object):
 
             # add properties from Owl:Thing ie the inference layer
 
-            topLevelProps = [p for p in self.all_properties if p.ranges == []]
+            topLevelProps = [p for p in self.all_properties if not p.ranges]
             if topLevelProps:
                 _list.append({self.OWLTHING: topLevelProps})
 
@@ -666,7 +886,7 @@ class Ontospy(object):
     # methods for retrieving objects
     # ================
 
-    def get_class(self, id=None, uri=None, match=None):
+    def get_class(self, id=None, uri=None, match=None, limit=None, fuzzy=False):
         """
         get the saved-class with given ID or via other methods...
 
@@ -680,10 +900,12 @@ class Ontospy(object):
 
         In [3]: g.get_class(match="person")
         Out[3]:
-        [<Class *http://purl.org/ontology/bibo/PersonalCommunicationDocument*>,
+        [<Class *http://xmlns.com/foaf/0.1/Person*>,
          <Class *http://purl.org/ontology/bibo/PersonalCommunication*>,
-         <Class *http://xmlns.com/foaf/0.1/Person*>]
+         <Class *http://purl.org/ontology/bibo/PersonalCommunicationDocument*>]
 
+        Matches are looked up in URIs, qnames and labels, and ranked (see SearchIndex):
+        <limit> is the max number of results, <fuzzy> adds near matches (eg typos).
         """
 
         if not id and not uri and not match:
@@ -698,16 +920,7 @@ class Ontospy(object):
         if match:
             if type(match) != type("string"):
                 return []
-            res = []
-            if ":" in match:  # qname
-                for x in self.all_classes:
-                    if match.lower() in x.qname.lower():
-                        res += [x]
-            else:
-                for x in self.all_classes:
-                    if match.lower() in x.uri.lower():
-                        res += [x]
-            return res
+            return self.__search("classes", match, limit, fuzzy)
         else:
             for x in self.all_classes:
                 if id and x.id == id:
@@ -716,7 +929,7 @@ class Ontospy(object):
                     return x
             return None
 
-    def get_property(self, id=None, uri=None, match=None):
+    def get_property(self, id=None, uri=None, match=None, limit=None, fuzzy=False):
         """
         get the saved-class with given ID or via other methods...
 
@@ -735,16 +948,7 @@ class Ontospy(object):
         if match:
             if type(match) != type("string"):
                 return []
-            res = []
-            if ":" in match:  # qname
-                for x in self.all_properties:
-                    if match.lower() in x.qname.lower():
-                        res += [x]
-            else:
-                for x in self.all_properties:
-                    if match.lower() in x.uri.lower():
-                        res += [x]
-            return res
+            return self.__search("properties", match, limit, fuzzy)
         else:
             for x in self.all_properties:
                 if id and x.id == id:
@@ -753,7 +957,7 @@ class Ontospy(object):
                     return x
             return None
 
-    def get_skos(self, id=None, uri=None, match=None):
+    def get_skos(self, id=None, uri=None, match=None, limit=None, fuzzy=False):
         """
         get the saved skos concept with given ID or via other methods...
 
@@ -772,16 +976,7 @@ class Ontospy(object):
         if match:
             if type(match) != type("string"):
                 return []
-            res = []
-            if ":" in match:  # qname
-                for x in self.all_skos_concepts:
-                    if match.lower() in x.qname.lower():
-                        res += [x]
-            else:
-                for x in self.all_skos_concepts:
-                    if match.lower() in x.uri.lower():
-                        res += [x]
-            return res
+            return self.__search("skos", match, limit, fuzzy)
         else:
             for x in self.all_skos_concepts:
                 if id and x.id == id:
@@ -790,7 +985,7 @@ class Ontospy(object):
                     return x
             return None
 
-    def get_any_entity(self, id=None, uri=None, match=None):
+    def get_any_entity(self, id=None, uri=None, match=None, limit=None, fuzzy=False):
         """
         get a generic entity with given ID or via other methods...
         """
@@ -807,22 +1002,7 @@ class Ontospy(object):
         if match:
             if type(match) != type("string"):
                 return []
-            res = []
-            if ":" in match:  # qname
-                for x in self.all_classes:
-                    if match.lower() in x.qname.lower():
-                        res += [x]
-                for x in self.all_properties:
-                    if match.lower() in x.qname.lower():
-                        res += [x]
-            else:
-                for x in self.all_classes:
-                    if match.lower() in x.uri.lower():
-                        res += [x]
-                for x in self.all_properties:
-                    if match.lower() in x.uri.lower():
-                        res += [x]
-            return res
+            return self.__search("any", match, limit, fuzzy)
         else:
             for x in self.all_classes:
                 if id and x.id == id:
@@ -836,6 +1016,25 @@ class Ontospy(object):
                     return x
             return None
 
+    def __search(self, kind, match, limit=None, fuzzy=False):
+        """
+        Entities of <kind> (classes, properties, skos or any) matching a string. The
+        search index is built on first use, and again once the entities change.
+        """
+        sources = {
+            'classes': [self.all_classes],
+            'properties': [self.all_properties],
+            'skos': [self.all_skos_concepts],
+            'any': [self.all_classes, self.all_properties],
+        }[kind]
+        indexes = getattr(self, "_search_indexes", None)
+        if indexes is None:
+            indexes = self._search_indexes = {}
+        index = indexes.get(kind)
+        if index is None or not index.covers(*sources):
+            index = indexes[kind] = SearchIndex(*sources)
+        return index.search(match, limit, fuzzy)
+
     def get_ontology(self, id=None, uri=None, match=None):
         """
         get the saved-ontology with given ID or via other methods...
@@ -979,19 +1178,44 @@ class Ontospy(object):
         "for backward compatibility"
         return self.rdf_source(format)
 
-    def query(self, stringa):
-        """SPARQL query / wrapper for rdflib sparql query method """
-        qres = self.rdflib_graph.query(stringa)
-        return list(qres)
-    def sparql(self, stringa):
+    def query(self, stringa, memoize=False):
+        """SPARQL query / wrapper for rdflib sparql query method (see iter_query)"""
+        return list(self.iter_query(stringa, memoize))
+
+    def iter_query(self, stringa, memoize=False):
+        """
+        SPARQL query: yields the results one at a time, as rdflib produces them,
+        without collecting them first.
+
+        <memoize>: with local graphs, the results are kept in memory (see QueryMemo,
+            in `query_memo`) and returned again by the following calls, as long as
+            no triples are added to or removed from the graph. For read-only queries
+            run again and again.
+        """
+        if not memoize or self.sparql_endpoint:
+            return iter_results(self.rdflib_graph.query(stringa))
+        memo = getattr(self, "query_memo", None)
+        if memo is None or memo.graph is not self.rdflib_graph:
+            memo = self.query_memo = QueryMemo(self.rdflib_graph)
+        rows = memo.get(stringa)
+        if rows is None:
+            version = memo.version.value
+            rows = list(iter_results(self.rdflib_graph.query(stringa)))
+            memo.put(stringa, rows, version)
+        return iter(rows)
+
+    def sparql(self, stringa, memoize=False):
         "SPARQL query / replacement for query"
-        return self.query(stringa)
+        return self.query(stringa, memoize)
 
     def stats(self):
         """ shotcut to pull out useful info for a graph"""
         out = []
         out += [("Ontologies", len(self.all_ontologies))]
-        out += [("Triples", self.triplesCount())]
+        triples = self.triplesCount()
+        if self.sparql_endpoint and self.sparqlHelper.getTriplesCount()[0] is None:
+            triples = "n/a"  # the endpoint could not count them in time
+        out += [("Triples", triples)]
         out += [("Classes", len(self.all_classes))]
         out += [("Properties", len(self.all_properties))]
         out += [("Annotation Properties", len(self.all_properties_annotation))]
@@ -1003,12 +1227,31 @@ class Ontospy(object):
         out += [("Data Sources", len(self.sources))]
         return out
 
-    def triplesCount(self):
+    def instance_counts(self):
+        """
+        The number of instances of each class, as a dict {class uri: count}.
+
+        All counts are calculated at once (one GROUP BY query with sparql endpoints)
+        and cached on the classes, so that OntoClass.count() needs no more queries.
+        """
+        if [x for x in self.all_classes if getattr(x, "_instance_count", None) is None]:
+            counts = self.sparqlHelper.getInstanceCounts()
+            for aClass in self.all_classes:
+                aClass._instance_count = counts.get(aClass.uri, 0)
+        return dict([(x.uri, x._instance_count) for x in self.all_classes])
+
+    def triplesCount(self, refresh=False):
         """
 
         2016-08-18 the try/except is a dirty solution to a problem
         emerging with counting graph length on cached Graph objects..
+
+        With sparql endpoints the count may be an estimate, and it is calculated
+        once within a time limit (see SparqlHelper.getTriplesCount): pass <refresh>
+        to calculate it again.
         """
+        if self.sparql_endpoint:
+            return self.sparqlHelper.getTriplesCount(refresh=refresh)[0] or 0
         # @todo  investigate what's going on..
         # click.secho(unicode(type(self.rdflib_graph)), fg="red")
         try:
@@ -0,0 +1,158 @@
+# !/usr/bin/env python
+#  -*- coding: UTF-8 -*-
+
+"""
+Text search over the entities of an Ontospy model
+
+SearchIndex keeps the URIs, qnames and labels (see RDF_Entity.labels: the values of
+entities.LABEL_PREDICATES, in all languages) of a list of entities, lowercased, with an
+index of their trigrams. A query only looks at the texts having all its trigrams, so lookups
+don't get slower with the size of the model. Used by Ontospy.get_class(match=..) etc.
+
+##################
+#
+#  USAGE
+
+index = SearchIndex(o.all_classes)
+index.search("person", limit=10)  # => OntoClass objects, best matches first
+index.search("persn", fuzzy=True)  # also near matches
+
+##################
+
+"""
+
+from __future__ import print_function
+
+import re
+
+# how a text matches a query, best first
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING, FUZZY = 0, 1, 2, 3, 4
+
+# where a text comes from, best first when two matches are as good
+FIELD_LABEL, FIELD_QNAME, FIELD_URI = 0, 1, 2
+
+# min share of the query trigrams a text must have to be a fuzzy match
+FUZZY_MIN_SIMILARITY = 0.5
+
+_WORD_START = re.compile(r"[^0-9a-z]")
+
+
+def _trigrams(text):
+    return set([text[i:i + 3] for i in range(len(text) - 2)])
+
+
+class SearchIndex(object):
+    """
+    A search index over one or more lists of entities (eg all_classes and
+    all_properties), built at once. Results are ranked by: exact matches, prefixes,
+    prefixes of a word, other substrings and finally (with fuzzy=True) texts sharing
+    most of the query trigrams; then labels before qnames before URIs, shorter texts
+    first and finally the order of the entities in the lists.
+    """
+
+    def __init__(self, *entity_lists):
+        self._sources = [(x, len(x)) for x in entity_lists]  # the lists themselves, see covers
+        self.entities = []
+        self.texts = []  # (lowercased text, field, position in self.entities)
+        self.trigrams = {}  # trigram => set of positions in self.texts
+        for entities in entity_lists:
+            for entity in entities:
+                self._add(entity)
+
+    def covers(self, *entity_lists):
+        """
+        True if the index was built from these lists (the same objects: a list built
+        again may get the id of the old one), and they did not grow or shrink since
+        """
+        if len(entity_lists) != len(self._sources):
+            return False
+        return all([x is y and len(x) == n for x, (y, n) in zip(entity_lists, self._sources)])
+
+    def _add(self, entity):
+        pos = len(self.entities)
+        self.entities.append(entity)
+        fields = [(FIELD_URI, entity.uri), (FIELD_QNAME, entity.qname)]
+        if hasattr(entity, "labels"):  # read from its text table, see RDF_Entity._textTable
+            fields += [(FIELD_LABEL, x) for x in entity.labels()]
+        seen = set()
+        for field, text in fields:
+            text = ("%s" % text).lower()
+            if not text or text in seen:
+                continue
+            seen.add(text)
+            n = len(self.texts)
+            self.texts.append((text, field, pos))
+            for gram in _trigrams(text):
+                self.trigrams.setdefault(gram, set()).add(n)
+
+    def _candidates(self, query):
+        """ positions of the texts which may contain <query> """
+        if len(query) < 3:
+            return range(len(self.texts))
+        postings = []
+        for gram in _trigrams(query):
+            if gram not in self.trigrams:
+                return []
+            postings.append(self.trigrams[gram])
+        postings.sort(key=len)
+        return set.intersection(*postings)
+
+    def scored(self, query, fuzzy=False):
+        """
+        The entities matching <query>, as a dict entity position => sort key, where
+        the key is the best (match type, fuzzy similarity, field, text length) among its texts.
+        """
+        query = query.lower()
+        best = {}
+        for n in self._candidates(query):
+            text, field, pos = self.texts[n]
+            i = text.find(query)
+            if i < 0:
+                continue
+            if text == query:
+                kind = EXACT
+            elif i == 0:
+                kind = PREFIX
+            elif self._wordPrefix(text, query, i):
+                kind = WORD_PREFIX
+            else:
+                kind = SUBSTRING
+            key = (kind, 0, field, len(text))  # the 0 stands for the fuzzy similarity
+            if pos not in best or key < best[pos]:
+                best[pos] = key
+        if fuzzy and len(query) >= 3:
+            grams = _trigrams(query)
+            shared = {}
+            for gram in grams:
+                for n in self.trigrams.get(gram, ()):
+                    shared[n] = shared.get(n, 0) + 1
+            for n, count in shared.items():
+                similarity = float(count) / len(grams)
+                if similarity < FUZZY_MIN_SIMILARITY:
+                    continue
+                text, field, pos = self.texts[n]
+                key = (FUZZY, -similarity, field, len(text))
+                if pos not in best or key < best[pos]:
+                    best[pos] = key
+        return best
+
+    def _wordPrefix(self, text, query, i):
+        """ True if <query> is found at the start of a word of <text>, from position <i> """
+        while i > 0:
+            if _WORD_START.match(text[i - 1]):
+                return True
+            i = text.find(query, i + 1)
+        return False
+
+    def search(self, query, limit=None, fuzzy=False):
+        """
+        The entities matching <query> (case insensitive), best matches first.
+        <limit>: max number of results
+        <fuzzy>: also return entities whose texts share most of the query trigrams,
+            eg to allow typos (queries of 3 characters or more)
+        """
+        best = self.scored(query, fuzzy)
+        ranked = sorted(best, key=lambda pos: (best[pos], pos))
+        if limit:
+            ranked = ranked[:limit]
+        return [self.entities[pos] for pos in ranked]
@@ -9,14 +9,731 @@ Copyright (c)  __Michele Pasin__ <http://www.michelepasin.org>. All rights reser
 """
 
 
+import os
+import re
+import time
+import json
+import hashlib
+import functools
+import socket
+import threading
+from collections import deque, OrderedDict
+
+try:
+    import cPickle
+except ImportError:
+    import pickle as cPickle
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # python 2 without the 'futures' backport: queries run one at a time
+    ThreadPoolExecutor = None
+
+import requests
 import rdflib
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.query import ResultRow
+from rdflib.store import StoreCreatedEvent, TripleAddedEvent, TripleRemovedEvent
 from .utils import *
 
 DEFAULT_LANGUAGE = "en"
 
+# number of results fetched per request when listing entities from a sparql endpoint
+SPARQL_PAGE_SIZE_DEFAULT = 10000
+# number of entities whose details are fetched with one request from a sparql endpoint
+SPARQL_BATCH_SIZE_DEFAULT = 50
+# max number of requests sent at the same time to a sparql endpoint
+SPARQL_CONCURRENCY_DEFAULT = 4
+# query results cache: seconds after which results are fetched again, and max size in bytes
+SPARQL_CACHE_TTL_DEFAULT = 24 * 60 * 60
+SPARQL_CACHE_MAX_SIZE_DEFAULT = 100 * 1024 * 1024
+# upper bounds, in seconds, of the latency histograms kept by QueryMetrics
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+# max number of results kept in memory by a QueryMemo
+QUERY_MEMO_SIZE_DEFAULT = 128
+# seconds allowed to each query used to count the triples of a sparql endpoint
+SPARQL_COUNT_TIMEOUT_DEFAULT = 5
+# triples counted at most when estimating the size of a sparql endpoint
+SPARQL_COUNT_ESTIMATE_LIMIT = 100000
+
+SKOS = rdflib.Namespace("http://www.w3.org/2004/02/skos/core#")
+SHACL = rdflib.Namespace("http://www.w3.org/ns/shacl#")
+
+# namespaces hidden by iterAllClasses(hide_base_schemas=True)
+BASE_SCHEMAS = (
+    "http://www.w3.org/2002/07/owl",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns",
+    "http://www.w3.org/2000/01/rdf-schema",
+    "http://www.w3.org/2001/XMLSchema",
+    "http://www.w3.org/XML/1998/namespace",
+)
+BASE_SCHEMAS_INDEX = NamespaceIndex([(None, x) for x in BASE_SCHEMAS])
+
+
+
+class RateLimiter(object):
+    """
+    Spaces out requests so that no more than <rate> per second are sent.
+    The same limiter is shared by all the threads querying an endpoint (see get_rate_limiter)
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + 1.0 / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+_RATE_LIMITERS = {}
+_RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(endpoint, rate=None):
+    """
+    The rate limiter for a sparql endpoint, shared by SparqlHelper and SparqlEndpoint
+    instances in this process. Passing a rate (requests per second) updates it.
+    """
+    with _RATE_LIMITERS_LOCK:
+        limiter = _RATE_LIMITERS.setdefault(endpoint, RateLimiter())
+        if rate is not None:
+            limiter.rate = rate
+    return limiter
+
+
+class QueryExecutor(object):
+    """
+    Runs a function (usually a sparql query) over a list of items on a bounded pool
+    of threads, eg
+
+    for result in executor.imap(helper.entityTriplesBatch, batches): ...
+
+    Results are yielded in order, with at most 2 * <max_workers> items in flight.
+    With one worker, or when called from a worker thread, items are processed
+    one after the other in the calling thread.
+    """
+
+    def __init__(self, max_workers=1):
+        self.max_workers = max_workers or 1
+        self._pool = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # threads are not pickled
+        return {'max_workers': self.max_workers}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_workers'])
+
+    def in_worker(self):
+        """True if called from one of the pool threads"""
+        return getattr(self._local, "worker", False)
+
+    def _run(self, func, item, method=None):
+        self._local.worker = True
+        # queries run for a metered method are counted for it
+        _METERED.method = method
+        try:
+            return func(item)
+        finally:
+            _METERED.method = None
+
+    def imap(self, func, items):
+        if self.max_workers <= 1 or ThreadPoolExecutor is None or self.in_worker():
+            for item in items:
+                yield func(item)
+            return
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(self._pool.submit(self._run, func, item, current_method()))
+                if len(pending) >= 2 * self.max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def map(self, func, items):
+        return list(self.imap(func, items))
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+
+
+
+
+def _termKey(term):
+    """ sort key for rdflib terms, same order as a sparql ORDER BY """
+    if isinstance(term, rdflib.BNode):
+        return (1, str(term))
+    elif isinstance(term, rdflib.URIRef):
+        return (2, str(term))
+    return (3, str(term))
+
+
+def _sortedTerms(terms):
+    """ distinct terms, sorted as with ORDER BY """
+    return sorted(set(terms), key=_termKey)
+
+
+def _sortedRows(rows):
+    """ distinct rows (tuples of terms), sorted as with ORDER BY on each column """
+    return sorted(set(rows), key=lambda row: tuple([_termKey(x) for x in row]))
+
+
+
+# prefixes available to the prepared queries (same as SparqlHelper._bindNamespaces)
+QUERY_NAMESPACES = {
+    'rdf': rdflib.namespace.RDF,
+    'rdfs': rdflib.namespace.RDFS,
+    'owl': rdflib.namespace.OWL,
+    'skos': SKOS,
+    'xsd': rdflib.namespace.XSD,
+    'sh': SHACL,
+}
+
+# query text => query compiled by rdflib, see prepared_query
+_PREPARED_QUERIES = {}
+
+# characters not allowed within <..> in a sparql query
+_IRI_UNSAFE = re.compile(r'[\x00-\x20<>"{}|^`\\]')
+
+
+def prepared_query(text):
+    """
+    The sparql query <text>, parsed and compiled by rdflib once per process.
+    Run it with graph.query(prepared, initBindings={..}) to give values to its variables.
+    """
+    prepared = _PREPARED_QUERIES.get(text)
+    if prepared is None:
+        prepared = prepareQuery(text, initNs=QUERY_NAMESPACES)
+        _PREPARED_QUERIES[text] = prepared
+    return prepared
+
+
+def sparql_iri(uri):
+    """
+    <uri> written as a sparql IRI, eg <http://example.org/A>. Characters which can't
+    appear in IRIs (spaces, quotes, angle brackets..) are percent-encoded, so that the
+    text of a query can't be broken by odd URIs.
+    """
+    return "<%s>" % _IRI_UNSAFE.sub(lambda m: "%%%02X" % ord(m.group(0)), str(uri))
+
+
+
+class QueryTimeout(Exception):
+    """ a query did not return within the time allowed """
+    pass
+
+
+def is_timeout(e):
+    """ True if the exception <e> is a request timing out (requests, urllib, sockets) """
+    e = getattr(e, "reason", e)  # urllib errors wrap the socket ones
+    return isinstance(e, (socket.timeout, QueryTimeout)) or "Timeout" in type(e).__name__
+
+
+def set_request_timeout(store, timeout):
+    """
+    Set the timeout (in seconds, None for none) of the requests sent by a sparql store,
+    and return the previous one
+    """
+    if isinstance(getattr(store, "kwargs", None), dict):
+        # rdflib 5: SPARQLConnector, passed on to requests
+        previous = store.kwargs.get('timeout')
+        if timeout is None:
+            store.kwargs.pop('timeout', None)
+        else:
+            store.kwargs['timeout'] = timeout
+        return previous
+    if hasattr(store, "setTimeout"):
+        # rdflib 4: a SPARQLWrapper, in whole seconds
+        previous = getattr(store, "timeout", None)
+        store.timeout = None if timeout is None else int(timeout) + 1
+        return previous
+    return None
+
+
+
+class QueryCache(object):
+    """
+    Disk cache for the results of queries sent to sparql endpoints, eg
+
+    cache = QueryCache(ttl=3600)
+    res = cache.get(endpoint, query)
+    if res is None:
+        res = run_the_query()
+        cache.put(endpoint, query, res)
+
+    Items are keyed on the endpoint URL plus the query text with whitespace
+    normalized (quoted strings are left as they are). Items older than <ttl>
+    seconds are ignored, and the least recently used ones are removed when the
+    cache grows over <max_size> bytes. Results must be picklable.
+    <cache_dir> defaults to ONTOSPY_SPARQL_CACHE, within the models cache folder.
+    """
 
+    _WHITESPACE = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|\s+')
+
+    def __init__(self, cache_dir=None, ttl=SPARQL_CACHE_TTL_DEFAULT, max_size=SPARQL_CACHE_MAX_SIZE_DEFAULT):
+        if not cache_dir:
+            from . import ONTOSPY_SPARQL_CACHE
+            cache_dir = ONTOSPY_SPARQL_CACHE
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = None  # computed on first write
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def normalize(self, query):
+        """ collapse whitespace outside quoted strings """
+        return self._WHITESPACE.sub(lambda m: m.group(1) or " ", query).strip()
+
+    def _path(self, endpoint, query):
+        key = hashlib.sha256((str(endpoint) + "\n" + self.normalize(query)).encode("utf-8"))
+        return os.path.join(self.cache_dir, key.hexdigest() + ".pickle")
+
+    def get(self, endpoint, query):
+        """ the cached results of a query, or None """
+        path = self._path(endpoint, query)
+        try:
+            mtime = os.path.getmtime(path)
+            if self.ttl is not None and time.time() - mtime > self.ttl:
+                raise KeyError("expired")
+            with open(path, "rb") as f:
+                item = cPickle.load(f)
+            os.utime(path, (time.time(), mtime))  # last access, for LRU eviction
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return item['results']
+
+    def put(self, endpoint, query, results):
+        item = {'endpoint': str(endpoint), 'query': query, 'results': results}
+        data = cPickle.dumps(item, cPickle.HIGHEST_PROTOCOL)
+        if self.max_size is not None and len(data) > self.max_size:
+            return False
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:  # created by another thread in the meantime
+                pass
+        path = self._path(endpoint, query)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        write_atomic(path, data)
+        with self._lock:
+            if self._size is None:
+                self._size = self.size()
+            else:
+                self._size += len(data) - previous
+            over = self.max_size is not None and self._size > self.max_size
+        if over:
+            self.evict(keep=path)
+        return True
+
+    def _entries(self):
+        """ (atime, size, path, mtime) of each item, least recently used first """
+        out = []
+        if os.path.isdir(self.cache_dir):
+            for f in os.listdir(self.cache_dir):
+                if f.endswith(".pickle"):
+                    path = os.path.join(self.cache_dir, f)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    out += [(max(st.st_atime, st.st_mtime), st.st_size, path, st.st_mtime)]
+        return sorted(out)
+
+    def size(self):
+        return sum([x[1] for x in self._entries()])
+
+    def evict(self, keep=None):
+        """ remove expired items, then the least recently used ones till the cache fits max_size """
+        entries = self._entries()
+        total = sum([x[1] for x in entries])
+        now = time.time()
+        for atime, size, path, mtime in entries:
+            if path == keep:
+                continue
+            # mtime as listed: the file may be gone since (eg evicted by another process)
+            expired = self.ttl is not None and now - mtime > self.ttl
+            if expired or (self.max_size is not None and total > self.max_size):
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    if not os.path.exists(path):
+                        total -= size
+        with self._lock:
+            self._size = total
+
+    def clear(self):
+        for atime, size, path, mtime in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'location': self.cache_dir}
+
+    def reset_counters(self):
+        with self._lock:
+            self.hits, self.misses = 0, 0
+
+
+
+def iter_results(res):
+    """
+    Yields the rows of an rdflib query result. Unlike iterating over the result itself,
+    SELECT rows are not also kept in the result object as they are produced.
+    """
+    genbindings = getattr(res, "_genbindings", None)
+    if res.type == "SELECT" and genbindings is not None:
+        res._genbindings = None
+        for b in genbindings:
+            if b:  # as rdflib does, no rows for empty bindings
+                yield ResultRow(b, res.vars)
+    else:
+        for row in res:
+            yield row
+
+
+class GraphVersion(object):
+    """
+    Tells when an rdflib graph changes: `value` is different after any triple is added
+    or removed. It is made of the number of changes notified by the store, and the size
+    of the graph, as rdflib memory stores don't notify removals.
+    Can be pickled along with the graph.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.count = 0
+        # the dispatcher fails on events with no subscribers, once it has one
+        for event in (StoreCreatedEvent, TripleAddedEvent, TripleRemovedEvent):
+            graph.store.dispatcher.subscribe(event, self)
+
+    def __call__(self, event):
+        self.count += 1
+
+    @property
+    def value(self):
+        return (self.count, len(self.graph))
+
+
+def blank_node_closure(graph, triples, described=None):
+    """
+    The triples describing the blank nodes objects of <triples>, recursively, in the
+    order they are reached depth first. Each blank node is described once, so shared
+    or cyclic structures are fine, and deep ones (eg long rdf:Lists) don't recurse.
+    <described>: dict blank node => its triples, filled as they are read from <graph>
+        and reused, eg across the entities of a model
+    """
+    if described is None:
+        described = {}
+    seen = set([x[0] for x in triples if isBlankNode(x[0])])
+    out = []
+    stack = [iter(triples)]
+    while stack:
+        for tripl in stack[-1]:
+            node = tripl[2]
+            if isBlankNode(node) and node not in seen:
+                seen.add(node)
+                temp = described.get(node)
+                if temp is None:
+                    temp = described[node] = list(graph.triples((node, None, None)))
+                out += temp
+                stack.append(iter(temp))
+                break
+        else:
+            stack.pop()
+    return out
+
+
+class QueryMemo(object):
+    """
+    In-memory LRU of query results for a local graph, eg
+
+    memo = QueryMemo(graph)
+    rows = memo.get(q)
+    if rows is None:
+        version = memo.version.value
+        rows = list(graph.query(q))
+        memo.put(q, rows, version)
+
+    All results are dropped as soon as the graph changes (see GraphVersion).
+    Queries are the same if they only differ in whitespace (see QueryCache.normalize).
+    """
+
+    def __init__(self, graph, max_items=QUERY_MEMO_SIZE_DEFAULT):
+        self.graph = graph
+        self.max_items = max_items
+        self.version = GraphVersion(graph)
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # normalized query => rows
+        self._items_version = self.version.value
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # results are not pickled (rdflib result rows can't be)
+        state = self.__dict__.copy()
+        state['_items'] = OrderedDict()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _key(self, query):
+        return QueryCache._WHITESPACE.sub(lambda m: m.group(1) or " ", query).strip()
+
+    def _check_version(self):
+        version = self.version.value
+        if self._items_version != version:
+            self._items.clear()
+            self._items_version = version
+        return version
+
+    def get(self, query):
+        """ the results of <query> (and mark them as most recently used), or None """
+        key = self._key(query)
+        with self._lock:
+            self._check_version()
+            rows = self._items.pop(key, None)
+            if rows is None:
+                self.misses += 1
+                return None
+            self._items[key] = rows
+            self.hits += 1
+            return rows
+
+    def put(self, query, rows, version=None):
+        """
+        keep the results of <query>, as a list; the least recently used go first
+        <version>: version.value when the query was run: if the graph changed since,
+            the results are not kept
+        """
+        key = self._key(query)
+        with self._lock:
+            if self._check_version() != version and version is not None:
+                return
+            self._items.pop(key, None)
+            self._items[key] = rows
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
 
 
+class QueryMetrics(object):
+    """
+    Per-method counters for the queries run by a SparqlHelper (or a SparqlEndpoint):
+    number of calls, errors, queries sent, query cache hits, results returned and
+    a histogram of the time taken by the calls (see METRICS_BUCKETS), eg
+
+    o.sparqlHelper.metrics.report()
+    {'getClassDirectSupers': {'calls': 120, 'queries': 120, 'seconds': 0.8, ..}, ..}
+
+    Read them with report(), to_json() or to_prometheus(); reset() sets them to zero.
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._methods = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _item(self, method):
+        item = self._methods.get(method)
+        if item is None:
+            item = self._methods[method] = {
+                'calls': 0, 'errors': 0, 'queries': 0, 'cache_hits': 0,
+                'rows': 0, 'seconds': 0.0, 'histogram': [0] * (len(self.buckets) + 1),
+            }
+        return item
+
+    def record(self, method, seconds, rows=None, error=False):
+        """ a call to <method>, which took <seconds> and returned <rows> results """
+        with self._lock:
+            item = self._item(method)
+            item['calls'] += 1
+            item['seconds'] += seconds
+            if error:
+                item['errors'] += 1
+            if rows:
+                item['rows'] += rows
+            n = 0
+            while n < len(self.buckets) and seconds > self.buckets[n]:
+                n += 1
+            item['histogram'][n] += 1
+
+    def record_query(self, method, cache_hit=False):
+        """ a query sent (or answered by the query cache) on behalf of <method> """
+        with self._lock:
+            item = self._item(method)
+            item['queries'] += 1
+            if cache_hit:
+                item['cache_hits'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._methods = {}
+
+    def report(self):
+        """ dict method => counters; 'histogram' has the number of calls per bucket, the last one for slower calls """
+        with self._lock:
+            return dict([(k, dict(v, histogram=list(v['histogram']))) for k, v in self._methods.items()])
+
+    def to_json(self):
+        return json.dumps({'buckets': list(self.buckets), 'methods': self.report()}, sort_keys=True)
+
+    def to_prometheus(self, prefix="ontospy_sparql"):
+        """ the metrics in the Prometheus text exposition format """
+        report = self.report()
+        lines = []
+        for name, help_text in [('calls', "Calls per method"), ('errors', "Calls which raised an error"),
+                                ('queries', "Queries sent per method"), ('cache_hits', "Queries answered by the query cache"),
+                                ('rows', "Results returned per method")]:
+            lines += ["# HELP %s_%s_total %s" % (prefix, name, help_text),
+                      "# TYPE %s_%s_total counter" % (prefix, name)]
+            for method in sorted(report):
+                lines += ['%s_%s_total{method="%s"} %d' % (prefix, name, method, report[method][name])]
+        lines += ["# HELP %s_seconds Time taken by the calls per method" % prefix,
+                  "# TYPE %s_seconds histogram" % prefix]
+        for method in sorted(report):
+            item = report[method]
+            total = 0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], item['histogram']):
+                total += count
+                lines += ['%s_seconds_bucket{method="%s",le="%s"} %d' % (prefix, method, bound, total)]
+            lines += ['%s_seconds_sum{method="%s"} %s' % (prefix, method, repr(item['seconds'])),
+                      '%s_seconds_count{method="%s"} %d' % (prefix, method, item['calls'])]
+        return "\n".join(lines) + "\n"
+
+
+_METERED = threading.local()  # name of the method being metered in the current thread
+
+
+def current_method():
+    """ the outermost metered method running in this thread, or None """
+    return getattr(_METERED, "method", None)
+
+
+def metered(func):
+    """
+    Decorator recording the calls to a method in self.metrics (a QueryMetrics).
+    Only the outermost metered call in a thread is recorded. When the method returns
+    an iterator, the time is the one spent producing its items.
+    """
+    name = func.__name__
+
+    def iterate(self, res, seconds):
+        rows = 0
+        try:
+            while True:
+                outer = current_method()
+                _METERED.method = outer or name
+                sTime = time.time()
+                try:
+                    item = next(res)
+                finally:
+                    seconds += time.time() - sTime
+                    _METERED.method = outer
+                rows += 1
+                yield item
+        except (StopIteration, GeneratorExit):
+            # GeneratorExit: not consumed till the end
+            self.metrics.record(name, seconds, rows)
+        except Exception:
+            self.metrics.record(name, seconds, rows, error=True)
+            raise
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self, "metrics", None) is None or current_method() is not None:
+            return func(self, *args, **kwargs)
+        _METERED.method = name
+        sTime = time.time()
+        try:
+            res = func(self, *args, **kwargs)
+        except Exception:
+            self.metrics.record(name, time.time() - sTime, error=True)
+            raise
+        finally:
+            _METERED.method = None
+        seconds = time.time() - sTime
+        if hasattr(res, "__next__") or hasattr(res, "next"):
+            return iterate(self, res, seconds)
+        self.metrics.record(name, seconds, _resultSize(res))
+        return res
+
+    return wrapper
+
+
+def _resultSize(res):
+    """ number of results in a list, dict or sparql JSON results, or None """
+    if isinstance(res, dict):
+        try:
+            return len(res['results']['bindings'])
+        except (KeyError, TypeError):
+            return len(res)
+    if isinstance(res, list):
+        return len(res)
+    return None
+
 
 class SparqlHelper(object):
     """
@@ -32,25 +749,364 @@ class SparqlHelper(object):
     """
 
 
-    def __init__(self, rdfgraph, sparql_endpoint=False):
+    def __init__(self, rdfgraph, sparql_endpoint=False, page_size=None, pagination="keyset", batch_size=None,
+                 concurrency=None, rate_limit=None, credentials=None, query_cache=None, native=None):
+        """
+        <page_size>: max number of results per request when listing classes and properties.
+            Defaults to SPARQL_PAGE_SIZE_DEFAULT for sparql endpoints; local graphs are not paged.
+        <pagination>: either 'keyset' (pages start from the last ?x seen) or 'offset' (LIMIT/OFFSET)
+        <batch_size>: number of entities whose triples and supers are fetched with one request.
+            Defaults to SPARQL_BATCH_SIZE_DEFAULT for sparql endpoints; local graphs are queried
+            one entity at a time.
+        <concurrency>: max number of requests sent at the same time to a sparql endpoint.
+            Defaults to SPARQL_CONCURRENCY_DEFAULT; local graphs are always queried from one thread.
+        <rate_limit>: max number of requests per second sent to the sparql endpoint
+        <credentials>: tuple, used by the connections opened by worker threads
+        <query_cache>: a QueryCache instance, where results from sparql endpoints are kept.
+            Set <bypass_cache> to run queries against the endpoint regardless.
+        <native>: answer the schema queries by scanning the graph triples instead of
+            running sparql. Defaults to True for local graphs (results are the same,
+            without the cost of parsing and evaluating the queries).
+
+        Calls to the public methods, and the queries they send, are counted in
+        <metrics> (see QueryMetrics).
+        """
         super(SparqlHelper, self).__init__()
         self.rdflib_graph = rdfgraph
         self.sparql_endpoint = sparql_endpoint
+        if page_size is None and sparql_endpoint:
+            page_size = SPARQL_PAGE_SIZE_DEFAULT
+        self.page_size = page_size
+        self.pagination = pagination
+        if batch_size is None and sparql_endpoint:
+            batch_size = SPARQL_BATCH_SIZE_DEFAULT
+        self.batch_size = batch_size
+        if sparql_endpoint:
+            self.concurrency = concurrency or SPARQL_CONCURRENCY_DEFAULT
+            if rate_limit is not None:
+                get_rate_limiter(sparql_endpoint, rate_limit)
+        else:
+            self.concurrency = 1
+        self.credentials = credentials
+        self.executor = QueryExecutor(self.concurrency)
+        self.query_cache = query_cache if sparql_endpoint else None
+        self.bypass_cache = False
+        self.deadline = None  # see setBudget
+        self.native = (not sparql_endpoint) if native is None else native
+        self.metrics = QueryMetrics()
+        self._local = threading.local()
+        self._described = None  # see _blankNodes
 
         # TODO add 2 versions of queries, one for declared classes only,
         # one with basic (RDFS+?) inference too
         self.inference = False
 
-        # Bind a few prefix, namespace pairs for easier sparql querying
-        self.rdflib_graph.bind("rdf", rdflib.namespace.RDF)
-        self.rdflib_graph.bind("rdfs", rdflib.namespace.RDFS)
-        self.rdflib_graph.bind("owl", rdflib.namespace.OWL)
-        self.rdflib_graph.bind("skos", rdflib.namespace.SKOS)
-        self.rdflib_graph.bind("dc", "http://purl.org/dc/elements/1.1/")
-        self.rdflib_graph.bind("vann", "http://purl.org/vocab/vann/")
-        self.rdflib_graph.bind("void", "http://rdfs.org/ns/void#")
-        self.rdflib_graph.bind("xsd", "http://www.w3.org/2001/XMLSchema#")
-        self.rdflib_graph.bind("sh", "http://www.w3.org/ns/shacl#")
+        self._bindNamespaces(self.rdflib_graph)
+
+
+    def __getstate__(self):
+        # thread-local connections are not pickled
+        state = self.__dict__.copy()
+        state.pop('_local', None)
+        state['_described'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+
+    def _bindNamespaces(self, graph):
+        """ Bind a few prefix, namespace pairs for easier sparql querying """
+        graph.bind("rdf", rdflib.namespace.RDF)
+        graph.bind("rdfs", rdflib.namespace.RDFS)
+        graph.bind("owl", rdflib.namespace.OWL)
+        graph.bind("skos", rdflib.namespace.SKOS)
+        graph.bind("dc", "http://purl.org/dc/elements/1.1/")
+        graph.bind("vann", "http://purl.org/vocab/vann/")
+        graph.bind("void", "http://rdfs.org/ns/void#")
+        graph.bind("xsd", "http://www.w3.org/2001/XMLSchema#")
+        graph.bind("sh", "http://www.w3.org/ns/shacl#")
+
+
+    # ..................
+    # QUERYING
+    # ..................
+
+
+    def _graph(self):
+        """
+        The graph to query from the current thread. rdflib stores are not thread safe,
+        so each worker thread querying a sparql endpoint opens its own connection,
+        which is then kept alive across requests.
+        """
+        if not self.sparql_endpoint or not self.executor.in_worker():
+            return self.rdflib_graph
+        graph = getattr(self._local, "graph", None)
+        if graph is None:
+            graph = rdflib.ConjunctiveGraph('SPARQLUpdateStore')
+            if self.credentials and type(self.credentials) == tuple:
+                graph.store.setCredentials(self.credentials[0], self.credentials[1])
+            graph.open((self.sparql_endpoint, self.sparql_endpoint))
+            if hasattr(graph.store, "setUseKeepAlive"):
+                # rdflib 4 stores are SPARQLWrapper instances (rdflib 5 keeps a session per thread)
+                graph.store.setUseKeepAlive()
+            self._bindNamespaces(graph)
+            self._local.graph = graph
+        return graph
+
+
+    def _query(self, q, initBindings=None, timeout=None):
+        """
+        run a sparql query: all queries sent by this class go through here
+        note: with a query cache, results are returned as a list of tuples
+        <q> can also be a prepared query (see _queryFor), run with <initBindings>
+        The query is allowed <timeout> seconds, and no more than the time budget left
+        (see setBudget, _runTimed): the results are then returned as a list.
+        """
+        cache = self.query_cache if initBindings is None else None
+        metrics = getattr(self, "metrics", None)
+        if cache is not None and not self.bypass_cache:
+            res = cache.get(self.sparql_endpoint, q)
+            if res is not None:
+                if metrics is not None:
+                    metrics.record_query(current_method() or "_query", cache_hit=True)
+                return res
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise QueryTimeout("Time budget used up")
+        if timeout and (remaining is None or timeout < remaining):
+            remaining = timeout
+        if metrics is not None:
+            metrics.record_query(current_method() or "_query")
+        if self.sparql_endpoint:
+            get_rate_limiter(self.sparql_endpoint).wait()
+        graph = self._graph()
+        if initBindings is not None:
+            run = lambda: graph.query(q, initBindings=initBindings)
+        else:
+            run = lambda: graph.query(q)
+        if remaining is None:
+            res = run()
+        else:
+            res = self._runTimed(graph, run, remaining)
+        if cache is not None:
+            # result rows can't be pickled
+            res = [tuple(x) if isinstance(x, tuple) else x for x in res]
+            cache.put(self.sparql_endpoint, q, res)
+        return res
+
+    def _queryFor(self, aURI, q):
+        """
+        Run the query <q> about one entity, where the ?uri variable stands for <aURI>.
+        With local graphs the query is compiled once (see prepared_query) and ?uri is
+        bound to the entity at each call. With sparql endpoints ?uri is replaced by the
+        entity IRI, escaped (see sparql_iri), in the text sent.
+        """
+        if self.sparql_endpoint:
+            iri = sparql_iri(aURI)
+            return self._query(re.sub(r"\?uri\b", lambda m: iri, q))
+        if not isinstance(aURI, rdflib.term.Identifier):
+            aURI = rdflib.URIRef(aURI)
+        return self._query(prepared_query(q), {'uri': aURI})
+
+    def _runTimed(self, graph, run, timeout):
+        """
+        The results of run(), a query of <graph>, as a list, or QueryTimeout if they take
+        more than <timeout> seconds. The query runs in the current thread, and nothing is
+        left running once it's over: with sparql endpoints <timeout> is given to the
+        request (on the connection of the thread, see _graph); with local graphs the
+        rows are read one at a time, and the evaluation is dropped when time is up
+        (the time taken by the first row, eg sorting them all, can't be cut short).
+        """
+        deadline = time.time() + timeout
+        if not self.sparql_endpoint:
+            out = []
+            for row in run():
+                if time.time() > deadline:
+                    raise QueryTimeout("No results after %0.1fs" % timeout)
+                out.append(row)
+            return out
+        previous = set_request_timeout(graph.store, timeout)
+        try:
+            return list(run())
+        except Exception as e:
+            if is_timeout(e):
+                raise QueryTimeout("No results after %0.1fs" % timeout)
+            raise
+        finally:
+            set_request_timeout(graph.store, previous)
+
+    def _queryWithTimeout(self, q, timeout=None):
+        """
+        Like _query, but raises QueryTimeout if the results don't come within <timeout>
+        seconds (see _runTimed)
+        """
+        return list(self._query(q, timeout=timeout))
+
+    def _native(self):
+        """ True if queries are answered by scanning the local graph (see <native>) """
+        if not getattr(self, "native", False):
+            return False
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise QueryTimeout("Time budget used up")
+        return True
+
+    def _isBaseSchema(self, uri):
+        return isBlankNode(uri) or BASE_SCHEMAS_INDEX.match(uri) is not None
+
+    def setBudget(self, seconds=None):
+        """
+        Give all the following queries <seconds> to run, in total. Each query is then
+        allowed the time left, and queries sent once it's over raise QueryTimeout
+        straight away (results from the query cache are still returned).
+        """
+        self.deadline = time.time() + seconds if seconds else None
+
+    def remaining(self):
+        """ seconds left before the deadline set with setBudget, or None """
+        if getattr(self, "deadline", None) is None:
+            return None
+        return self.deadline - time.time()
+
+
+    def imap(self, func, items):
+        """
+        Yields func(item) for each item, in order. With sparql endpoints
+        up to <concurrency> items are processed at the same time (see QueryExecutor)
+        """
+        return self.executor.imap(func, items)
+
+
+    def _pagedQuery(self, query, order_by, page_size=None, pagination=None):
+        """
+        Run a SELECT query one page at a time, yielding the results as they come.
+
+        <query> must contain a '%(filter)s' placeholder within its WHERE block and
+        a '%(order)s' one after it. Results are paged on the ?x variable:
+        - 'keyset': each page asks for ?x values from the last one returned onwards,
+            so that requests don't get slower as we go (blank nodes are skipped)
+        - 'offset': plain LIMIT/OFFSET, for endpoints which can't filter on STR(?x)
+        With no page size, the query is sent as it is.
+        """
+        page_size = page_size or self.page_size
+        pagination = pagination or self.pagination
+        if not page_size:
+            for row in self._query(query % {'filter': "", 'order': order_by}):
+                yield row
+            return
+
+        if pagination == "offset":
+            offset = 0
+            while True:
+                q = query % {'filter': "", 'order': order_by}
+                rows = list(self._query(q + " LIMIT %d OFFSET %d" % (page_size, offset)))
+                for row in rows:
+                    yield row
+                if len(rows) < page_size:
+                    return
+                offset += page_size
+
+        else:
+            last, seen = None, set()  # last ?x, and its rows returned already
+            size = page_size
+            while True:
+                _filter = "FILTER(isIRI(?x)) ."
+                if last is not None:
+                    _filter += ' FILTER(STR(?x) >= "%s") .' % last.replace("\\", "\\\\").replace('"', '\\"')
+                q = query % {'filter': _filter, 'order': order_by}
+                rows = list(self._query(q + " LIMIT %d" % size))
+                new = [row for row in rows if str(row[0]) != last or row not in seen]
+                for row in new:
+                    yield row
+                if len(rows) < size:
+                    return
+                if not new:
+                    # more rows for a single ?x than fit in a page
+                    size = size * 2
+                    continue
+                top = str(rows[-1][0])
+                if top != last:
+                    seen = set()
+                seen.update([row for row in rows if str(row[0]) == top])
+                last, size = top, page_size
+
+
+    # ..................
+    # STATISTICS
+    # ..................
+
+
+    @metered
+    def getTriplesCount(self, timeout=SPARQL_COUNT_TIMEOUT_DEFAULT, refresh=False):
+        """
+        The number of triples in the graph, as a tuple (count, source).
+
+        With sparql endpoints, where counting all triples can take forever, the first
+        of these that works is used, each allowed <timeout> seconds:
+        - 'void': the largest void:triples figure published by the endpoint
+        - 'sd': the void:triples of its SPARQL service description (see _serviceDescriptionCount)
+        - 'count': a COUNT(*) query
+        - 'estimate': a lower bound, counting up to SPARQL_COUNT_ESTIMATE_LIMIT triples
+        If none works, the count is None and the source 'unknown'.
+        The result is kept: pass <refresh> to calculate it again.
+        """
+        if getattr(self, "_triples_count", None) is not None and not refresh:
+            return self._triples_count
+        if not self.sparql_endpoint:
+            self._triples_count = (len(self.rdflib_graph), "count")
+            return self._triples_count
+
+        queries = [
+            ("void", """SELECT (MAX(?n) AS ?count)
+                 WHERE { ?x <http://rdfs.org/ns/void#triples> ?n }"""),
+            ("sd", None),
+            ("count", """SELECT (COUNT(*) AS ?count)
+                 WHERE { ?s ?p ?o }"""),
+            ("estimate", """SELECT (COUNT(*) AS ?count)
+                 WHERE { SELECT ?s WHERE { ?s ?p ?o } LIMIT %d }""" % SPARQL_COUNT_ESTIMATE_LIMIT),
+        ]
+        self._triples_count = (None, "unknown")
+        for source, q in queries:
+            try:
+                if q is None:
+                    count = int(self._serviceDescriptionCount(timeout))
+                else:
+                    count = int(self._queryWithTimeout(q, timeout)[0][0])
+            except Exception:  # timeouts, unsupported queries, no void figures
+                continue
+            if count or source not in ("void", "sd"):
+                self._triples_count = (count, source)
+                break
+        return self._triples_count
+
+    def _serviceDescriptionCount(self, timeout=None):
+        """
+        The void:triples figure of the SPARQL service description of the endpoint (what
+        it returns to a request with no query): the one of its default graph, else the
+        largest one. None if there is none.
+        """
+        remaining = self.remaining()  # within the time budget too, as _query
+        if remaining is not None:
+            if remaining <= 0:
+                raise QueryTimeout("Time budget used up")
+            timeout = min(timeout, remaining) if timeout else remaining
+        get_rate_limiter(self.sparql_endpoint).wait()
+        auth = self.credentials if self.credentials and type(self.credentials) == tuple else None
+        res = requests.get(self.sparql_endpoint, timeout=timeout, auth=auth,
+                           headers={'Accept': 'text/turtle, application/rdf+xml;q=0.9'})
+        res.raise_for_status()
+        content_type = res.headers.get('Content-Type') or ""
+        graph = rdflib.Graph()
+        graph.parse(data=res.content, format="turtle" if "turtle" in content_type else "xml")
+        SD = rdflib.Namespace("http://www.w3.org/ns/sparql-service-description#")
+        VOID_TRIPLES = rdflib.URIRef("http://rdfs.org/ns/void#triples")
+        defaults = [x for dataset in graph.objects(None, SD.defaultDataset)
+                    for x in graph.objects(dataset, SD.defaultGraph)]
+        counts = [x for g in defaults for x in graph.objects(g, VOID_TRIPLES)]
+        counts = counts or list(graph.objects(None, VOID_TRIPLES))
+        return max([int(x) for x in counts]) if counts else None
 
 
     # ..................
@@ -58,8 +1114,11 @@ class SparqlHelper(object):
     # ..................
 
 
+    @metered
     def getOntology(self):
-        qres = self.rdflib_graph.query(
+        if self._native():
+            return [(x,) for x in _sortedTerms(self.rdflib_graph.subjects(rdflib.RDF.type, rdflib.OWL.Ontology))]
+        qres = self._query(
             """SELECT DISTINCT ?x
                WHERE {
                   ?x a owl:Ontology
@@ -74,8 +1133,14 @@ class SparqlHelper(object):
     # ..................
 
 
+    @metered
     def getShapes(self):
-        qres = self.rdflib_graph.query(
+        if self._native():
+            shapes = []
+            for shape_type in [SHACL.Shape, SHACL.NodeShape, SHACL.PropertyShape]:
+                shapes += list(self.rdflib_graph.subjects(rdflib.RDF.type, shape_type))
+            return [(x,) for x in _sortedTerms(shapes)]
+        qres = self._query(
             """SELECT DISTINCT ?x
                WHERE {
                         { ?x a sh:Shape }
@@ -95,11 +1160,23 @@ class SparqlHelper(object):
 
 
 
+    @metered
     def getAllClasses(self, hide_base_schemas=True):
         """
         by default, obscure all RDF/RDFS/OWL/XML stuff
         2016-05-06: not obscured anymore
         """
+        return list(self.iterAllClasses(hide_base_schemas))
+
+
+    @metered
+    def iterAllClasses(self, hide_base_schemas=True, page_size=None):
+        """
+        Same as getAllClasses, but the results are yielded as they come.
+        With sparql endpoints they are fetched a page at a time (see _pagedQuery).
+        """
+        if self._native():
+            return iter(self._nativeAllClasses(hide_base_schemas))
         query = """SELECT DISTINCT ?x ?c
                  WHERE {
                          {
@@ -122,27 +1199,48 @@ class SparqlHelper(object):
 
                     %s
 
+                    %%(filter)s
+
                  }
-                 ORDER BY  ?x
+                 %%(order)s
                  """
         if hide_base_schemas:
-            query = query %  """FILTER(
-                     !STRSTARTS(STR(?x), "http://www.w3.org/2002/07/owl")
-                     && !STRSTARTS(STR(?x), "http://www.w3.org/1999/02/22-rdf-syntax-ns")
-                     && !STRSTARTS(STR(?x), "http://www.w3.org/2000/01/rdf-schema")
-                     && !STRSTARTS(STR(?x), "http://www.w3.org/2001/XMLSchema")
-                     && !STRSTARTS(STR(?x), "http://www.w3.org/XML/1998/namespace")
-                     && (!isBlank(?x))
-                      ) ."""
+            # base schemas classes are dropped as results come (see _isBaseSchema), rather
+            # than with a STRSTARTS filter evaluated by the endpoint for each row
+            query = query %  """FILTER(!isBlank(?x)) ."""
         else:
             query = query % ""
 
-        qres = self.rdflib_graph.query(query)
-        return list(qres)
+        if page_size or self.page_size:
+            order_by = "ORDER BY ?x ?c"  # a total order, so that pages don't overlap
+        else:
+            order_by = "ORDER BY  ?x"
+        rows = self._pagedQuery(query, order_by, page_size)
+        if hide_base_schemas:
+            return (row for row in rows if not self._isBaseSchema(row[0]))
+        return rows
+
+
+    def _nativeAllClasses(self, hide_base_schemas=True):
+        """ iterAllClasses for local graphs: same union of patterns, as triple scans """
+        g = self.rdflib_graph
+        candidates = set(g.subjects(rdflib.RDF.type, rdflib.OWL.Class))
+        candidates.update(g.subjects(rdflib.RDF.type, rdflib.RDFS.Class))
+        candidates.update(g.subjects(rdflib.RDFS.subClassOf, None))
+        candidates.update(g.objects(None, rdflib.RDFS.subClassOf))
+        candidates.update(g.objects(None, rdflib.RDFS.domain))
+        candidates.update(g.objects(None, rdflib.RDFS.range))
+        rows = []
+        for x in candidates:
+            if hide_base_schemas and self._isBaseSchema(x):
+                continue
+            rows += [(x, c) for c in g.objects(x, rdflib.RDF.type)]
+        return _sortedRows(rows)
 
 
     #legacy
 
+    @metered
     def getAllClassesFromInstancesToo(self):
         """
         by default, obscure all RDF/RDFS/OWL/XML stuff
@@ -150,7 +1248,7 @@ class SparqlHelper(object):
 
         added: { ?y rdf:type ?x }
         """
-        qres = self.rdflib_graph.query(
+        qres = self._query(
               """SELECT DISTINCT ?x ?c
                  WHERE {
                          {
@@ -185,59 +1283,123 @@ class SparqlHelper(object):
         return list(qres)
 
 
+    @metered
     def getClassInstances(self, aURI):
         aURI = aURI
-        qres = self.rdflib_graph.query(
+        if self._native():
+            return [(x,) for x in _sortedTerms(self.iterClassInstances(aURI))]
+        qres = self._queryFor(aURI,
               """SELECT DISTINCT ?x
                  WHERE {
-                     { ?x rdf:type <%s> }
+                     { ?x rdf:type ?uri }
                      FILTER (!isBlank(?x))
                  } ORDER BY ?x
-                 """ % (aURI))
+                 """)
         return list(qres)
 
+    @metered
+    def iterClassInstances(self, aURI, page_size=None):
+        """
+        Same as getClassInstances, but the URIs are yielded as they come.
+        With sparql endpoints they are fetched a page at a time (see _pagedQuery),
+        in the same order; local graphs are scanned lazily, so URIs come in the
+        order of the graph.
+        """
+        if not self.sparql_endpoint:
+            for uri in self.rdflib_graph.subjects(rdflib.RDF.type, rdflib.URIRef(aURI)):
+                if not isBlankNode(uri):
+                    yield uri
+            return
+        query = """SELECT DISTINCT ?x
+                 WHERE {
+                     { ?x rdf:type %s }
+                     FILTER (!isBlank(?x))
+                     %%(filter)s
+                 }
+                 %%(order)s
+                 """ % sparql_iri(aURI).replace("%", "%%")
+        for row in self._pagedQuery(query, "ORDER BY ?x", page_size):
+            yield row[0]
+
+    @metered
     def getClassInstancesCount(self, aURI):
         aURI = aURI
-        qres = self.rdflib_graph.query(
-              """SELECT (COUNT(?x) AS ?count )
+        if self._native():
+            return len(self.getClassInstances(aURI))
+        qres = self._queryFor(aURI,
+              """SELECT (COUNT(DISTINCT ?x) AS ?count )
                  WHERE {
-                     { ?x rdf:type <%s> }
+                     { ?x rdf:type ?uri }
                      FILTER (!isBlank(?x))
-                 } ORDER BY ?x
-                 """ % (aURI))
+                 }
+                 """)
         try:
             return int(list(qres)[0][0])
         except:
             printDebug("Error with <getClassInstancesCount>")
             return 0
 
+    @metered
+    def getInstanceCounts(self, page_size=None):
+        """
+        The number of instances of each class, as a dict {class uri: count}.
+        Same counts as getClassInstancesCount, for all classes at once: with sparql
+        endpoints that's one GROUP BY query (paged), with local graphs one pass
+        over the rdf:type triples.
+        """
+        counts = {}
+        if not self.sparql_endpoint:
+            for x, c in self.rdflib_graph.subject_objects(rdflib.RDF.type):
+                if not isBlankNode(x) and not isBlankNode(c):
+                    counts[c] = counts.get(c, 0) + 1
+            return counts
+        query = """SELECT ?x (COUNT(DISTINCT ?i) AS ?count)
+                 WHERE {
+                     ?i rdf:type ?x .
+                     FILTER (!isBlank(?i))
+                     %(filter)s
+                 } GROUP BY ?x
+                 %(order)s
+                 """
+        for row in self._pagedQuery(query, "ORDER BY ?x", page_size):
+            if not isBlankNode(row[0]):
+                counts[row[0]] = int(row[1])
+        return counts
 
+
+    @metered
     def getClassDirectSupers(self, aURI):
         aURI = aURI
-        qres = self.rdflib_graph.query(
+        if self._native():
+            return self._nativeObjects(aURI, rdflib.RDFS.subClassOf)
+        qres = self._queryFor(aURI,
               """SELECT DISTINCT ?x
                  WHERE {
-                     { <%s> rdfs:subClassOf ?x }
+                     { ?uri rdfs:subClassOf ?x }
                      FILTER (!isBlank(?x))
                  } ORDER BY ?x
-                 """ % (aURI))
+                 """)
         return list(qres)
 
 
+    @metered
     def getClassDirectSubs(self, aURI):
         """
         2015-06-03: currenlty not used, inferred from above
         """
         aURI = aURI
-        qres = self.rdflib_graph.query(
+        if self._native():
+            return self._nativeSubjects(rdflib.RDFS.subClassOf, aURI)
+        qres = self._queryFor(aURI,
               """SELECT DISTINCT ?x
                  WHERE {
-                     { ?x rdfs:subClassOf <%s> }
+                     { ?x rdfs:subClassOf ?uri }
                      FILTER (!isBlank(?x))
                  }
-                 """ % (aURI))
+                 """)
         return list(qres)
 
+    @metered
     def getClassAllSupers(self, aURI):
         """
         note: requires SPARQL 1.1
@@ -245,19 +1407,20 @@ class SparqlHelper(object):
         """
         aURI = aURI
         try:
-            qres = self.rdflib_graph.query(
+            qres = self._queryFor(aURI,
                   """SELECT DISTINCT ?x
                      WHERE {
-                         { <%s> rdfs:subClassOf+ ?x }
+                         { ?uri rdfs:subClassOf+ ?x }
                          FILTER (!isBlank(?x))
                      }
-                     """ % (aURI))
+                     """)
         except:
             printDebug("... warning: the 'getClassAllSupers' query failed (maybe missing SPARQL 1.1 support?)")
             qres = []
         return list(qres)
 
 
+    @metered
     def getClassAllSubs(self, aURI):
         """
         note: requires SPARQL 1.1
@@ -265,13 +1428,13 @@ class SparqlHelper(object):
         """
         aURI = aURI
         try:
-            qres = self.rdflib_graph.query(
+            qres = self._queryFor(aURI,
                   """SELECT DISTINCT ?x
                      WHERE {
-                         { ?x rdfs:subClassOf+ <%s> }
+                         { ?x rdfs:subClassOf+ ?uri }
                          FILTER (!isBlank(?x))
                      }
-                     """ % (aURI))
+                     """)
         except:
             printDebug("... warning: the 'getClassAllSubs' query failed (maybe missing SPARQL 1.1 support?)")
             qres = []
@@ -285,9 +1448,27 @@ class SparqlHelper(object):
 
 
     # NOTE this kinf of query could be expanded to classes too!!!
+    @metered
     def getAllProperties(self):
-        qres = self.rdflib_graph.query(
-              """SELECT ?x ?c WHERE {
+        return list(self.iterAllProperties())
+
+
+    @metered
+    def iterAllProperties(self, page_size=None):
+        """
+        Same as getAllProperties, but the results are yielded as they come.
+        With sparql endpoints they are fetched a page at a time (see _pagedQuery).
+        Note: with local graphs (see <native>) duplicate rows are removed.
+        """
+        if self._native():
+            g = self.rdflib_graph
+            candidates = set()
+            for prop_type in [rdflib.RDF.Property, rdflib.OWL.ObjectProperty,
+                              rdflib.OWL.DatatypeProperty, rdflib.OWL.AnnotationProperty]:
+                candidates.update([x for x in g.subjects(rdflib.RDF.type, prop_type) if not isBlankNode(x)])
+            rows = [(c, x) for x in candidates for c in g.objects(x, rdflib.RDF.type)]
+            return iter([(x, c) for c, x in _sortedRows(rows)])  # ORDER BY ?c ?x
+        query = """SELECT ?x ?c WHERE {
                         {
                             { ?x a rdf:Property }
                              UNION
@@ -300,23 +1481,32 @@ class SparqlHelper(object):
                         ?x a ?c
                      FILTER(!isBlank(?x)
                        ) .
-                    } ORDER BY	?c ?x
-                 """)
-        return list(qres)
+                     %(filter)s
+                    } %(order)s
+                 """
+        if page_size or self.page_size:
+            order_by = "ORDER BY ?x ?c"  # pages are keyed on ?x
+        else:
+            order_by = "ORDER BY	?c ?x"
+        return self._pagedQuery(query, order_by, page_size)
 
 
+    @metered
     def getPropDirectSupers(self, aURI):
         aURI = aURI
-        qres = self.rdflib_graph.query(
+        if self._native():
+            return self._nativeObjects(aURI, rdflib.RDFS.subPropertyOf)
+        qres = self._queryFor(aURI,
               """SELECT DISTINCT ?x
                  WHERE {
-                     { <%s> rdfs:subPropertyOf ?x }
+                     { ?uri rdfs:subPropertyOf ?x }
                      FILTER (!isBlank(?x))
                  } ORDER BY ?x
-                 """ % (aURI))
+                 """)
         return list(qres)
 
 
+    @metered
     def getPropAllSupers(self, aURI):
         """
         note: requires SPARQL 1.1
@@ -324,19 +1514,20 @@ class SparqlHelper(object):
         """
         aURI = aURI
         try:
-            qres = self.rdflib_graph.query(
+            qres = self._queryFor(aURI,
                   """SELECT DISTINCT ?x
                      WHERE {
-                         { <%s> rdfs:subPropertyOf+ ?x }
+                         { ?uri rdfs:subPropertyOf+ ?x }
                          FILTER (!isBlank(?x))
                      }
-                     """ % (aURI))
+                     """)
         except:
             printDebug("... warning: the 'getPropAllSupers' query failed (maybe missing SPARQL 1.1 support?)")
             qres = []
         return list(qres)
 
 
+    @metered
     def getPropAllSubs(self, aURI):
         """
         note: requires SPARQL 1.1
@@ -344,13 +1535,13 @@ class SparqlHelper(object):
         """
         aURI = aURI
         try:
-            qres = self.rdflib_graph.query(
+            qres = self._queryFor(aURI,
                   """SELECT DISTINCT ?x
                      WHERE {
-                         { ?x rdfs:subPropertyOf+ <%s> }
+                         { ?x rdfs:subPropertyOf+ ?uri }
                          FILTER (!isBlank(?x))
                      }
-                     """ % (aURI))
+                     """)
         except:
             printDebug("... warning: the 'getPropAllSubs' query failed (maybe missing SPARQL 1.1 support?)")
             qres = []
@@ -364,8 +1555,12 @@ class SparqlHelper(object):
     # ..................
 
 
+    @metered
     def getSKOSInstances(self):
-        qres = self.rdflib_graph.query(
+        if self._native():
+            concepts = self.rdflib_graph.subjects(rdflib.RDF.type, SKOS.Concept)
+            return [(x,) for x in _sortedTerms([x for x in concepts if not isBlankNode(x)])]
+        qres = self._query(
               """SELECT DISTINCT ?x
                  WHERE {
                      { ?x rdf:type skos:Concept }
@@ -375,38 +1570,46 @@ class SparqlHelper(object):
         return list(qres)
 
 
+    @metered
     def getSKOSDirectSupers(self, aURI):
         aURI = aURI
-        qres = self.rdflib_graph.query(
+        if self._native():
+            return _sortedRows(self._nativeObjects(aURI, SKOS.broader) +
+                               self._nativeSubjects(SKOS.narrower, aURI))
+        qres = self._queryFor(aURI,
               """SELECT DISTINCT ?x
                  WHERE {
                          {
-                             { <%s> skos:broader ?x }
+                             { ?uri skos:broader ?x }
                              UNION
-                             { ?x skos:narrower <%s> }
+                             { ?x skos:narrower ?uri }
                          }
                      FILTER (!isBlank(?x))
                  } ORDER BY ?x
-                 """ % (aURI, aURI))
+                 """)
         return list(qres)
 
 
+    @metered
     def getSKOSDirectSubs(self, aURI):
         """
         2015-08-19: currenlty not used, inferred from above
         """
         aURI = aURI
-        qres = self.rdflib_graph.query(
+        if self._native():
+            return _sortedRows(self._nativeSubjects(SKOS.broader, aURI) +
+                               self._nativeObjects(aURI, SKOS.narrower))
+        qres = self._queryFor(aURI,
               """SELECT DISTINCT ?x
                  WHERE {
                          {
-                             { ?x skos:broader <%s> }
+                             { ?x skos:broader ?uri }
                              UNION
-                             { <%s> skos:narrower ?s }
+                             { ?uri skos:narrower ?x }
                          }
                      FILTER (!isBlank(?x))
                  }
-                 """ % (aURI, aURI))
+                 """)
         return list(qres)
 
 
@@ -419,39 +1622,138 @@ class SparqlHelper(object):
 
 
 
+    @metered
     def entityTriples(self, aURI):
         """ Builds all triples for an entity
         Note: if a triple object is a blank node (=a nested definition)
         we try to extract all relevant data recursively (does not work with
-        sparql endpoins)
+        sparql endpoins), see blank_node_closure
         """
 
         aURI = aURI
-        qres = self.rdflib_graph.query(
-              """CONSTRUCT {<%s> ?y ?z }
+        if self._native():
+            subject = aURI if isinstance(aURI, rdflib.term.Identifier) else rdflib.URIRef(aURI)
+            lres = list(self.rdflib_graph.triples((subject, None, None)))
+            try:
+                return lres + self._blankNodes(lres)
+            except:
+                printDebug("Error extracting blank nodes info", "important")
+                return lres
+        qres = self._queryFor(aURI,
+              """CONSTRUCT {?uri ?y ?z }
                  WHERE {
-                     { <%s> ?y ?z }
+                     { ?uri ?y ?z }
                  }
-                 """ % (aURI, aURI ))
+                 """)
         lres = list(qres)
 
-        def recurse(triples_list):
-            """ uses the rdflib <triples> method to pull out all blank nodes info"""
-            out = []
-            for tripl in triples_list:
-                if isBlankNode(tripl[2]):
-                    # print "blank node", str(tripl[2])
-                    temp = [x for x in self.rdflib_graph.triples((tripl[2], None, None))]
-                    out += temp + recurse(temp)
-                else:
-                    pass
-            return out
-
         if self.sparql_endpoint:
             return lres
         else:
             try:
-                return lres + recurse(lres)
+                return lres + self._blankNodes(lres)
             except:
                 printDebug("Error extracting blank nodes info", "important")
                 return lres
+
+
+
+    # ..................
+    # NATIVE: local graphs scans, equivalent to the queries above
+    # ..................
+
+
+    def _nativeObjects(self, aURI, predicate):
+        """ SELECT DISTINCT ?x WHERE { <aURI> predicate ?x FILTER (!isBlank(?x)) } ORDER BY ?x """
+        objects = self.rdflib_graph.objects(rdflib.URIRef(aURI), predicate)
+        return [(x,) for x in _sortedTerms([x for x in objects if not isBlankNode(x)])]
+
+
+    def _nativeSubjects(self, predicate, aURI):
+        """ SELECT DISTINCT ?x WHERE { ?x predicate <aURI> FILTER (!isBlank(?x)) } ORDER BY ?x """
+        subjects = self.rdflib_graph.subjects(predicate, rdflib.URIRef(aURI))
+        return [(x,) for x in _sortedTerms([x for x in subjects if not isBlankNode(x)])]
+
+
+    def _blankNodes(self, triples):
+        """
+        the triples describing blank nodes objects of <triples>, recursively.
+        Blank nodes already described (eg shared by many entities) are not read again,
+        until the graph changes.
+        """
+        if self._described is None:
+            self._described = ({}, GraphVersion(self.rdflib_graph), None)
+        described, version, seen_version = self._described
+        if version.value != seen_version:
+            described = {}
+            self._described = (described, version, version.value)
+        return blank_node_closure(self.rdflib_graph, triples, described)
+
+
+
+    # ..................
+    # BATCHES: same as the methods above, for many entities with one query
+    # ..................
+
+
+    def _values(self, uris):
+        """ a VALUES block binding ?s to a list of URIs """
+        return "VALUES ?s { %s }" % " ".join([sparql_iri(x) for x in uris])
+
+
+    def _batchSupers(self, uris, pattern):
+        """ SELECT ?s ?x for a list of ?s, split into a dict uri => [(?x,), ..] """
+        out = dict([(x, []) for x in uris])
+        qres = self._query(
+              """SELECT DISTINCT ?s ?x
+                 WHERE {
+                     %s
+                     %s
+                     FILTER (!isBlank(?x))
+                 } ORDER BY ?s ?x
+                 """ % (self._values(uris), pattern))
+        keys = dict([(str(x), x) for x in uris])
+        for row in qres:
+            if str(row[0]) in keys:
+                out[keys[str(row[0])]] += [(row[1],)]
+        return out
+
+
+    @metered
+    def entityTriplesBatch(self, uris):
+        """
+        Builds all triples for a list of entities, with one query.
+        Note: as with entityTriples on sparql endpoints, blank nodes are not followed
+        :return - a dict uri => list of triples
+        """
+        out = dict([(x, []) for x in uris])
+        qres = self._query(
+              """CONSTRUCT { ?s ?y ?z }
+                 WHERE {
+                     %s
+                     ?s ?y ?z
+                 }
+                 """ % self._values(uris))
+        keys = dict([(str(x), x) for x in uris])
+        for tripl in qres:
+            if str(tripl[0]) in keys:
+                out[keys[str(tripl[0])]] += [tripl]
+        return out
+
+
+    @metered
+    def getClassDirectSupersBatch(self, uris):
+        """ :return - a dict uri => results of getClassDirectSupers """
+        return self._batchSupers(uris, "?s rdfs:subClassOf ?x .")
+
+
+    @metered
+    def getPropDirectSupersBatch(self, uris):
+        """ :return - a dict uri => results of getPropDirectSupers """
+        return self._batchSupers(uris, "?s rdfs:subPropertyOf ?x .")
+
+
+    @metered
+    def getSKOSDirectSupersBatch(self, uris):
+        """ :return - a dict uri => results of getSKOSDirectSupers """
+        return self._batchSupers(uris, "{ { ?s skos:broader ?x } UNION { ?x skos:narrower ?s } }")
@@ -0,0 +1,159 @@
+# !/usr/bin/env python
+#  -*- coding: UTF-8 -*-
+
+"""
+Integer ids for the rdflib terms of an Ontospy model, and relations between them
+
+TermDictionary gives each URI (or literal, or blank node) an integer id, shared by
+all the entities of a model. TermRelation keeps a relation between ids, eg class =>
+direct superclasses, as two integer arrays (compressed sparse rows) in both directions,
+so that closures are computed over small ints instead of entities and URI strings.
+
+##################
+#
+#  USAGE
+
+o = Ontospy("foaf.rdf")
+person = o.get_class(uri="http://xmlns.com/foaf/0.1/Person")
+ids = o.class_hierarchy.closure(person.term_id)  # all superclasses
+o.terms.decode(ids)  # => their URIs
+o.class_hierarchy.resolve(ids)  # => the OntoClass objects
+
+##################
+
+"""
+
+from __future__ import print_function
+
+from array import array
+
+
+class TermDictionary(object):
+    """
+    A two-way mapping between rdflib terms and integer ids, assigned in order from 0.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._terms = []
+
+    def __getstate__(self):
+        # the ids are the positions in the list of terms
+        return {'_terms': self._terms}
+
+    def __setstate__(self, state):
+        self._terms = state['_terms']
+        self._ids = dict([(x, n) for n, x in enumerate(self._terms)])
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, term):
+        return term in self._ids
+
+    def id(self, term):
+        """ the id of <term>, which is added if it's new """
+        n = self._ids.get(term)
+        if n is None:
+            n = len(self._terms)
+            self._ids[term] = n
+            self._terms.append(term)
+        return n
+
+    def get_id(self, term, default=None):
+        """ the id of <term>, or <default> if it has none """
+        return self._ids.get(term, default)
+
+    def term(self, n):
+        return self._terms[n]
+
+    def encode(self, terms):
+        """ an array with the ids of <terms> (new ones are added) """
+        return array('i', [self.id(x) for x in terms])
+
+    def decode(self, ids):
+        """ the terms with the given ids """
+        return [self._terms[n] for n in ids]
+
+
+def _csr(start, size, rows):
+    """ (offsets, targets) arrays for a dict id => list of ids, with start <= ids < size """
+    offsets = array('i', [0])
+    targets = array('i')
+    for n in range(start, size):
+        targets.extend(rows.get(n, ()))
+        offsets.append(len(targets))
+    return offsets, targets
+
+
+class TermRelation(object):
+    """
+    A relation between term ids, eg class => direct superclasses, stored as compressed
+    sparse rows: the objects of id n are targets[offsets[n - start]:offsets[n - start + 1]],
+    in the order they were given. The inverse relation (subjects) is stored the same way.
+
+    <size>: number of ids known (ids from a TermDictionary are < len(terms))
+    <rows>: dict id => list of ids related to it
+    <inverse_rows>: same for the inverse relation, which is computed from <rows> if
+        not given (pass it to keep a specific order, eg the order of children)
+    <entities>: dict id => object (eg an OntoClass) returned by resolve()
+    Only the ids from the lowest one in <rows>, <inverse_rows> and <entities> on take
+    up space, so that eg the properties hierarchy doesn't pay for the classes ids.
+    """
+
+    def __init__(self, size, rows, inverse_rows=None, entities=None):
+        if inverse_rows is None:
+            inverse_rows = {}
+            for n in sorted(rows):
+                for m in rows[n]:
+                    inverse_rows.setdefault(m, []).append(n)
+        entities = entities or {}
+        self.start = min([size] + list(rows) + list(inverse_rows) + list(entities))
+        self.size = size
+        self._offsets, self._targets = _csr(self.start, size, rows)
+        self._inverse_offsets, self._inverse_targets = _csr(self.start, size, inverse_rows)
+        self.entities = [entities.get(n) for n in range(self.start, size)]
+
+    def __len__(self):
+        """ number of pairs in the relation """
+        return len(self._targets)
+
+    def objects(self, n):
+        """ the ids related to <n>, eg the direct superclasses of a class """
+        if n is None or not self.start <= n < self.size:
+            return array('i')
+        n -= self.start
+        return self._targets[self._offsets[n]:self._offsets[n + 1]]
+
+    def subjects(self, n):
+        """ the ids <n> is related to by the inverse relation, eg the direct subclasses """
+        if n is None or not self.start <= n < self.size:
+            return array('i')
+        n -= self.start
+        return self._inverse_targets[self._inverse_offsets[n]:self._inverse_offsets[n + 1]]
+
+    def closure(self, n, inverse=False):
+        """
+        All the ids reachable from <n>, eg all the superclasses of a class (all the
+        subclasses if <inverse>). Depth first, each id once and in the order it's first
+        reached: same as following parents() recursively, without duplicates.
+        Cycles are fine; <n> itself is not included.
+        """
+        step = self.subjects if inverse else self.objects
+        seen = set([n])
+        out = []
+        stack = [iter(step(n))]
+        while stack:
+            for m in stack[-1]:
+                if m not in seen:
+                    seen.add(m)
+                    out.append(m)
+                    stack.append(iter(step(m)))
+                    break
+            else:
+                stack.pop()
+        return out
+
+    def resolve(self, ids):
+        """ the entities with the given ids """
+        return [self.entities[n - self.start] for n in ids]
@@ -17,7 +17,7 @@ from rdflib import RDFS, RDF, BNode
 from rdflib.namespace import OWL, DC
 DEFAULT_LANGUAGE = "en"
 
-import sys, os, subprocess, random, platform
+import sys, os, subprocess, random, platform, tempfile
 
 import click
 
@@ -376,6 +376,47 @@ def truncate(data, l=20):
 
 
 
+def write_atomic(path, data):
+    """
+    Write bytes to a temporary file in the same folder, then rename it, so that
+    readers never see a partially written file
+    """
+    folder = os.path.dirname(path)
+    fd, tmppath = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmppath, 0o644)  # mkstemp creates files readable by the owner only
+        if hasattr(os, "replace"):
+            os.replace(tmppath, path)
+        else:  # python 2
+            if os.name == "nt" and os.path.exists(path):
+                os.remove(path)
+            os.rename(tmppath, path)
+    except:
+        if os.path.exists(tmppath):
+            os.remove(tmppath)
+        raise
+
+
+def sizeof_fmt(num, suffix='B'):
+    """
+    human readable file size
+    http://stackoverflow.com/questions/1094841/reusable-library-to-get-human-readable-version-of-file-size
+
+    >>> sizeof_fmt(2048)
+    '2.0KB'
+    """
+    for unit in ['', 'K', 'M', 'G', 'T']:
+        if abs(num) < 1024.0:
+            return "%3.1f%s%s" % (num, unit, suffix)
+        num /= 1024.0
+    return "%.1f%s%s" % (num, 'P', suffix)
+
+
+
 
 
 # ========
@@ -383,7 +424,75 @@ def truncate(data, l=20):
 # ===========
 
 
-NAMESPACES_DEFAULT = [
+class NamespaceIndex(list):
+    """
+    A list of (prefix, namespace uri) tuples, as returned by rdflib graph.namespaces(),
+    which can also find the longest namespace a URI starts with without going through
+    the whole list (see match and qname).
+
+    Namespaces are grouped by length, so a lookup costs one dict access per distinct
+    length, longest first. The lookup tables are built on first use, and again after
+    the list is changed in any way. When the same namespace appears more than once,
+    the first tuple wins.
+    """
+
+    _index = None
+
+    def _tables(self):
+        if self._index is None:
+            tables = {}
+            for prefix, ns in self:
+                table = tables.setdefault(len(ns), {})
+                if str(ns) not in table:
+                    if not prefix:  # for base NS, it's empty
+                        prefix = inferNamespacePrefix(ns)
+                    table[str(ns)] = ((prefix or ""), (prefix, ns))
+            self._index = sorted(tables.items(), reverse=True)
+        return self._index
+
+    def _lookup(self, uri):
+        for length, table in self._tables():
+            if len(uri) >= length:
+                found = table.get(uri[:length])
+                if found is not None:
+                    return found
+        return None
+
+    def match(self, uri):
+        """ the (prefix, namespace) tuple with the longest namespace <uri> starts with, or None """
+        found = self._lookup(str(uri))
+        return found[1] if found else None
+
+    def qname(self, uri):
+        """
+        <uri> with its longest matching namespace replaced by the prefix, eg 'owl:Class'
+        (':Class' if no prefix can be inferred), or the uri as it is if none matches.
+        """
+        stringa = str(uri)
+        found = self._lookup(stringa)
+        if found is None:
+            return stringa
+        return found[0] + ":" + stringa[len(found[1][1]):]
+
+
+def _namespaceIndexChange(name):
+    """ the list method <name>, for NamespaceIndex: it also drops the lookup tables """
+    method = getattr(list, name)
+
+    def change(self, *args, **kwargs):
+        self._index = None
+        return method(self, *args, **kwargs)
+    change.__name__ = name
+    change.__doc__ = method.__doc__
+    return change
+
+for _name in ["__setitem__", "__delitem__", "__setslice__", "__delslice__", "__iadd__", "__imul__",
+              "append", "extend", "insert", "remove", "pop", "clear", "sort", "reverse"]:
+    if hasattr(list, _name):  # eg no clear in python 2, no __setslice__ in python 3
+        setattr(NamespaceIndex, _name, _namespaceIndexChange(_name))
+
+
+NAMESPACES_DEFAULT = NamespaceIndex([
             ("rdf",  rdflib.URIRef("http://www.w3.org/1999/02/22-rdf-syntax-ns#")),
             ("rdfs",  rdflib.URIRef("http://www.w3.org/2000/01/rdf-schema#")),
             ("xml",  rdflib.URIRef("http://www.w3.org/XML/1998/namespace")),
@@ -391,7 +500,7 @@ NAMESPACES_DEFAULT = [
             ('foaf',  rdflib.URIRef("http://xmlns.com/foaf/0.1/")),
             ("skos",  rdflib.URIRef("http://www.w3.org/2004/02/skos/core#")),
             ("owl",  rdflib.URIRef("http://www.w3.org/2002/07/owl#")),
-        ]
+        ])
 
 
 
@@ -737,26 +846,20 @@ def uri2niceString(aUri, namespaces = None):
     ('rdf', rdflib.URIRef('http://www.w3.org/1999/02/22-rdf-syntax-ns#'))
     (u'xsd', rdflib.URIRef('http://www.w3.org/2001/XMLSchema#'))]
 
+    The longest matching namespace is used. Passing a NamespaceIndex (eg Ontospy.namespaces)
+    avoids rebuilding its lookup tables at each call.
     """
     if not namespaces:
         namespaces = NAMESPACES_DEFAULT
+    elif not isinstance(namespaces, NamespaceIndex):
+        namespaces = NamespaceIndex(namespaces)
 
     if type(aUri) == rdflib.term.URIRef:
         # we have a URI: try to create a qName
-        stringa = aUri.toPython()
-        for aNamespaceTuple in namespaces:
-            try: # check if it matches the available NS
-                if stringa.find(aNamespaceTuple[1].__str__()) == 0:
-                    if aNamespaceTuple[0]: # for base NS, it's empty
-                        stringa = aNamespaceTuple[0] + ":" + stringa[len(aNamespaceTuple[1].__str__()):]
-                    else:
-                        prefix = inferNamespacePrefix(aNamespaceTuple[1])
-                        if prefix:
-                            stringa = prefix + ":" + stringa[len(aNamespaceTuple[1].__str__()):]
-                        else:
-                            stringa = ":" + stringa[len(aNamespaceTuple[1].__str__()):]
-            except:
-                stringa = "error"
+        try:
+            stringa = namespaces.qname(aUri.toPython())
+        except:
+            stringa = "error"
 
     elif type(aUri) == rdflib.term.Literal:
         stringa = "\"%s\"" % aUri  # no string casting so to prevent encoding errors
@@ -234,6 +234,7 @@ class Shell(cmd.Cmd):
         self._print("..datatype......: %d" % len(graph.all_properties_datatype), "TIP")
         self._print("..object........: %d" % len(graph.all_properties_object), "TIP")
         self._print("Concepts(SKOS)..: %d" % len(graph.all_skos_concepts), "TIP")
+        self._print("Instances.......: %d" % sum(graph.instance_counts().values()), "TIP")
         self._print("----------------", "TIP")
 
     def _printDescription(self, hrlinetop=True):
@@ -437,9 +438,9 @@ class Shell(cmd.Cmd):
         if self.currentEntity['type'] == 'class':
             if hrlinetop:
                 self._print("----------------")
-            self._print("INSTANCES: [%d]" % len(x.instances, "IMPORTANT"))
-            for i in x.instances:
-                self._print(i.qname)
+            self._print("INSTANCES: [%d]" % x.count(), "IMPORTANT")
+            for uri in x.iter_instances():
+                self._print(uri2niceString(uri, x.namespaces))
             self._print("----------------")
         return
 
@@ -533,6 +534,7 @@ class Shell(cmd.Cmd):
 
         Unless preview_mode=True, it is always loaded from the local repository
         note: if the ontology does not have a cached version, it is created
+        note: recently used ontologies are kept in memory (see manager.MODELS_CACHE)
 
         preview_mode: used to pass a URI/path to be inspected without saving it locally
         """
@@ -548,6 +550,9 @@ class Shell(cmd.Cmd):
         self.current = {'file': filename, 'fullpath': fullpath, 'graph': g}
         self.currentEntity = None
         self._print_entity_intro(g)
+        if not preview_mode and len(self.all_ontologies) > 1:
+            # load the next model in the background, so that `next` is instant
+            manager.prefetch_ontology(self._next_ontology())
 
     def _select_ontology(self, line):
         """try to select an ontology NP: the actual load from FS is in <_load_ontology> """
@@ -33,7 +33,12 @@ import sys
 import time
 import math
 import optparse
+import re
+import json
+import codecs
+import threading
 import xml.dom.minidom
+import xml.etree.ElementTree as ElementTree
 
 
 try:
@@ -42,6 +47,11 @@ except:
 	print("Error: can't find SPARQLWrapper (==> easy_install SPARQLWrapper)")
 	sys.exit()
 
+try:
+	from ..core.sparqlHelper import QueryExecutor, QueryMetrics, get_rate_limiter, metered, current_method
+except (ImportError, ValueError):  # run as a script
+	from ontospy.core.sparqlHelper import QueryExecutor, QueryMetrics, get_rate_limiter, metered, current_method
+
 
 
 __version__ = "0.1"
@@ -55,6 +65,101 @@ VERSION = "%prog v" + __version__
 
 AGENT = "%s/%s" % (__name__, __version__)
 
+SPARQL_RESULTS_NS = "{http://www.w3.org/2005/sparql-results#}"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+# bytes read at a time from the response when streaming results
+STREAM_CHUNK_SIZE = 64 * 1024
+BINDINGS_START = re.compile(r'"bindings"\s*:\s*\[')
+
+
+
+def binding_to_term(value):
+	"""
+	Turn a value from a SPARQL JSON binding (eg {'type': 'uri', 'value': ...})
+	into an rdflib term.
+	"""
+	import rdflib
+	if value['type'] == "uri":
+		return rdflib.URIRef(value['value'])
+	elif value['type'] == "bnode":
+		return rdflib.BNode(value['value'])
+	else:  # 'literal' or 'typed-literal' (SPARQL 1.0)
+		datatype = value.get('datatype')
+		return rdflib.Literal(value['value'], lang=value.get('xml:lang'),
+							  datatype=rdflib.URIRef(datatype) if datatype else None)
+
+
+def iter_json_bindings(stream, typed=False, chunk_size=STREAM_CHUNK_SIZE):
+	"""
+	Parse SPARQL JSON results from a file-like object, yielding each binding as
+	soon as it has been read: only one binding at a time is kept in memory.
+	Bindings are dicts as in the JSON format, or {var: rdflib term} if <typed>.
+	"""
+	decoder = json.JSONDecoder()
+	reader = codecs.getincrementaldecoder("utf-8")()
+	buf, pos, eof = "", 0, False
+
+	def more(buf, pos):
+		data = stream.read(chunk_size)
+		return buf[pos:] + reader.decode(data, final=not data), 0, not data
+
+	# skip to the start of the bindings list
+	while True:
+		match = BINDINGS_START.search(buf, pos)
+		if match:
+			pos = match.end()
+			break
+		if eof:
+			return  # eg an ASK query
+		buf, pos, eof = more(buf, max(pos, len(buf) - 20))  # the match may be split across chunks
+	while True:
+		while pos < len(buf) and buf[pos] in " \t\r\n,":
+			pos += 1
+		if pos < len(buf) and buf[pos] == "]":
+			return
+		try:
+			binding, end = decoder.raw_decode(buf, pos)
+		except ValueError:  # incomplete
+			if eof:
+				raise
+			buf, pos, eof = more(buf, pos)
+			continue
+		pos = end
+		if typed:
+			binding = dict([(k, binding_to_term(v)) for k, v in binding.items()])
+		yield binding
+
+
+def iter_xml_bindings(stream, typed=False):
+	"""
+	Parse SPARQL XML results from a file-like object, yielding each result as
+	soon as it has been read. Results are dicts in the same format as JSON
+	bindings, or {var: rdflib term} if <typed>.
+	Results are dropped from the tree once read, so memory does not grow with their number.
+	"""
+	parent = None  # the <results> element
+	for event, elem in ElementTree.iterparse(stream, events=("start", "end")):
+		if event == "start":
+			if elem.tag == SPARQL_RESULTS_NS + "results":
+				parent = elem
+			continue
+		if elem.tag != SPARQL_RESULTS_NS + "result":
+			continue
+		binding = {}
+		for b in elem.findall(SPARQL_RESULTS_NS + "binding"):
+			value = b[0]
+			item = {'type': value.tag[len(SPARQL_RESULTS_NS):], 'value': value.text or ""}
+			if value.get(XML_LANG):
+				item['xml:lang'] = value.get(XML_LANG)
+			if value.get("datatype"):
+				item['datatype'] = value.get("datatype")
+			binding[b.get("name")] = binding_to_term(item) if typed else item
+		elem.clear()
+		if parent is not None:
+			parent.remove(elem)
+		yield binding
+
 
 
 
@@ -77,10 +182,25 @@ class SparqlEndpoint(object):
 		 u'value': u'http://ns.nature.com/subjects/chemistry_publishing'}},  ... etc....
 		]}}
 
+	Many queries can be sent at the same time with `queryMany`: <concurrency> is the
+	max number of requests running at once, <rate_limit> the max number of requests
+	per second (shared with all the other clients of the same endpoint in this process).
+
+	If a <query_cache> (see ontospy.core.sparqlHelper.QueryCache) is passed, converted JSON
+	results are kept there and reused. Set <bypass_cache> to always query the endpoint.
+
+	With `stream=True`, `query` and `allTriplesForURI` return an iterator over the bindings,
+	parsed as they are received (JSON or XML): large results use little memory and the first
+	rows are available straight away. Add `typed=True` to get rdflib terms instead of dicts.
+
+	Calls, latency, results and cache hits are counted per method in `metrics`
+	(see ontospy.core.sparqlHelper.QueryMetrics).
+
 	"""
 
-	def __init__(self, endpoint, prefixes={}, verbose=True):
+	def __init__(self, endpoint, prefixes={}, verbose=True, concurrency=1, rate_limit=None, query_cache=None):
 		self.sparql = SPARQLWrapper(endpoint)
+		self.sparql.setUseKeepAlive()
 		self.prefixes = {
 
 			"dc": "http://purl.org/dc/elements/1.1/"  ,
@@ -95,12 +215,18 @@ class SparqlEndpoint(object):
 		}
 		self.prefixes.update(prefixes)
 		self.verbose = verbose
-		self.format = ""  # dynamically assigned at query time
 		self.endpoint = endpoint  # just for caching it
+		self.executor = QueryExecutor(concurrency)
+		self.rate_limiter = get_rate_limiter(endpoint, rate_limit)
+		self._local = threading.local()  # SPARQLWrapper instances are not thread safe
+		self.query_cache = query_cache
+		self.bypass_cache = False
+		self.metrics = QueryMetrics()
 
 
 
-	def query(self, q, format="", convert=True):
+	@metered
+	def query(self, q, format="", convert=True, stream=False, typed=False):
 		"""
 		Generic SELECT query structure. 'q' is the main body of the query.
 
@@ -109,19 +235,34 @@ class SparqlEndpoint(object):
 
 		If convert is False, we return the collection of rdflib instances
 
+		If stream is True, we return an iterator over the bindings (see iter_json_bindings)
+
 		"""
 
-		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.iteritems()]
+		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.items()]
 		lines.extend(q.split("\n"))
 		query = "\n".join(lines)
 
 		if self.verbose:
 			print(query, "\n\n")
 
+		if stream:
+			return self.__doStreamQuery(query, format, typed)
 		return self.__doQuery(query, format, convert)
 
 
 
+	@metered
+	def queryMany(self, queries, format="", convert=True):
+		"""
+		Run a list of SELECT queries (as in 'query'), up to <concurrency> at the same time.
+		Returns the list of results, in the same order as the queries.
+		"""
+		return self.executor.map(lambda q: self.query(q, format, convert), queries)
+
+
+
+	@metered
 	def describe(self, uri, format="", convert=True):
 		"""
 		A simple DESCRIBE query with no 'where' arguments. 'uri' is the resource you want to describe.
@@ -130,7 +271,7 @@ class SparqlEndpoint(object):
 		For the moment we're not using them much.. needs to be tested more.
 
 		"""
-		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.iteritems()]
+		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.items()]
 		if uri.startswith("http://"):
 			lines.extend(["DESCRIBE <%s>" % uri])
 		else:  # it's a shortened uri
@@ -146,7 +287,8 @@ class SparqlEndpoint(object):
 
 
 
-	def allTriplesForURI(self, resource_uri, format="", convert=True):
+	@metered
+	def allTriplesForURI(self, resource_uri, format="", convert=True, stream=False, typed=False):
 		"""
 		Get all triples for a URI TODO: expand with union where URI is both predicate and object
 		"""
@@ -156,7 +298,7 @@ class SparqlEndpoint(object):
 		else:  # it's a QName
 			pass
 
-		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.iteritems()]
+		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.items()]
 		q =  """
 			SELECT *
 			WHERE { %s ?pred ?obj . }""" % resource_uri
@@ -168,17 +310,19 @@ class SparqlEndpoint(object):
 		if self.verbose:
 			print(query, "\n\n")
 
-
+		if stream:
+			return self.__doStreamQuery(query, format, typed)
 		return self.__doQuery(query, format, convert)
 
 
 
+	@metered
 	def ontology(self, format="", convert=True):
 		"""
 		Get all entities of type owl:Class
 		"""
 
-		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.iteritems()]
+		lines = ["PREFIX %s: <%s>" % (k, r) for k, r in self.prefixes.items()]
 		q =  """
 			SELECT *
 			WHERE { ?class a owl:Class }"""
@@ -194,35 +338,85 @@ class SparqlEndpoint(object):
 		return self.__doQuery(query, format, convert)
 
 
-	def __getFormat(self, format):
+	def __getWrapper(self):
+		"""
+		The SPARQLWrapper instance for the current thread
+		"""
+		if not self.executor.in_worker():
+			return self.sparql
+		wrapper = getattr(self._local, "sparql", None)
+		if wrapper is None:
+			wrapper = SPARQLWrapper(self.endpoint)
+			wrapper.setUseKeepAlive()
+			self._local.sparql = wrapper
+		return wrapper
+
+
+	def __getFormat(self, format, wrapper=None):
 		"""
 		Defaults to JSON  [ps: 'RDF' is the native rdflib representation]
+		Sets the return format of <wrapper>, and returns it: queries run on several
+		threads (see queryMany) so it's not kept on the instance.
 		"""
+		wrapper = wrapper or self.sparql
 		if format == "XML":
-			self.sparql.setReturnFormat(XML)
-			self.format = "XML"
+			wrapper.setReturnFormat(XML)
+			return "XML"
 		elif format == "RDF":
-			self.sparql.setReturnFormat(RDF)
-			self.format = "RDF"
+			wrapper.setReturnFormat(RDF)
+			return "RDF"
 		else:
-			self.sparql.setReturnFormat(JSON)
-			self.format = "JSON"
+			wrapper.setReturnFormat(JSON)
+			return "JSON"
 
 
 	def __doQuery(self, query, format, convert):
 		"""
 		Inner method that does the actual query
 		"""
-		self.__getFormat(format)
-		self.sparql.setQuery(query)
+		wrapper = self.__getWrapper()
+		format = self.__getFormat(format, wrapper)
+		# only JSON results are plain python objects that can be stored
+		cache = self.query_cache if (convert and format == "JSON") else None
+		if cache is not None and not self.bypass_cache:
+			results = cache.get(self.endpoint, query)
+			if results is not None:
+				self.metrics.record_query(current_method() or "query", cache_hit=True)
+				return results
+		self.metrics.record_query(current_method() or "query")
+		wrapper.setQuery(query)
+		self.rate_limiter.wait()
 		if convert:
-			results = self.sparql.query().convert()
+			results = wrapper.query().convert()
 		else:
-			results = self.sparql.query()
+			results = wrapper.query()
+		if cache is not None:
+			cache.put(self.endpoint, query, results)
 
 		return results
 
 
+	def __doStreamQuery(self, query, format, typed):
+		"""
+		Like __doQuery, but the results are parsed while they are read from the response
+		"""
+		wrapper = self.__getWrapper()
+		format = self.__getFormat("XML" if format == "XML" else "JSON", wrapper)
+		self.metrics.record_query(current_method() or "query")
+		wrapper.setQuery(query)
+		self.rate_limiter.wait()
+		response = wrapper.query().response
+		if format == "XML":
+			parser = iter_xml_bindings(response, typed)
+		else:
+			parser = iter_json_bindings(response, typed)
+		try:
+			for binding in parser:
+				yield binding
+		finally:
+			response.close()
+
+
 
 
 
@@ -264,11 +458,15 @@ def parse_options():
 			action="store_true", default=False, dest="ontology",
 			help="Get all entities of type owl:Class - aka the ontology")
 
+	parser.add_option("-s", "--stream",
+			action="store_true", default=False, dest="stream",
+			help="Print out results while they are received (with --query or --alltriples)")
+
 	opts, args = parser.parse_args()
 
 	if len(args) < 1:
 		parser.print_help()
-		raise SystemExit, 1
+		raise SystemExit(1)
 
 	return opts, args
 
@@ -281,6 +479,7 @@ def main():
 	opts, args = parse_options()
 	url = args[0]
 	query, format, describe, alltriples, ontology = opts.query, opts.format, opts.describe, opts.alltriples, opts.ontology
+	stream = opts.stream and bool(query or alltriples)
 
 	sTime = time.time()
 
@@ -288,22 +487,30 @@ def main():
 
 	if query:
 		print("Contacting %s ... \nQuery: \"%s\"; Format: %s\n" % (url, query, format))
-		results = s.query(query, format)
+		results = s.query(query, format, stream=stream)
 	elif describe:
 		print("Contacting %s ... \nQuery: DESCRIBE %s; Format: %s\n" % (url, describe, format))
 		results = s.describe(describe, format)
 	elif alltriples:
 		print("Contacting %s ... \nQuery: ALL TRIPLES FOR %s; Format: %s\n" % (url, alltriples, format))
-		results = s.allTriplesForURI(alltriples, format)
+		results = s.allTriplesForURI(alltriples, format, stream=stream)
 	elif ontology:
 		print("Contacting %s ... \nQuery: ONTOLOGY; Format: %s\n" % (url, format))
 		results = s.ontology(format)
 
 
-	if format == "JSON":
+	if stream:
+		n = 0
+		for d in results:
+			for k, v in d.items():
+				print("[%s] %s=> %s" % (k, v['type'],v['value']))
+			print("----")
+			n += 1
+		results = range(n)
+	elif format == "JSON":
 		results = results["results"]["bindings"]
 		for d in results:
-			for k, v in d.iteritems():
+			for k, v in d.items():
 				print("[%s] %s=> %s" % (k, v['type'],v['value']))
 			print("----")
 	elif format == "XML":
@@ -332,5 +539,5 @@ if __name__ == "__main__":
     try:
         main()
         sys.exit(0)
-    except KeyboardInterrupt, e: # Ctrl-C
+    except KeyboardInterrupt as e: # Ctrl-C
         raise e
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+A local SPARQL endpoint, for testing and benchmarking ontospy without a live service.
+
+LocalSparqlEndpoint serves any rdflib graph over the SPARQL 1.1 protocol (queries
+via GET or POST) from a thread of the current process. A delay can be added to each
+request, to behave like a remote service, and the number of results returned can be
+capped, like most public endpoints do.
+
+##################
+#
+#  USAGE
+
+from ontospy.extras.sparqlserver import LocalSparqlEndpoint
+
+with LocalSparqlEndpoint(graph, latency=0.05) as server:
+    o = Ontospy(sparql_endpoint=server.url)
+    o.build_all()
+    print(server.stats())
+
+# or, to time a scan of a file served as an endpoint
+
+python -m ontospy.extras.sparqlserver ontospy/tests/rdf/pizza.ttl --latency 0.05 --runs 3
+
+##################
+
+"""
+
+from __future__ import print_function
+
+import sys
+import time
+import optparse
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+import rdflib
+
+USAGE = "%prog [options] <rdf file>"
+
+RESULTS_MIME_TYPES = {
+    'json': 'application/sparql-results+json',
+    'xml': 'application/sparql-results+xml',
+}
+
+GRAPH_MIME_TYPES = {
+    'xml': 'application/rdf+xml',
+    'turtle': 'text/turtle',
+    'nt': 'application/n-triples',
+}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _SparqlRequestHandler(BaseHTTPRequestHandler):
+    """
+    Handles SPARQL protocol requests: the endpoint is available from self.server.endpoint
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive connections
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        self._answer(params.get('query', [None])[0], len(self.path))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode("utf-8")
+        content_type = self.headers.get('Content-Type') or ""
+        if content_type.startswith("application/sparql-query"):
+            query = body
+        else:
+            params = parse_qs(urlparse(self.path).query)
+            params.update(parse_qs(body))
+            query = params.get('query', [None])[0]
+        self._answer(query, len(self.path) + length)
+
+    def _answer(self, query, size_in):
+        endpoint = self.server.endpoint
+        if not query and endpoint.description is not None:
+            # a SPARQL service description, eg with void:triples figures
+            data = endpoint.description.serialize(format="turtle")
+            return self._send(200, "text/turtle", data, query, size_in)
+        if not query:
+            return self._send(400, "text/plain", b"Missing 'query' parameter", query, size_in)
+        if endpoint.latency:
+            time.sleep(endpoint.latency)
+        try:
+            data, content_type = endpoint.run(query, self.headers.get('Accept') or "")
+        except Exception as e:
+            return self._send(400, "text/plain", str(e).encode("utf-8"), query, size_in)
+        self._send(200, content_type, data, query, size_in)
+
+    def _send(self, status, content_type, data, query, size_in):
+        # logged first, so that stats are up to date once the client has the response
+        self.server.endpoint._log(query, status, size_in, len(data))
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class LocalSparqlEndpoint(object):
+    """
+    An in-process SPARQL endpoint serving an rdflib graph.
+
+    <latency>: seconds added to each request
+    <max_results>: max number of rows (or triples) returned by a query, the rest is
+        silently dropped as done by public endpoints
+    <port>: 0 picks a free one; the endpoint address is in `url` once started
+    <description>: an rdflib graph returned to requests with no query, as a SPARQL
+        service description
+
+    Requests are counted: see `stats()` and `reset_stats()`.
+    """
+
+    def __init__(self, graph, latency=0, max_results=None, host="127.0.0.1", port=0, description=None):
+        self.graph = graph
+        self.description = description
+        self.latency = latency
+        self.max_results = max_results
+        self.host = host
+        self.port = port
+        self.url = None
+        self.log = []  # (query, status, bytes received, bytes sent)
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()  # rdflib graphs are not thread safe
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        self._server = _ThreadingHTTPServer((self.host, self.port), _SparqlRequestHandler)
+        self._server.endpoint = self
+        self.url = "http://%s:%d/sparql" % (self.host, self._server.server_address[1])
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server, self._thread = None, None
+
+    def run(self, query, accept=""):
+        """
+        Run a query on the graph: returns the serialized results and their content type,
+        picked according to the Accept header (XML by default).
+        """
+        with self._lock:
+            res = self.graph.query(query)
+            if res.type in ("CONSTRUCT", "DESCRIBE"):
+                triples = list(res.graph)
+                if self.max_results is not None:
+                    triples = triples[:self.max_results]
+                out = rdflib.Graph()
+                for t in triples:
+                    out.add(t)
+                fmt = "xml"
+                if "turtle" in accept:
+                    fmt = "turtle"
+                elif "n-triples" in accept:
+                    fmt = "nt"
+                return out.serialize(format=fmt), GRAPH_MIME_TYPES[fmt]
+            if res.type == "SELECT" and self.max_results is not None:
+                res.bindings = res.bindings[:self.max_results]
+            fmt = "json" if "json" in accept else "xml"
+            return res.serialize(format=fmt), RESULTS_MIME_TYPES[fmt]
+
+    def _log(self, query, status, size_in, size_out):
+        with self._lock:
+            self.log.append((query, status, size_in, size_out))
+
+    def stats(self):
+        """ number of requests, errors and bytes transferred since the last reset """
+        with self._lock:
+            return {
+                'requests': len(self.log),
+                'errors': len([x for x in self.log if x[1] != 200]),
+                'bytes_received': sum([x[2] for x in self.log]),
+                'bytes_sent': sum([x[3] for x in self.log]),
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.log = []
+
+
+def benchmark_scan(graph, runs=1, latency=0, max_results=None, **kwargs):
+    """
+    Time how long it takes to extract a model from an rdflib graph served as a sparql
+    endpoint. Other keyword arguments are passed to Ontospy (eg page_size, concurrency).
+
+    Returns a list of dicts, one per run: seconds taken, number of requests, bytes
+    transferred and number of classes and properties found.
+    """
+    from ..core.ontospy import Ontospy
+
+    out = []
+    with LocalSparqlEndpoint(graph, latency=latency, max_results=max_results) as server:
+        for n in range(runs):
+            server.reset_stats()
+            sTime = time.time()
+            o = Ontospy(sparql_endpoint=server.url, **kwargs)
+            o.build_all()
+            item = server.stats()
+            item['time'] = time.time() - sTime
+            item['classes'] = len(o.all_classes)
+            item['properties'] = len(o.all_properties)
+            out.append(item)
+    return out
+
+
+def parse_options():
+    """
+    parse_options() -> opts, args
+
+    Parse any command-line options given returning both
+    the parsed options and arguments.
+    """
+
+    parser = optparse.OptionParser(usage=USAGE)
+
+    parser.add_option("-l", "--latency",
+            action="store", type="float", default=0, dest="latency",
+            help="Seconds added to each request")
+
+    parser.add_option("-m", "--max-results",
+            action="store", type="int", default=None, dest="max_results",
+            help="Max number of results returned by a query")
+
+    parser.add_option("-r", "--runs",
+            action="store", type="int", default=1, dest="runs",
+            help="Number of times the scan is repeated")
+
+    parser.add_option("-p", "--page-size",
+            action="store", type="int", default=None, dest="page_size",
+            help="Number of results fetched per request when listing entities")
+
+    parser.add_option("-c", "--concurrency",
+            action="store", type="int", default=None, dest="concurrency",
+            help="Max number of requests sent at the same time")
+
+    opts, args = parser.parse_args()
+
+    if len(args) < 1:
+        parser.print_help()
+        raise SystemExit(1)
+
+    return opts, args
+
+
+def main():
+    from ..core.ontospy import Ontospy
+
+    opts, args = parse_options()
+    graph = Ontospy(args[0], build_all=False).rdflib_graph
+    print("Serving %s (%d triples) - latency: %0.3fs" % (args[0], len(graph), opts.latency))
+    results = benchmark_scan(graph, opts.runs, opts.latency, opts.max_results,
+                             page_size=opts.page_size, concurrency=opts.concurrency)
+    print("-" * 10)
+    for n, x in enumerate(results):
+        print("Run %d:	   %0.2fs, %d requests, %d bytes sent, %d received (%d classes, %d properties)" % (
+            n + 1, x['time'], x['requests'], x['bytes_sent'], x['bytes_received'], x['classes'], x['properties']))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+        sys.exit(0)
+    except KeyboardInterrupt as e:  # Ctrl-C
+        raise e
@@ -0,0 +1,327 @@
+# !/usr/bin/env python
+#  -*- coding: UTF-8 -*-
+"""
+Unit test stub for ontosPy
+
+Run like this:
+
+:path/to/ontospyProject>python -m ontospy.tests.test_cache
+
+"""
+
+from __future__ import print_function
+
+import unittest, os, sys, time, shutil, tempfile, threading
+from .. import *
+from ..core import *
+from ..core.utils import *
+from ..core.manager import *
+from ..core.manager import _write_pickle, _read_pickle
+
+
+
+# sanity check
+print("-------------------\nOntospy ",  VERSION, "\n-------------------")
+
+
+class TestCache(unittest.TestCase):
+
+	def setUp(self):
+		self.cache_top = tempfile.mkdtemp()
+		self.cache_dir = os.path.join(self.cache_top, VERSION)
+		os.makedirs(self.cache_dir)
+		self.library_dir = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.cache_top, ignore_errors=True)
+		shutil.rmtree(self.library_dir, ignore_errors=True)
+
+	def _add_entry(self, name, size, atime, folder=None):
+		path = os.path.join(folder or self.cache_dir, name + ".pickle")
+		with open(path, "wb") as f:
+			f.write(b"x" * size)
+		os.utime(path, (atime, atime))
+		return path
+
+	def test1_lru_eviction(self):
+		"""
+		Check that the least recently used items are removed first
+		"""
+		printDebug("=================\nTEST 1: cache LRU eviction\n=================", "important")
+		now = time.time()
+		self._add_entry("old.rdf", 100, now - 300)
+		self._add_entry("middle.rdf", 100, now - 200)
+		recent = self._add_entry("recent.rdf", 100, now - 100)
+		library = ["old.rdf", "middle.rdf", "recent.rdf"]
+
+		report = cache_gc(max_size=150, cache_dir=self.cache_dir, cache_top=self.cache_top, library=library, library_dir=self.library_dir)
+		print(report)
+		self.assertEqual(report['evicted'], ["old.rdf", "middle.rdf"])
+		self.assertEqual([x['path'] for x in get_cache_entries(self.cache_dir)], [recent])
+
+	def test2_gc_versions_and_orphans(self):
+		"""
+		Check that folders for other versions and items for deleted files are removed
+		"""
+		printDebug("=================\nTEST 2: cache garbage collection\n=================", "important")
+		old_version = os.path.join(self.cache_top, "v0.0.1")
+		os.makedirs(old_version)
+		self._add_entry("foaf.rdf", 100, time.time(), folder=old_version)
+		self._add_entry("foaf.rdf", 100, time.time())
+		self._add_entry("deleted.rdf", 100, time.time())
+
+		stats = get_cache_stats(cache_dir=self.cache_dir, cache_top=self.cache_top, library=["foaf.rdf"], library_dir=self.library_dir)
+		self.assertEqual(stats['items'], 2)
+		self.assertEqual(stats['orphans'], 1)
+		self.assertEqual(stats['versions'], 1)
+
+		report = cache_gc(max_size=10000, cache_dir=self.cache_dir, cache_top=self.cache_top, library=["foaf.rdf"], library_dir=self.library_dir)
+		print(report)
+		self.assertEqual(report['versions'], ["v0.0.1"])
+		self.assertEqual(report['orphans'], ["deleted.rdf"])
+		self.assertEqual(report['freed'], 200)
+		self.assertFalse(os.path.exists(old_version))
+		self.assertEqual([x['name'] for x in get_cache_entries(self.cache_dir)], ["foaf.rdf"])
+
+	def test3_keep(self):
+		"""
+		Check that an item just cached is never evicted, even if it's over budget
+		"""
+		printDebug("=================\nTEST 3: cache eviction keeps items\n=================", "important")
+		path = self._add_entry("big.rdf", 1000, time.time() - 1000)
+		report = cache_gc(max_size=10, keep=[path], cache_dir=self.cache_dir, cache_top=self.cache_top, library=["big.rdf"], library_dir=self.library_dir)
+		self.assertEqual(report['evicted'], [])
+		self.assertTrue(os.path.exists(path))
+
+
+	def test4_memory_lru(self):
+		"""
+		Check the in-memory models cache: LRU eviction within the budget, stale items, prefetching
+		"""
+		printDebug("=================\nTEST 4: in-memory models cache\n=================", "important")
+		cache = ModelsCache(max_size=250)
+		cache.put("a.rdf", "model-a", 100, 1)
+		cache.put("b.rdf", "model-b", 100, 1)
+		self.assertEqual(cache.get("a.rdf"), "model-a")  # now b is the least recently used
+		cache.put("c.rdf", "model-c", 100, 1)
+		self.assertTrue("b.rdf" not in cache)
+		self.assertEqual(cache.size(), 200)
+		# the pickle was updated on disk
+		self.assertEqual(cache.get("a.rdf", stamp=2), None)
+		self.assertTrue("a.rdf" not in cache)
+		# too big to fit
+		self.assertFalse(cache.put("big.rdf", "model-big", 1000))
+
+		loaded = []
+		def loader(key):
+			time.sleep(0.1)
+			loaded.append(key)
+			cache.put(key, "model-" + key, 10)
+		self.assertTrue(cache.prefetch("d.rdf", loader))
+		self.assertFalse(cache.prefetch("d.rdf", loader))
+		cache.wait_prefetch("d.rdf")
+		self.assertEqual(loaded, ["d.rdf"])
+		self.assertEqual(cache.get("d.rdf"), "model-d.rdf")
+
+
+	def test5_atomic_checksum(self):
+		"""
+		Check that cached files are validated when read back
+		"""
+		printDebug("=================\nTEST 5: cache files checksum\n=================", "important")
+		path = os.path.join(self.cache_dir, "test.rdf.pickle")
+		_write_pickle(path, {'a': [1, 2, 3]})
+		self.assertEqual(_read_pickle(path), {'a': [1, 2, 3]})
+		self.assertEqual([x for x in os.listdir(self.cache_dir) if x.endswith(".part")], [])
+		# truncate it
+		with open(path, "rb") as f:
+			data = f.read()
+		with open(path, "wb") as f:
+			f.write(data[:-5])
+		self.assertRaises(CacheChecksumError, _read_pickle, path)
+		# old style pickle, without checksum
+		with open(path, "wb") as f:
+			f.write(cPickle.dumps({'a': 1}))
+		self.assertRaises(CacheChecksumError, _read_pickle, path)
+
+	def test6_lock(self):
+		"""
+		Check that only one holder of a cache lock at a time can build an item
+		"""
+		printDebug("=================\nTEST 6: cache lock\n=================", "important")
+		path = os.path.join(self.cache_dir, "test.rdf.pickle")
+		events = []
+		entered = threading.Event()
+		class Lock(CacheLock):
+			"""signals when the lock file is open, ie just before waiting for it"""
+			def __init__(self, path, ready):
+				super(Lock, self).__init__(path)
+				self.ready = ready
+			def _open(self):
+				f = super(Lock, self)._open()
+				self.ready()
+				return f
+		def worker(n, ready):
+			with Lock(path, ready):
+				entered.set()
+				events.append(("in", n))
+				events.append(("out", n))
+		# the lock is held while the workers start, then they all compete for it
+		lock = CacheLock(path)
+		lock.acquire()
+		ready = [threading.Event() for n in range(4)]
+		threads = [threading.Thread(target=worker, args=(n, ready[n].set)) for n in range(4)]
+		for t in threads:
+			t.start()
+		for e in ready:
+			e.wait()
+		self.assertFalse(entered.wait(0.2))
+		lock.release()
+		for t in threads:
+			t.join()
+		print(events)
+		# no interleaving
+		for i in range(0, len(events), 2):
+			self.assertEqual(events[i][0], "in")
+			self.assertEqual(events[i + 1], ("out", events[i][1]))
+		# lock files are removed by cache_gc, unless held
+		lock = CacheLock(path)
+		self.assertTrue(os.path.exists(lock.lockpath))
+		with CacheLock(os.path.join(self.cache_dir, "other.rdf.pickle")) as held:
+			report = cache_gc(max_size=10000, cache_dir=self.cache_dir, cache_top=self.cache_top, library=[], library_dir=self.library_dir)
+			self.assertEqual(report['locks'], 1)
+			self.assertFalse(os.path.exists(lock.lockpath))
+			self.assertTrue(os.path.exists(held.lockpath))
+		self.assertEqual(remove_stale_locks(self.cache_dir), 1)
+		# a lock file removed while a thread waits for it: the thread waits for the new file too
+		lock.acquire()
+		waiting = threading.Event()
+		entered.clear()
+		t = threading.Thread(target=worker, args=(9, waiting.set))
+		t.start()
+		waiting.wait()
+		os.remove(lock.lockpath)
+		new = CacheLock(path)
+		new.acquire()
+		lock.release()
+		self.assertFalse(entered.wait(0.2))
+		events.append(("in", "new"))
+		events.append(("out", "new"))
+		new.release()
+		t.join()
+		self.assertEqual(events[-4:], [("in", "new"), ("out", "new"), ("in", 9), ("out", 9)])
+
+
+	def test7_stats(self):
+		"""
+		Check that models statistics are saved when caching, and ignored once the model changes
+		"""
+		printDebug("=================\nTEST 7: models statistics\n=================", "important")
+		source = os.path.join(self.library_dir, "foaf.rdf")
+		shutil.copy(os.path.join(os.path.dirname(__file__), "rdf", "foaf.rdf"), source)
+		g = Ontospy(source)
+		self.assertTrue(g.parse_time > 0)
+		key = get_content_hash("foaf.rdf", self.library_dir)
+		_write_pickle(os.path.join(self.cache_dir, key + ".pickle"), g)
+		save_ontology_stats("foaf.rdf", g, cache_dir=self.cache_dir, library_dir=self.library_dir)
+
+		stats = get_ontology_stats("foaf.rdf", cache_dir=self.cache_dir, library_dir=self.library_dir)
+		print(stats)
+		self.assertEqual(stats['classes'], len(g.all_classes))
+		self.assertEqual(stats['properties'], len(g.all_properties))
+		self.assertEqual(stats['triples'], len(g.rdflib_graph))
+		self.assertEqual(stats['size'], os.path.getsize(os.path.join(self.cache_dir, key + ".pickle")))
+		# model updated
+		with open(source, "a") as f:
+			f.write("\n")
+		self.assertEqual(get_ontology_stats("foaf.rdf", cache_dir=self.cache_dir, library_dir=self.library_dir), None)
+		# not in the library anymore
+		cache_gc(max_size=0, cache_dir=self.cache_dir, cache_top=self.cache_top, library=[], library_dir=self.library_dir)
+		self.assertEqual(os.listdir(self.cache_dir), [])
+
+	def test8_content_addressed_library(self):
+		"""
+		Check that the same contents imported under different names are stored and cached once
+		"""
+		printDebug("=================\nTEST 8: content-addressed library\n=================", "important")
+		with open(os.path.join(os.path.dirname(__file__), "rdf", "foaf.rdf"), "rb") as f:
+			data = f.read()
+		status, sha = add_to_library("xmlns.com_foaf_spec.rdf", data, self.library_dir)
+		self.assertEqual(status, "new")
+		mtime = os.path.getmtime(os.path.join(self.library_dir, "xmlns.com_foaf_spec.rdf"))
+		# re-import
+		self.assertEqual(add_to_library("xmlns.com_foaf_spec.rdf", data, self.library_dir), ("unchanged", sha))
+		self.assertEqual(os.path.getmtime(os.path.join(self.library_dir, "xmlns.com_foaf_spec.rdf")), mtime)
+		# a mirror
+		status, sha2 = add_to_library("mirror_foaf.rdf", data, self.library_dir)
+		self.assertEqual(sha2, sha)
+		self.assertEqual(status, "alias")
+		# separate files: editing one in place does not change the other one
+		with open(os.path.join(self.library_dir, "xmlns.com_foaf_spec.rdf"), "r+b") as f:
+			f.write(b" ")
+		with open(os.path.join(self.library_dir, "mirror_foaf.rdf"), "rb") as f:
+			self.assertEqual(f.read(), data)
+		self.assertEqual(get_library_aliases(sha, self.library_dir), ["mirror_foaf.rdf"])
+		self.assertEqual(add_to_library("xmlns.com_foaf_spec.rdf", data, self.library_dir)[0], "alias")
+		self.assertEqual(get_library_aliases(sha, self.library_dir), ["mirror_foaf.rdf", "xmlns.com_foaf_spec.rdf"])
+		# one cache key
+		library = ["xmlns.com_foaf_spec.rdf", "mirror_foaf.rdf"]
+		self.assertEqual(set([get_content_hash(x, self.library_dir) for x in library]), set([sha]))
+
+		# updating one of them does not change the other one
+		self.assertEqual(add_to_library("mirror_foaf.rdf", data + b"\n", self.library_dir)[0], "new")
+		with open(os.path.join(self.library_dir, "xmlns.com_foaf_spec.rdf"), "rb") as f:
+			self.assertEqual(f.read(), data)
+		self.assertEqual(get_library_aliases(sha, self.library_dir), ["xmlns.com_foaf_spec.rdf"])
+		self.assertEqual([x for x in os.listdir(self.library_dir) if x.endswith(".part")], [])
+
+		# listing a library hashes the new files and saves the index once
+		for n in range(5):
+			with open(os.path.join(self.library_dir, "m%d.rdf" % n), "wb") as f:
+				f.write(data + b" " * n)
+		library = sorted(x for x in os.listdir(self.library_dir) if x.endswith(".rdf"))
+		index = get_library_index(self.library_dir)
+		keys = set([get_content_hash(x, self.library_dir, index) for x in library])
+		self.assertEqual(len(keys), 6)
+		self.assertEqual(len(get_library_index(self.library_dir)), 2)
+		self.assertTrue(flush_library_index(index, self.library_dir))
+		self.assertFalse(flush_library_index(index, self.library_dir))
+		self.assertEqual(len(get_library_index(self.library_dir)), 7)
+
+	def test9_query_cache_kept(self):
+		"""
+		Check that cache_gc keeps the results of sparql queries, and doesn't count them as another version
+		"""
+		printDebug("=================\nTEST 9: query cache and gc\n=================", "important")
+		from ..core.sparqlHelper import QueryCache
+		self.assertTrue(ONTOSPY_SPARQL_CACHE.startswith(ONTOSPY_LOCAL_CACHE + "/"))
+		cache = QueryCache(os.path.join(self.cache_dir, "sparql"))
+		cache.put("http://localhost/sparql", "q", ["x"])
+		self.assertEqual(get_cache_stats(cache_dir=self.cache_dir, cache_top=self.cache_top, library=[], library_dir=self.library_dir)['versions'], 0)
+		report = cache_gc(max_size=0, cache_dir=self.cache_dir, cache_top=self.cache_top, library=[], library_dir=self.library_dir)
+		self.assertEqual(report['versions'], [])
+		self.assertEqual(cache.get("http://localhost/sparql", "q"), ["x"])
+
+	def test10_budget_only(self):
+		"""
+		Check that the budget enforced when caching a model leaves the folders of other versions alone
+		"""
+		printDebug("=================\nTEST 10: cache budget\n=================", "important")
+		now = time.time()
+		other_version = os.path.join(self.cache_top, "v0.0.1")
+		os.makedirs(other_version)
+		other = self._add_entry("foaf.rdf", 100, now - 1000, folder=other_version)
+		self._add_entry("old.rdf", 100, now - 300)
+		recent = self._add_entry("recent.rdf", 100, now - 100)
+		just_cached = self._add_entry("new.rdf", 100, now - 500)
+
+		evicted = enforce_cache_budget(max_size=150, keep=[just_cached], cache_dir=self.cache_dir)
+		self.assertEqual(evicted, ["old.rdf", "recent.rdf"])
+		self.assertEqual([x['path'] for x in get_cache_entries(self.cache_dir)], [just_cached])
+		self.assertTrue(os.path.exists(other))
+		self.assertEqual(enforce_cache_budget(max_size=150, cache_dir=self.cache_dir), [])
+
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -113,6 +113,253 @@ class TestMethods(unittest.TestCase):
 		print("OWL DISJOINT WITH: ")
 		print("\n".join([x for x in e.disjointWith()]))
 		printDebug("Test completed succesfully.\n", "green")
+
+	def test5(self):
+		"""
+		instance_counts
+		"""
+		printDebug("\n=================\nTEST 5: Checking the <instance_counts> method", "green")
+
+		counts = self.o.instance_counts()
+		self.assertEqual(len(counts), len(self.o.all_classes))
+		for c in self.o.all_classes:
+			self.assertEqual(counts[c.uri], len(self.o.sparqlHelper.getClassInstances(c.uri)))
+			self.assertEqual(c.count(), counts[c.uri])
+		print("Instances: %d" % sum(counts.values()))
+		printDebug("Test completed succesfully.\n", "green")
+
+	def test6(self):
+		"""
+		iter_instances
+		"""
+		printDebug("\n=================\nTEST 6: Checking the <iter_instances> method", "green")
+
+		for c in self.o.all_classes:
+			if not c.count():
+				continue
+			# local graphs: yielded in the graph order
+			instances = c.iter_instances()
+			first = next(instances)
+			self.assertEqual(sorted([first] + list(instances)), [x.uri for x in c.instances])
+			by_uri = dict([(x.uri, x) for x in c.instances])
+			for x in c.iter_instances(page_size=2, with_triples=True):
+				self.assertEqual(sorted(x.triples), sorted(by_uri[x.uri].triples))
+			print("CLASS: %s [%d]" % (c.qname, c.count()))
+		printDebug("Test completed succesfully.\n", "green")
+
+	def test7(self):
+		"""
+		uri2niceString - longest namespace match
+		"""
+		printDebug("\n=================\nTEST 7: Checking qnames built with a <NamespaceIndex>", "green")
+
+		self.assertTrue(isinstance(self.o.namespaces, NamespaceIndex))
+		self.assertEqual(self.o.all_classes[0].qname, uri2niceString(self.o.all_classes[0].uri, list(self.o.namespaces)))
+		namespaces = [
+			("ex", rdflib.URIRef("http://example.org/")),
+			("sub", rdflib.URIRef("http://example.org/sub#")),
+			("", rdflib.URIRef("http://example.org/base/vocab#")),
+		]
+		for ns in [namespaces, NamespaceIndex(namespaces), NamespaceIndex(reversed(namespaces))]:
+			self.assertEqual(uri2niceString(rdflib.URIRef("http://example.org/A"), ns), "ex:A")
+			self.assertEqual(uri2niceString(rdflib.URIRef("http://example.org/sub#B"), ns), "sub:B")
+			self.assertEqual(uri2niceString(rdflib.URIRef("http://example.org/base/vocab#C"), ns), "vocab:C")
+			self.assertEqual(uri2niceString(rdflib.URIRef("http://other.org/D"), ns), "http://other.org/D")
+		index = NamespaceIndex(namespaces)
+		self.assertEqual(index.match("http://example.org/sub#B"), namespaces[1])
+		self.assertEqual(index.match("http://other.org/"), None)
+		# updated when namespaces are added
+		index.append(("other", rdflib.URIRef("http://other.org/")))
+		self.assertEqual(index.qname("http://other.org/D"), "other:D")
+		# ..and on changes keeping the same length
+		index[-1] = ("more", rdflib.URIRef("http://other.org/"))
+		self.assertEqual(index.qname("http://other.org/D"), "more:D")
+		index.insert(0, ("first", rdflib.URIRef("http://other.org/")))
+		index.pop()
+		self.assertEqual(index.qname("http://other.org/D"), "first:D")
+		index[:] = namespaces
+		self.assertEqual(index.qname("http://other.org/D"), "http://other.org/D")
+		index += [("other", rdflib.URIRef("http://other.org/"))]
+		self.assertEqual(index.qname("http://other.org/D"), "other:D")
+		index.reverse()
+		index.remove(("ex", rdflib.URIRef("http://example.org/")))
+		self.assertEqual(index.qname("http://example.org/A"), "http://example.org/A")
+		self.assertEqual(uri2niceString(rdflib.OWL.Class), "owl:Class")
+		printDebug("Test completed succesfully.\n", "green")
+
+	def test8(self):
+		"""
+		term ids - hierarchy and domain/range indexes
+		"""
+		printDebug("\n=================\nTEST 8: Checking the term ids indexes", "green")
+		from ..core.terms import TermRelation
+		from array import array
+
+		for entities in [self.o.all_classes, self.o.all_properties]:
+			for x in entities:
+				self.assertEqual(self.o.terms.term(x.term_id), x.uri)
+				# same as following parents and children recursively
+				self.assertEqual(x.ancestors(), remove_duplicates(x.ancestors(noduplicates=False)))
+				self.assertEqual(x.descendants(), remove_duplicates(x.descendants(noduplicates=False)))
+		# the index replaces the lists of parents and children, which can't be changed by mistake
+		for c in self.o.all_classes:
+			self.assertEqual((c._parents, c._children), (None, None))
+			self.assertTrue(isinstance(c.parents(), tuple) and isinstance(c.children(), tuple))
+			self.assertEqual([x.term_id for x in c.parents()], list(self.o.class_hierarchy.objects(c.term_id)))
+			for x in c.children():
+				self.assertTrue(c in x.parents())
+		# same for domains and ranges
+		for p in self.o.all_properties:
+			self.assertFalse("domains" in p.__dict__ or "ranges" in p.__dict__)
+			self.assertEqual(self.o.property_domains.resolve(self.o.property_domains.objects(p.term_id)), list(p.domains))
+			self.assertEqual(self.o.property_ranges.resolve(self.o.property_ranges.objects(p.term_id)), list(p.ranges))
+			for c in p.domains:
+				self.assertTrue(c.ext_model or c.is_Bnode or p in c.domain_of)
+			for c in p.ranges:
+				self.assertTrue(c.ext_model or c.is_Bnode or p in c.range_of)
+		for c in self.o.all_classes:
+			self.assertEqual(set(c.domain_of), set([p for p in self.o.all_properties if c in p.domains]))
+			self.assertEqual(set(c.range_of), set([p for p in self.o.all_properties if c in p.ranges]))
+		# ..and only takes up the ids of its entities
+		hierarchy = self.o.property_hierarchy
+		self.assertEqual(hierarchy.start, min([x.term_id for x in self.o.all_properties]))
+		self.assertEqual(len(hierarchy.entities), len(self.o.all_properties))
+		self.assertEqual(hierarchy.objects(self.o.all_classes[0].term_id), array('i'))
+
+		# cycles: each id once
+		relation = TermRelation(4, {0: [1], 1: [2, 3], 2: [0]})
+		self.assertEqual(relation.closure(0), [1, 2, 3])
+		self.assertEqual(relation.closure(3, inverse=True), [1, 0, 2])
+		printDebug("Test completed succesfully.\n", "green")
+
+	def test9(self):
+		"""
+		get_class(match=..) - ranked, label and fuzzy search
+		"""
+		printDebug("\n=================\nTEST 9: Checking the search index used by <get_class>", "green")
+
+		# the same entities as a substring scan of URIs, best matches first
+		res = self.o.get_class(match="pizza")
+		self.assertEqual(set(res), set([x for x in self.o.all_classes if "pizza" in x.uri.lower()]))
+		self.assertEqual(res[0].locale, "Pizza")
+		self.assertEqual(self.o.get_class(match="pizza", limit=3), res[:3])
+		# labels, in any language
+		self.assertTrue(self.o.get_class(uri="http://www.co-ode.org/ontologies/pizza/pizza.owl#CheeseyPizza") in self.o.get_class(match="PizzaComQueijo"))
+		# typos
+		self.assertEqual(self.o.get_class(match="margherrita"), [])
+		self.assertEqual([x.locale for x in self.o.get_class(match="margherrita", fuzzy=True)], ["Margherita"])
+		self.assertEqual([x.locale for x in self.o.get_any_entity(match="hasTopp")], ["hasTopping"])
+		# a list built again, with the same length, is not covered by the index
+		from ..core.search import SearchIndex
+		classes = list(self.o.all_classes)
+		index = SearchIndex(classes)
+		self.assertTrue(index.covers(classes))
+		self.assertFalse(index.covers(list(classes)))
+		classes.pop()
+		self.assertFalse(index.covers(classes))
+		# the same labels as RDF_Entity.labels, eg synonyms
+		o = Ontospy(data="""@prefix owl: <http://www.w3.org/2002/07/owl#> .
+		@prefix oboInOwl: <http://www.geneontology.org/formats/oboInOwl#> .
+		<http://example.org/A> a owl:Class ; oboInOwl:hasSynonym "Neoplasm"@en .""", rdf_format="turtle")
+		self.assertEqual(o.all_classes[0].labels(), ["Neoplasm"])
+		self.assertEqual(o.get_class(match="neoplasm"), o.all_classes)
+		printDebug("Test completed succesfully.\n", "green")
+
+	def test10(self):
+		"""
+		iter_query - streamed and memoized results
+		"""
+		printDebug("\n=================\nTEST 10: Checking the <iter_query> method", "green")
+
+		o = Ontospy(data="""@prefix owl: <http://www.w3.org/2002/07/owl#> .
+		<http://example.org/A> a owl:Class .
+		<http://example.org/B> a owl:Class .""", rdf_format="turtle")
+		q = "SELECT ?x WHERE { ?x a <http://www.w3.org/2002/07/owl#Class> } ORDER BY ?x"
+		rows = o.iter_query(q)
+		self.assertFalse(isinstance(rows, list))
+		self.assertEqual([x[0] for x in rows], [rdflib.URIRef("http://example.org/A"), rdflib.URIRef("http://example.org/B")])
+		self.assertEqual(o.query(q), list(o.rdflib_graph.query(q)))
+
+		# memoized: the same rows, till the graph changes
+		first = o.query(q, memoize=True)
+		self.assertEqual(o.query(q.replace(" ", "\n  "), memoize=True), first)
+		self.assertEqual((o.query_memo.hits, o.query_memo.misses), (1, 1))
+		o.rdflib_graph.add((rdflib.URIRef("http://example.org/C"), rdflib.RDF.type, rdflib.OWL.Class))
+		self.assertEqual(len(o.query(q, memoize=True)), 3)
+		o.rdflib_graph.remove((rdflib.URIRef("http://example.org/C"), None, None))
+		self.assertEqual(o.query(q, memoize=True), first)
+		self.assertEqual(o.query_memo.hits, 1)
+		# least recently used results go first
+		o.query_memo.max_items = 1
+		o.query("ASK { ?x ?y ?z }", memoize=True)
+		self.assertEqual(len(o.query_memo), 1)
+		# models can still be pickled
+		o2 = cPickle.loads(cPickle.dumps(o))
+		self.assertEqual(o2.query(q, memoize=True), first)
+		printDebug("Test completed succesfully.\n", "green")
+
+	def test11(self):
+		"""
+		Class expressions - restrictions indexed by property and class
+		"""
+		printDebug("\n=================\nTEST 11: Checking the <class_expressions> index", "green")
+		index = self.o.class_expressions
+		hasTopping = self.o.get_property(uri="http://www.co-ode.org/ontologies/pizza/pizza.owl#hasTopping")
+		american = self.o.get_class(uri="http://www.co-ode.org/ontologies/pizza/pizza.owl#American")
+		restrictions = index.restrictions_of(american.uri)
+		self.assertEqual(len(restrictions), 5)
+		self.assertTrue("pizza.owl:hasTopping some pizza.owl:TomatoTopping" in [str(x) for x in restrictions])
+		self.assertTrue(any([" only (" in str(x) and " or " in str(x) for x in restrictions]))
+		self.assertTrue(american.uri in index.classes_restricting(hasTopping.uri))
+		# the same restrictions, found by walking the graph
+		walked = set(self.o.rdflib_graph.subjects(rdflib.OWL.onProperty, hasTopping.uri))
+		self.assertEqual(set([x.node for x in index.restrictions_on(hasTopping.uri)]), walked)
+
+		# nested and cyclic expressions, blank nodes in ranges
+		o = Ontospy(data="""@prefix owl: <http://www.w3.org/2002/07/owl#> .
+		@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+		@prefix : <http://example.org/> .
+		:A a owl:Class ; rdfs:subClassOf [ a owl:Restriction ; owl:onProperty :p ;
+			owl:someValuesFrom [ a owl:Restriction ; owl:onProperty :q ; owl:minQualifiedCardinality 2 ; owl:onClass :B ] ] .
+		:B a owl:Class ; owl:equivalentClass _:x .
+		_:x owl:intersectionOf ( :A _:y ) .
+		_:y owl:complementOf _:x .
+		:p a owl:ObjectProperty ; rdfs:range [ owl:unionOf ( :A :B ) ] .
+		:q a owl:ObjectProperty .""", rdf_format="turtle")
+		A, B = "http://example.org/A", "http://example.org/B"
+		self.assertEqual([str(x) for x in o.class_expressions.restrictions_of(A)], [":p some (:q min 2 :B)", ":q min 2 :B"])
+		self.assertEqual(o.class_expressions.classes_restricting("http://example.org/q"), [rdflib.URIRef(A)])
+		self.assertEqual(str(o.class_expressions.definitions[rdflib.URIRef(B)][0][1]), ":A and (not (...))")
+		p = o.get_property(uri="http://example.org/p")
+		self.assertEqual(p.domains, ())
+		self.assertEqual(str(p.ranges[0].expression), ":A or :B")
+		printDebug("Test completed succesfully.\n", "green")
+
+	def test12(self):
+		"""
+		Labels and descriptions - per language tables
+		"""
+		printDebug("\n=================\nTEST 12: Checking the <bestLabel> and <labels> methods", "green")
+		o = Ontospy(data="""@prefix owl: <http://www.w3.org/2002/07/owl#> .
+		@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+		@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+		<http://example.org/A> a owl:Class ; rdfs:label "Cat"@en, "Chat"@fr ;
+			skos:altLabel "Kitty" ; rdfs:comment "A cat"@en, "Un chat"@fr, "Another cat"@en .
+		<http://example.org/B> a owl:Class ; skos:prefLabel "Dog" .
+		<http://example.org/C> a owl:Class .""", rdf_format="turtle")
+		a, b, c = [o.get_class(uri="http://example.org/" + x) for x in "ABC"]
+		self.assertEqual([str(a.bestLabel()), str(a.bestLabel("fr"))], ["Cat", "Chat"])
+		self.assertEqual(a.bestLabel("de"), a.getValuesForProperty(rdflib.RDFS.label)[0])
+		self.assertEqual(sorted(a.labels()), ["Cat", "Chat", "Kitty"])
+		self.assertEqual(sorted(a.altLabels()), ["Chat", "Kitty"])
+		self.assertEqual(str(a.bestDescription("fr")), "Un chat")
+		self.assertEqual(sorted(a.bestDescription().split(" - ")), ["A cat", "Another cat"])
+		self.assertEqual((str(b.bestLabel()), b.labels(), b.altLabels()), ("Dog", ["Dog"], []))
+		self.assertEqual((c.bestLabel(), c.bestLabel(qname_allowed=False), c.altLabels(), c.bestDescription()), ("C", "", [], ""))
+		# same results as reading the values from the graph
+		for x in self.o.all_classes:
+			self.assertEqual(x.bestLabel(), firstEnglishStringInList(x.getValuesForProperty(rdflib.RDFS.label)) or x.locale)
+		printDebug("Test completed succesfully.\n", "green")
 	
 	
 	print("Success.\n")
@@ -0,0 +1,355 @@
+# !/usr/bin/env python
+#  -*- coding: UTF-8 -*-
+"""
+Unit test stub for ontosPy
+
+Run like this:
+
+$ python -m ontospy.tests.test_sparql_helper
+
+"""
+
+from __future__ import print_function
+
+import unittest, os, sys, time, threading, shutil, tempfile, json
+from .. import *
+from ..core import *
+from ..core.utils import *
+from ..core.sparqlHelper import SparqlHelper, QueryExecutor, RateLimiter, QueryCache, QueryMetrics, sparql_iri, blank_node_closure
+
+
+# sanity check
+print("-------------------\nOntospy ",  VERSION, "\n-------------------")
+
+
+def _triples(triples):
+	"""blank nodes are relabeled by CONSTRUCT queries: compare triples without them"""
+	return sorted([tuple([str(x) if not isBlankNode(x) else "_" for x in t]) for t in triples])
+
+
+class CountingSparqlHelper(SparqlHelper):
+	"""Keeps track of the queries sent"""
+
+	def __init__(self, *args, **kwargs):
+		super(CountingSparqlHelper, self).__init__(*args, **kwargs)
+		self.queries = []
+
+	def _query(self, q, initBindings=None):
+		self.queries += [q]
+		return super(CountingSparqlHelper, self)._query(q, initBindings)
+
+
+class CountingGraph(object):
+	"""A local graph standing in for a sparql endpoint: keeps track of the queries it runs"""
+
+	def __init__(self, graph):
+		self.graph = graph
+		self.queries = []
+
+	def query(self, q):
+		self.queries += [q]
+		return self.graph.query(q)
+
+	def __getattr__(self, name):
+		return getattr(self.graph, name)
+
+
+
+class TestSparqlHelper(unittest.TestCase):
+
+	dir_path = os.path.dirname(os.path.realpath(__file__))
+	DATA_FOLDER = dir_path + "/rdf/"
+	f = DATA_FOLDER + "pizza.ttl"
+	o = Ontospy(f)
+
+	def test1_paging(self):
+		"""
+		Check that paged results are the same as unpaged ones, with both pagination methods
+		"""
+		printDebug("=================\nTEST 1: paged queries\n=================", "important")
+		graph = self.o.rdflib_graph
+		classes = set(SparqlHelper(graph, native=False).getAllClasses())
+		properties = set(SparqlHelper(graph, native=False).getAllProperties())
+		self.assertTrue(len(classes) > 10)
+
+		for pagination in ["keyset", "offset"]:
+			for page_size in [20, 1000]:
+				helper = CountingSparqlHelper(graph, page_size=page_size, pagination=pagination, native=False)
+				paged = helper.getAllClasses()
+				self.assertEqual(len(paged), len(classes))
+				self.assertEqual(set(paged), classes)
+				if page_size == 20:
+					self.assertTrue(len(helper.queries) > len(classes) // 20)
+					self.assertTrue("LIMIT 20" in helper.queries[0])
+				paged = helper.getAllProperties()
+				self.assertEqual(len(paged), len(properties))
+				self.assertEqual(set(paged), properties)
+			print(pagination, "OK")
+
+		# more rows for a single ?x than fit in a page
+		data = """@prefix owl: <http://www.w3.org/2002/07/owl#> .
+		@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+		<http://example.org/A> a owl:Class, rdfs:Class .
+		<http://example.org/B> a owl:Class, rdfs:Class ; rdfs:subClassOf <http://example.org/A> ."""
+		graph = Ontospy(data=data, rdf_format="turtle", build_all=False).rdflib_graph
+		classes = SparqlHelper(graph, native=False).getAllClasses()
+		self.assertEqual(len(classes), 4)
+		for pagination in ["keyset", "offset"]:
+			self.assertEqual(set(SparqlHelper(graph, page_size=1, pagination=pagination, native=False).getAllClasses()), set(classes))
+
+	def test2_paged_build(self):
+		"""
+		Check that entities built from paged results are the same
+		"""
+		printDebug("=================\nTEST 2: building entities from paged queries\n=================", "important")
+		o = Ontospy(self.f, build_all=False)
+		o.sparqlHelper.page_size = 25
+		o.sparqlHelper.native = False
+		o.build_all()
+		self.assertEqual([x.uri for x in o.all_classes], [x.uri for x in self.o.all_classes])
+		self.assertEqual([x.uri for x in o.all_properties], [x.uri for x in self.o.all_properties])
+		self.assertEqual([x.uri for x in o.toplayer_classes], [x.uri for x in self.o.toplayer_classes])
+		for c1, c2 in zip(o.all_classes, self.o.all_classes):
+			self.assertEqual([x.uri for x in c1.parents()], [x.uri for x in c2.parents()])
+
+
+	def test3_batches(self):
+		"""
+		Check that entities details fetched in batches are the same as those fetched one at a time
+		"""
+		printDebug("=================\nTEST 3: batched queries\n=================", "important")
+		graph = self.o.rdflib_graph
+		# a local graph, queried the same way as a sparql endpoint
+		helper = SparqlHelper(graph, sparql_endpoint="http://localhost/sparql")
+		self.assertEqual(helper.batch_size, 50)
+		uris = [x.uri for x in self.o.all_classes[:20]]
+		triples = helper.entityTriplesBatch(uris)
+		supers = helper.getClassDirectSupersBatch(uris)
+		for uri in uris:
+			self.assertEqual(_triples(triples[uri]), _triples(helper.entityTriples(uri)))
+			self.assertEqual([x[0] for x in supers[uri]], [x[0] for x in helper.getClassDirectSupers(uri)])
+		uris = [x.uri for x in self.o.all_properties[:20]]
+		supers = helper.getPropDirectSupersBatch(uris)
+		for uri in uris:
+			self.assertEqual([x[0] for x in supers[uri]], [x[0] for x in helper.getPropDirectSupers(uri)])
+
+		models = []
+		for batch_size in [None, 10]:
+			o = Ontospy(self.f, build_all=False)
+			o.sparqlHelper = CountingSparqlHelper(o.rdflib_graph, sparql_endpoint="http://localhost/sparql", concurrency=1)
+			o.sparqlHelper.batch_size = batch_size
+			o.build_all()
+			models += [o]
+		one, batched = models
+		print("Queries: %d one at a time, %d in batches" % (len(one.sparqlHelper.queries), len(batched.sparqlHelper.queries)))
+		self.assertTrue(len(batched.sparqlHelper.queries) * 5 < len(one.sparqlHelper.queries))
+		for c1, c2 in zip(one.all_classes + one.all_properties, batched.all_classes + batched.all_properties):
+			self.assertEqual(c1.uri, c2.uri)
+			self.assertEqual(_triples(c1.triples), _triples(c2.triples))
+			self.assertEqual([x.uri for x in c1.parents()], [x.uri for x in c2.parents()])
+
+	def test4_concurrency(self):
+		"""
+		Check the thread pool used to query endpoints: results order, concurrency and rate limits
+		"""
+		printDebug("=================\nTEST 4: concurrent queries\n=================", "important")
+		running, peak = [0], [0]
+		lock = threading.Lock()
+		def slow_query(n):
+			with lock:
+				running[0] += 1
+				peak[0] = max(peak[0], running[0])
+			time.sleep(0.05)
+			with lock:
+				running[0] -= 1
+			return n * 2
+
+		executor = QueryExecutor(4)
+		sTime = time.time()
+		self.assertEqual(executor.map(slow_query, range(20)), [n * 2 for n in range(20)])
+		tTime = time.time() - sTime
+		print("20 queries, 4 workers: %0.2fs (peak: %d)" % (tTime, peak[0]))
+		self.assertTrue(peak[0] <= 4)
+		self.assertTrue(tTime < 20 * 0.05 / 2)
+		# one worker: same thread
+		self.assertEqual(QueryExecutor(1).map(lambda x: threading.current_thread(), [1]), [threading.current_thread()])
+
+		limiter = RateLimiter(50)
+		sTime = time.time()
+		for n in range(11):
+			limiter.wait()
+		self.assertTrue(time.time() - sTime >= 10 / 50.0 - 0.01)
+
+		# helpers can still be pickled (eg when caching models)
+		helper = cPickle.loads(cPickle.dumps(SparqlHelper(self.o.rdflib_graph, sparql_endpoint="http://localhost/sparql")))
+		self.assertEqual(helper.executor.max_workers, 4)
+
+	def test5_query_cache(self):
+		"""
+		Check the endpoints query cache: hits and misses, normalized queries, expiry, bypass and size limit
+		"""
+		printDebug("=================\nTEST 5: query results cache\n=================", "important")
+		cache_dir = tempfile.mkdtemp()
+		try:
+			graph = CountingGraph(self.o.rdflib_graph)
+			cache = QueryCache(cache_dir)
+			helper = SparqlHelper(graph, sparql_endpoint="http://localhost/sparql", concurrency=1, query_cache=cache)
+			classes = helper.getAllClasses()
+			sent = len(graph.queries)
+			self.assertEqual((cache.hits, cache.misses), (0, sent))
+			# a new session: same results, nothing sent
+			helper = SparqlHelper(graph, sparql_endpoint="http://localhost/sparql", concurrency=1, query_cache=QueryCache(cache_dir))
+			self.assertEqual(helper.getAllClasses(), classes)
+			self.assertEqual(len(graph.queries), sent)
+			self.assertEqual(helper.query_cache.stats()['hits'], sent)
+			# whitespace does not matter, but quoted strings do
+			self.assertEqual(cache.normalize("SELECT  ?x\n\tWHERE {?x ?p 'a  b'}"), "SELECT ?x WHERE {?x ?p 'a  b'}")
+			q = "SELECT ?x WHERE { ?x a <http://www.w3.org/2002/07/owl#Class> }"
+			helper.query_cache.reset_counters()
+			helper._query(q)
+			helper._query(q.replace(" ", "\n  "))
+			self.assertEqual((helper.query_cache.hits, helper.query_cache.misses), (1, 1))
+			# other endpoints have their own results
+			self.assertEqual(cache.get("http://example.org/sparql", q), None)
+			# bypass: the query is sent again, and the results updated
+			helper.bypass_cache = True
+			helper._query(q)
+			self.assertEqual(len(graph.queries), sent + 2)
+			# expired
+			cache.ttl = 0.5
+			time.sleep(0.6)
+			self.assertEqual(cache.get("http://localhost/sparql", q), None)
+			# size limit: least recently used items go first
+			cache = QueryCache(tempfile.mkdtemp(dir=cache_dir), max_size=300)
+			for n in range(5):
+				cache.put("http://localhost/sparql", "q%d" % n, ["x" * 50])
+				time.sleep(0.01)
+			self.assertTrue(cache.size() <= 300)
+			self.assertNotEqual(cache.get("http://localhost/sparql", "q4"), None)
+			self.assertEqual(cache.get("http://localhost/sparql", "q0"), None)
+			self.assertFalse(cache.put("http://localhost/sparql", "big", ["x" * 1000]))
+			# items removed meanwhile, eg by another process
+			entries = cache._entries()
+			for x in entries:
+				os.remove(x[2])
+			cache._entries = lambda: entries
+			cache.ttl = 0
+			cache.evict()
+			self.assertEqual(cache._size, 0)
+		finally:
+			shutil.rmtree(cache_dir, ignore_errors=True)
+
+	def test6_prepared_queries(self):
+		"""
+		Check that queries about an entity are compiled once, and can't be broken by odd URIs
+		"""
+		printDebug("=================\nTEST 6: prepared queries\n=================", "important")
+		odd = "http://example.org/a b>c"
+		graph = rdflib.Graph()
+		graph.add((rdflib.URIRef(odd), rdflib.RDFS.subClassOf, rdflib.URIRef("http://example.org/B")))
+		graph.add((rdflib.URIRef("http://example.org/C"), rdflib.RDFS.subClassOf, rdflib.URIRef(odd)))
+		for native in [True, False]:
+			helper = SparqlHelper(graph, native=native)
+			self.assertEqual(helper.getClassDirectSupers(odd), [(rdflib.URIRef("http://example.org/B"),)])
+			self.assertEqual(helper.getClassDirectSubs(odd), [(rdflib.URIRef("http://example.org/C"),)])
+			self.assertEqual(len(helper.entityTriples(odd)), 1)
+
+		# the same compiled query is used for all entities
+		helper = CountingSparqlHelper(self.o.rdflib_graph, native=False)
+		for c in self.o.all_classes[:5]:
+			helper.getClassDirectSupers(c.uri)
+		self.assertEqual(len(set([id(q) for q in helper.queries])), 1)
+
+		# sparql endpoints: the IRI is escaped within the query text
+		self.assertEqual(sparql_iri("http://example.org/a b>c"), "<http://example.org/a%20b%3Ec>")
+		injection = "http://example.org/A> ?y ?z } UNION { ?s ?y ?z"
+		helper = CountingSparqlHelper(self.o.rdflib_graph, sparql_endpoint="http://localhost/sparql", concurrency=1)
+		self.assertEqual(list(helper.entityTriples(injection)), [])
+		self.assertEqual(helper.getClassInstances(injection), [])
+		self.assertTrue(sparql_iri(injection) in helper.queries[0])
+
+	def test7_metrics(self):
+		"""
+		Check the per-method metrics: calls, queries, cache hits, results, reset and exports
+		"""
+		printDebug("=================\nTEST 7: query metrics\n=================", "important")
+		o = Ontospy(self.f, build_all=False)
+		o.sparqlHelper = SparqlHelper(o.rdflib_graph, sparql_endpoint="http://localhost/sparql", concurrency=1)
+		o.sparqlHelper.batch_size = None
+		o.build_all()
+		report = o.sparqlHelper.metrics.report()
+		# one call, and as many queries, per entity: the N+1 pattern batches avoid
+		self.assertEqual(report['entityTriples']['calls'], len(o.all_classes) + len(o.all_properties) + len(o.all_ontologies))
+		self.assertEqual(report['getClassDirectSupers']['queries'], len(o.all_classes))
+		o.sparqlHelper.metrics.reset()
+		n = len(o.sparqlHelper.getAllClasses())
+		item = o.sparqlHelper.metrics.report()['getAllClasses']
+		self.assertEqual((item['calls'], item['rows']), (1, n))
+		self.assertEqual(sum(item['histogram']), 1)
+
+		cache_dir = tempfile.mkdtemp()
+		try:
+			helper = SparqlHelper(self.o.rdflib_graph, sparql_endpoint="http://localhost/sparql", concurrency=1, query_cache=QueryCache(cache_dir))
+			helper.getAllClasses()
+			helper.getAllClasses()
+			item = helper.metrics.report()['getAllClasses']
+			self.assertEqual(item['calls'], 2)
+			self.assertEqual(item['cache_hits'], item['queries'] // 2)
+		finally:
+			shutil.rmtree(cache_dir, ignore_errors=True)
+
+		# iterators: counted once consumed
+		helper = SparqlHelper(self.o.rdflib_graph)
+		n = len(list(helper.iterAllClasses()))
+		self.assertEqual(helper.metrics.report()['iterAllClasses']['rows'], n)
+		self.assertEqual(json.loads(helper.metrics.to_json())['methods']['iterAllClasses']['calls'], 1)
+		text = helper.metrics.to_prometheus()
+		self.assertTrue('ontospy_sparql_calls_total{method="iterAllClasses"} 1' in text)
+		self.assertTrue('ontospy_sparql_seconds_bucket{method="iterAllClasses",le="+Inf"} 1' in text)
+		helper.metrics.reset()
+		self.assertEqual(helper.metrics.report(), {})
+		self.assertEqual(cPickle.loads(cPickle.dumps(QueryMetrics())).report(), {})
+
+	def test8_blank_nodes(self):
+		"""
+		Check that blank nodes are followed once each: cycles, shared and deeply nested ones
+		"""
+		printDebug("=================\nTEST 8: blank nodes closure\n=================", "important")
+		EX = rdflib.Namespace("http://example.org/")
+		graph = rdflib.Graph()
+		a, b, shared = rdflib.BNode(), rdflib.BNode(), rdflib.BNode()
+		graph.add((EX.A, rdflib.RDFS.subClassOf, a))
+		graph.add((a, rdflib.OWL.someValuesFrom, b))
+		graph.add((b, rdflib.OWL.someValuesFrom, a))  # a cycle
+		graph.add((a, rdflib.RDFS.comment, shared))
+		graph.add((b, rdflib.RDFS.comment, shared))
+		graph.add((shared, rdflib.RDFS.label, rdflib.Literal("shared")))
+		graph.add((EX.B, rdflib.RDFS.subClassOf, shared))
+		# an rdf:List longer than the recursion limit
+		items = [EX["item%d" % n] for n in range(sys.getrecursionlimit() + 100)]
+		rdflib.collection.Collection(graph, rdflib.BNode(), items)
+		graph.add((EX.C, rdflib.OWL.unionOf, list(graph.subjects(rdflib.RDF.first, items[0]))[0]))
+
+		for native in [True, False]:
+			helper = SparqlHelper(graph, native=native)
+			triples = helper.entityTriples(EX.A)
+			self.assertEqual(len(triples), 6)
+			self.assertEqual(len(set(triples)), 6)
+			self.assertEqual(set(triples[1:3]), set(graph.triples((a, None, None))))
+			self.assertEqual(helper.entityTriples(EX.B)[1:], list(graph.triples((shared, None, None))))
+			self.assertEqual(len(helper.entityTriples(EX.C)), 1 + 2 * len(items))
+		# depth first, in the order the triples are read, as before
+		self.assertEqual(blank_node_closure(graph, [(EX.B, rdflib.RDFS.subClassOf, shared)]), [(shared, rdflib.RDFS.label, rdflib.Literal("shared"))])
+
+		# blank nodes are described once per helper, until the graph changes
+		described = {}
+		blank_node_closure(graph, list(graph.triples((EX.A, None, None))), described)
+		self.assertEqual(set(described), set([a, b, shared]))
+		helper = SparqlHelper(graph)
+		helper.entityTriples(EX.B)
+		graph.add((shared, rdflib.RDFS.comment, rdflib.Literal("new")))
+		self.assertEqual(len(helper.entityTriples(EX.B)), 3)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,281 @@
+# !/usr/bin/env python
+#  -*- coding: UTF-8 -*-
+"""
+Unit test stub for ontosPy
+
+Run like this:
+
+$ python -m ontospy.tests.test_sparql_local
+
+"""
+
+from __future__ import print_function
+
+import unittest, os, sys, time, io, json, threading
+import requests
+from .. import *
+from ..core import *
+from ..core.utils import *
+from ..extras.sparqlserver import LocalSparqlEndpoint, benchmark_scan
+from ..core.sparqlHelper import SparqlHelper, QueryTimeout
+from ..extras.sparqlpy import SparqlEndpoint, iter_json_bindings, iter_xml_bindings
+
+
+# sanity check
+print("-------------------\nOntospy ",  VERSION, "\n-------------------")
+
+
+class TestSparqlLocal(unittest.TestCase):
+
+	dir_path = os.path.dirname(os.path.realpath(__file__))
+	DATA_FOLDER = dir_path + "/rdf/"
+	f = DATA_FOLDER + "pizza.ttl"
+	o = Ontospy(f)
+
+	def test1_endpoint_scan(self):
+		"""
+		Check that a model extracted from a local endpoint is the same as the one loaded from file
+		"""
+		printDebug("=================\nTEST 1: scanning a local endpoint\n=================", "important")
+		with LocalSparqlEndpoint(self.o.rdflib_graph) as server:
+			g = Ontospy(sparql_endpoint=server.url)
+			g.build_all()
+			stats = server.stats()
+		print(stats)
+		self.assertEqual([x.uri for x in g.all_classes], [x.uri for x in self.o.all_classes])
+		self.assertEqual([x.uri for x in g.all_properties], [x.uri for x in self.o.all_properties])
+		self.assertEqual([x.uri for x in g.toplayer_classes], [x.uri for x in self.o.toplayer_classes])
+		self.assertTrue(stats['requests'] > 0)
+		self.assertEqual(stats['errors'], 0)
+		self.assertTrue(stats['bytes_sent'] > 0)
+
+	def test2_latency_and_limits(self):
+		"""
+		Check the injected latency, the results limit and protocol errors
+		"""
+		printDebug("=================\nTEST 2: local endpoint latency and limits\n=================", "important")
+		q = "SELECT ?c WHERE { ?c a <http://www.w3.org/2002/07/owl#Class> }"
+		with LocalSparqlEndpoint(self.o.rdflib_graph, latency=0.1, max_results=5) as server:
+			sTime = time.time()
+			res = requests.get(server.url, params={'query': q}, headers={'Accept': 'application/sparql-results+json'})
+			self.assertTrue(time.time() - sTime >= 0.1)
+			self.assertEqual(len(res.json()['results']['bindings']), 5)
+			# POST, and CONSTRUCT queries
+			res = requests.post(server.url, data={'query': "CONSTRUCT {?s ?p ?o} WHERE {?s ?p ?o}"})
+			self.assertEqual(res.headers['Content-Type'], 'application/rdf+xml')
+			self.assertEqual(len(rdflib.Graph().parse(data=res.text, format="xml")), 5)
+			# not a valid query
+			res = requests.get(server.url, params={'query': "SELECT WHERE"})
+			self.assertEqual(res.status_code, 400)
+			self.assertEqual(server.stats()['requests'], 3)
+			self.assertEqual(server.stats()['errors'], 1)
+
+		results = benchmark_scan(self.o.rdflib_graph, runs=2)
+		print(results)
+		self.assertEqual(len(results), 2)
+		self.assertEqual(results[0]['classes'], len(self.o.all_classes))
+		self.assertEqual(results[0]['requests'], results[1]['requests'])
+
+	def test3_streaming_results(self):
+		"""
+		Check that results parsed while they are received are the same as those parsed in one go
+		"""
+		printDebug("=================\nTEST 3: streaming query results\n=================", "important")
+		with LocalSparqlEndpoint(self.o.rdflib_graph) as server:
+			s = SparqlEndpoint(server.url, verbose=False)
+			q = "SELECT ?s ?p ?o WHERE { ?s ?p ?o }"
+			expected = s.query(q)["results"]["bindings"]
+			self.assertEqual(len(expected), len(self.o.rdflib_graph))
+			self.assertEqual(list(s.query(q, stream=True)), expected)
+			self.assertEqual(list(s.query(q, "XML", stream=True)), expected)
+			# rdflib terms
+			typed = set([(x['s'], x['p'], x['o']) for x in s.query(q, stream=True, typed=True)])
+			self.assertEqual(len(typed), len(self.o.rdflib_graph))
+			for t in typed:
+				if not isBlankNode(t[0]) and not isBlankNode(t[2]):
+					self.assertTrue(t in self.o.rdflib_graph)
+			uri = self.o.all_classes[0].uri
+			self.assertEqual(len(list(s.allTriplesForURI(uri, stream=True))), len(list(self.o.rdflib_graph.predicate_objects(uri))))
+			# queries in other threads, in other formats, meanwhile
+			server.latency = 0.5
+			results = {}
+			def run(name, format):
+				results[name] = list(s.query(q, format, stream=True))
+			xml = threading.Thread(target=run, args=("XML", "XML"))
+			xml.start()
+			time.sleep(0.2)
+			run("JSON", "JSON")
+			xml.join()
+			self.assertEqual(results["XML"], expected)
+			self.assertEqual(results["JSON"], expected)
+			server.latency = 0
+		# bindings split across reads
+		data = json.dumps({'head': {'vars': ['x']}, 'results': {'bindings': expected[:50]}}).encode("utf-8")
+		self.assertEqual(list(iter_json_bindings(io.BytesIO(data), chunk_size=7)), expected[:50])
+		# XML results already read are dropped from the tree: only those parsed ahead are kept
+		xml = '<sparql xmlns="http://www.w3.org/2005/sparql-results#"><head><variable name="x"/></head><results>%s</results></sparql>'
+		xml = xml % "".join(['<result><binding name="x"><literal>%d</literal></binding></result>' % n for n in range(20000)])
+		from ..extras import sparqlpy
+		iterparse, seen = sparqlpy.ElementTree.iterparse, []
+		def recording_iterparse(*args, **kwargs):
+			for event, elem in iterparse(*args, **kwargs):
+				if elem.tag.endswith("}results") and not seen:
+					seen.append(elem)
+				yield event, elem
+		sparqlpy.ElementTree.iterparse = recording_iterparse
+		try:
+			sizes = []
+			for binding in iter_xml_bindings(io.BytesIO(xml.encode("utf-8"))):
+				sizes.append(len(seen[0]))
+		finally:
+			sparqlpy.ElementTree.iterparse = iterparse
+		self.assertEqual(len(sizes), 20000)
+		self.assertTrue(max(sizes) < 2000)
+		self.assertEqual(sizes[-1], 0)
+
+	def test4_instance_counts(self):
+		"""
+		Check that the instances of all classes are counted with one query
+		"""
+		printDebug("=================\nTEST 4: instance counts from a local endpoint\n=================", "important")
+		with LocalSparqlEndpoint(self.o.rdflib_graph) as server:
+			g = Ontospy(sparql_endpoint=server.url)
+			g.build_classes()
+			server.reset_stats()
+			counts = g.instance_counts()
+			self.assertEqual(counts, self.o.instance_counts())
+			self.assertEqual(sum([c.count() for c in g.all_classes]), sum(counts.values()))
+			self.assertEqual(server.stats()['requests'], 1)
+			self.assertTrue(sum(counts.values()) > 0)
+
+	def test5_iter_instances(self):
+		"""
+		Check that instances are fetched from endpoints a page at a time
+		"""
+		printDebug("=================\nTEST 5: class instances from a local endpoint\n=================", "important")
+		local = [c for c in self.o.all_classes if c.count() > 2][0]
+		with LocalSparqlEndpoint(self.o.rdflib_graph) as server:
+			g = Ontospy(sparql_endpoint=server.url)
+			g.build_classes()
+			c = g.get_class(uri=local.uri)
+			server.reset_stats()
+			uris = list(c.iter_instances(page_size=1))
+			self.assertEqual(uris, [x.uri for x in local.instances])
+			self.assertTrue(server.stats()['requests'] > len(uris))
+			instances = list(c.iter_instances(page_size=2, with_triples=True))
+			self.assertEqual([x.uri for x in instances], uris)
+			for x, y in zip(instances, local.instances):
+				self.assertEqual(len(x.triples), len(y.triples))
+		# IRIs with a '%' (eg percent-encoded) in the paged query text
+		from ..core.sparqlHelper import SparqlHelper
+		graph = rdflib.Graph()
+		odd = rdflib.URIRef("http://example.org/Cats%20and%20Dogs")
+		for n in range(5):
+			graph.add((rdflib.URIRef("http://example.org/pet%d" % n), rdflib.RDF.type, odd))
+		helper = SparqlHelper(graph, sparql_endpoint="http://localhost/sparql", page_size=2, concurrency=1)
+		self.assertEqual(list(helper.iterClassInstances(odd)), sorted(graph.subjects(rdflib.RDF.type, odd)))
+		# local graphs: a lazy scan
+		instances = SparqlHelper(graph).iterClassInstances(odd)
+		self.assertFalse(isinstance(instances, list))
+		self.assertEqual(sorted(instances), sorted(graph.subjects(rdflib.RDF.type, odd)))
+
+	def test6_triples_count(self):
+		"""
+		Check that counting the triples of an endpoint is bounded in time, and done once
+		"""
+		printDebug("=================\nTEST 6: triples count of a local endpoint\n=================", "important")
+		with LocalSparqlEndpoint(self.o.rdflib_graph) as server:
+			g = Ontospy(sparql_endpoint=server.url)
+			self.assertEqual(g.triplesCount(), len(self.o.rdflib_graph))
+			self.assertEqual(g.sparqlHelper.getTriplesCount()[1], "count")
+			server.reset_stats()
+			repr(g), g.stats()
+			self.assertEqual(server.stats()['requests'], 0)
+			# a slow endpoint
+			server.latency = 0.5
+			sTime = time.time()
+			self.assertEqual(g.sparqlHelper.getTriplesCount(timeout=0.1, refresh=True), (None, "unknown"))
+			self.assertTrue(time.time() - sTime < 0.5)
+			self.assertEqual(g.triplesCount(), 0)
+			self.assertEqual(dict(g.stats())["Triples"], "n/a")
+			# the timeout is the one of the request, which is not left running
+			self.assertEqual(getattr(g.rdflib_graph.store, "kwargs", {}).get("timeout"), None)
+		# a VoID description
+		data = """<http://example.org/dataset> <http://rdfs.org/ns/void#triples> 12345 ."""
+		graph = Ontospy(data=data, rdf_format="turtle", build_all=False).rdflib_graph
+		with LocalSparqlEndpoint(graph) as server:
+			g = Ontospy(sparql_endpoint=server.url)
+			self.assertEqual(g.sparqlHelper.getTriplesCount(), (12345, "void"))
+		# a service description: the figure of the default graph
+		description = Ontospy(data="""@prefix sd: <http://www.w3.org/ns/sparql-service-description#> .
+		@prefix void: <http://rdfs.org/ns/void#> .
+		[] a sd:Service ; sd:defaultDataset [ sd:defaultGraph [ void:triples 678 ] ;
+			sd:namedGraph [ sd:graph [ void:triples 999999 ] ] ] .""", rdf_format="turtle", build_all=False).rdflib_graph
+		with LocalSparqlEndpoint(self.o.rdflib_graph, description=description) as server:
+			g = Ontospy(sparql_endpoint=server.url)
+			self.assertEqual(g.sparqlHelper.getTriplesCount(), (678, "sd"))
+
+	def test7_budget(self):
+		"""
+		Check that a scan with a time budget returns a partial model on time, with a report
+		"""
+		printDebug("=================\nTEST 7: endpoint scan with a time budget\n=================", "important")
+		with LocalSparqlEndpoint(self.o.rdflib_graph, latency=0.2) as server:
+			sTime = time.time()
+			g = Ontospy(sparql_endpoint=server.url, budget_seconds=2, concurrency=1, page_size=20)
+			g.build_all()
+			tTime = time.time() - sTime
+			print("Scan: %0.2fs" % tTime, g.completeness)
+			self.assertTrue(tTime < 2.5)
+			self.assertFalse(g.is_complete())
+			self.assertEqual(set(g.completeness), set(["ontologies", "classes", "properties", "skos", "shapes"]))
+			self.assertFalse(g.completeness['shapes']['listed'])
+			uris = set([x.uri for x in self.o.all_classes])
+			self.assertTrue(set([x.uri for x in g.all_classes]) <= uris)
+			# stats don't wait
+			sTime = time.time()
+			g.stats()
+			self.assertTrue(time.time() - sTime < 0.1)
+			# budgeted queries: no thread per query, the connections of the workers are kept
+			helper = Ontospy(sparql_endpoint=server.url, build_all=False, concurrency=2).sparqlHelper
+			helper.setBudget(60)
+			threads = threading.active_count()
+			helper._query("SELECT ?s WHERE { ?s ?p ?o } LIMIT 1")
+			self.assertEqual(threading.active_count(), threads)
+			graphs = helper.executor.map(lambda x: helper._query(x) and helper._graph(),
+				["SELECT ?s WHERE { ?s ?p ?o } LIMIT %d" % n for n in range(1, 9)])
+			self.assertTrue(len(set([id(x) for x in graphs])) <= 2)
+			# ..and the requests are timed out
+			server.latency = 1
+			sTime = time.time()
+			self.assertRaises(QueryTimeout, helper._query, "SELECT ?s WHERE { ?s ?p ?o } LIMIT 2", timeout=0.2)
+			self.assertTrue(time.time() - sTime < 1)
+			server.latency = 0.2
+
+			g = Ontospy(sparql_endpoint=server.url, budget_seconds=600)
+			g.build_all()
+			self.assertTrue(g.is_complete())
+			self.assertEqual(len(g.all_classes), len(self.o.all_classes))
+		# a local graph: the query is dropped when time is up
+		helper = SparqlHelper(self.o.rdflib_graph, native=False)
+		helper.setBudget(0.05)
+		rows = []
+		def slow(q):
+			for row in self.o.rdflib_graph.query(q):
+				rows.append(row)
+				time.sleep(0.01)
+				yield row
+		helper.rdflib_graph = type("Slow", (object,), {"query": lambda _, q: slow(q)})()
+		self.assertRaises(QueryTimeout, helper._query, "SELECT ?s WHERE { ?s ?p ?o }")
+		self.assertTrue(len(rows) < 20)
+		time.sleep(0.1)
+		self.assertTrue(len(rows) < 20)
+		# a local graph: no time left for the listings
+		g = Ontospy(self.f, budget_seconds=0.000001)
+		self.assertFalse(g.is_complete())
+		self.assertFalse(g.completeness['classes']['listed'])
+		self.assertFalse(g.completeness['properties']['listed'])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,137 @@
+# !/usr/bin/env python
+#  -*- coding: UTF-8 -*-
+"""
+Unit test stub for ontosPy
+
+Run like this:
+
+$ python -m ontospy.tests.test_sparql_native
+
+"""
+
+from __future__ import print_function
+
+import unittest, os, sys, time
+from .. import *
+from ..core import *
+from ..core.utils import *
+from ..core.sparqlHelper import SparqlHelper
+
+
+# sanity check
+print("-------------------\nOntospy ",  VERSION, "\n-------------------")
+
+
+def _triples(triples, bnodes=True):
+	"""comparable triples: blank nodes of graphs loaded separately have different ids"""
+	return sorted([tuple([str(x) if bnodes or not isBlankNode(x) else "_" for x in t]) for t in triples])
+
+
+class TestSparqlNative(unittest.TestCase):
+	"""
+	The local graphs scans used by SparqlHelper must give the same results as the sparql queries
+	"""
+
+	dir_path = os.path.dirname(os.path.realpath(__file__))
+	DATA_FOLDER = dir_path + "/rdf/"
+	SOURCES = [DATA_FOLDER + "pizza.ttl", DATA_FOLDER + "foaf.rdf", DATA_FOLDER + "bfo-1.1.owl",
+			   DATA_FOLDER + "npg-article-types-ontology.ttl", dir_path + "/shapes/"]
+
+	def _check(self, native, sparql, method, *args):
+		"""same results, ignoring the type of the rows"""
+		a = [tuple(x) for x in getattr(native, method)(*args)]
+		b = [tuple(x) for x in getattr(sparql, method)(*args)]
+		self.assertEqual(a, b, "%s%s" % (method, str(args)))
+
+	def _checkSet(self, native, sparql, method, *args):
+		"""same results, when the sparql query has no (total) order"""
+		a = [tuple(x) for x in getattr(native, method)(*args)]
+		b = [tuple(x) for x in getattr(sparql, method)(*args)]
+		self.assertEqual(sorted(set(a)), sorted(set(b)), "%s%s" % (method, str(args)))
+
+	def test1_parity(self):
+		"""
+		Check each query method against its sparql version
+		"""
+		printDebug("=================\nTEST 1: native scans vs sparql queries\n=================", "important")
+		for source in self.SOURCES:
+			graph = Ontospy(source, build_all=False).rdflib_graph
+			native, sparql = SparqlHelper(graph), SparqlHelper(graph, native=False)
+			self.assertTrue(native.native)
+			self.assertFalse(sparql.native)
+
+			self._checkSet(native, sparql, "getOntology")
+			self._checkSet(native, sparql, "getShapes")
+			self._check(native, sparql, "getSKOSInstances")
+			for hide in [True, False]:
+				self._checkSet(native, sparql, "getAllClasses", hide)
+				self.assertEqual([x[0] for x in native.getAllClasses(hide)], [x[0] for x in sparql.getAllClasses(hide)])
+			self._checkSet(native, sparql, "getAllProperties")
+
+			classes = [x[0] for x in native.getAllClasses()]
+			for uri in classes:
+				self._check(native, sparql, "getClassDirectSupers", uri)
+				self._checkSet(native, sparql, "getClassDirectSubs", uri)
+				self._check(native, sparql, "getClassInstances", uri)
+				self.assertEqual(native.getClassInstancesCount(uri), sparql.getClassInstancesCount(uri))
+				self.assertEqual(_triples(native.entityTriples(uri)), _triples(sparql.entityTriples(uri)))
+			for uri in set([x[0] for x in native.getAllProperties()]):
+				self._check(native, sparql, "getPropDirectSupers", uri)
+				self.assertEqual(_triples(native.entityTriples(uri)), _triples(sparql.entityTriples(uri)))
+			for (uri,) in native.getSKOSInstances():
+				self._check(native, sparql, "getSKOSDirectSupers", uri)
+				self._checkSet(native, sparql, "getSKOSDirectSubs", uri)
+			print("%s: %d classes OK" % (os.path.basename(source.rstrip("/")), len(classes)))
+
+	def test2_models(self):
+		"""
+		Check that models built with native scans are the same
+		"""
+		printDebug("=================\nTEST 2: models built with native scans\n=================", "important")
+		for source in self.SOURCES:
+			models, times = [], []
+			for native in [True, False]:
+				o = Ontospy(source, build_all=False)
+				o.sparqlHelper.native = native
+				sTime = time.time()
+				o.build_all()
+				times += [time.time() - sTime]
+				models += [o]
+			a, b = models
+			print("%s: %0.2fs native, %0.2fs sparql" % (os.path.basename(source.rstrip("/")), times[0], times[1]))
+			for x, y in [(a.all_ontologies, b.all_ontologies), (a.all_classes, b.all_classes),
+						 (a.all_properties, b.all_properties), (a.all_skos_concepts, b.all_skos_concepts),
+						 (a.all_shapes, b.all_shapes), (a.toplayer_classes, b.toplayer_classes)]:
+				self.assertEqual([e.uri for e in x], [e.uri for e in y])
+				for e1, e2 in zip(x, y):
+					self.assertEqual((e1.rdftype, e1.rdftype_qname), (e2.rdftype, e2.rdftype_qname))
+					self.assertEqual(_triples(e1.triples, False), _triples(e2.triples, False))
+					self.assertEqual([p.uri for p in e1.parents()], [p.uri for p in e2.parents()])
+
+	def test3_class_types(self):
+		"""
+		Check the type kept for classes with several ones, whatever the order of the rows
+		"""
+		printDebug("=================\nTEST 3: types of the classes\n=================", "important")
+		expected = {
+			"http://xmlns.com/foaf/0.1/Person": "owl:Class",
+			"http://xmlns.com/foaf/0.1/Agent": "owl:Class",
+			"http://schema.org/Boolean": "rdfs:Class",
+			"http://schema.org/Text": "rdfs:Class",
+			"http://schema.org/Person": "rdfs:Class",
+		}
+		for source in [self.DATA_FOLDER + "foaf.rdf", self.DATA_FOLDER + "schema/schema.ttl"]:
+			o = Ontospy(source)
+			for c in o.all_classes:
+				types = set(o.rdflib_graph.objects(c.uri, rdflib.RDF.type))
+				if rdflib.OWL.Class in types:
+					self.assertEqual(c.rdftype, rdflib.OWL.Class)
+				elif rdflib.RDFS.Class in types:
+					self.assertEqual(c.rdftype, rdflib.RDFS.Class)
+				self.assertEqual(c.rdftype_qname, uri2niceString(c.rdftype, o.namespaces))
+				if str(c.uri) in expected:
+					self.assertEqual(c.rdftype_qname, expected[str(c.uri)])
+
+
+if __name__ == "__main__":
+	unittest.main()